@@ -1,7 +1,6 @@
 import numpy as np
 import pandas as pd
 import logging
-import spacy
 import os
 import re
 
@@ -9,12 +8,7 @@ import re
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Start the process and log the initialization
-logging.info("Process started, initializing the spaCy model and reading files.")
-
-# Load spaCy's English model
-logging.info("Loading spaCy model...")
-nlp = spacy.load("en_core_web_sm")
-logging.info("SpaCy model loaded successfully.")
+logging.info("Process started, reading files.")
 
 # Step 1: Read CSV Files
 logging.info("Reading CSV files...")
@@ -170,6 +164,12 @@ def extract_location(text):
     
     return ""
 
+# Load spaCy's English model; it is only imported here, once the data has been read and merged
+logging.info("Loading spaCy model...")
+import spacy
+nlp = spacy.load("en_core_web_sm")
+logging.info("SpaCy model loaded successfully.")
+
 logging.info("Correcting 'travelling_from' and 'travelling_to' locations using spaCy...")
 ccasr['travelling_from'] = ccasr['travelling_from'].apply(lambda x: extract_location(x))
 ccasr['travelling_to'] = ccasr['travelling_to'].apply(lambda x: extract_location(x))
@@ -0,0 +1,219 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+from tabulate import tabulate
+
+# Run from the repository root or from benchmarks/, either way the utils package is importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.city_extraction_utils import extract_first_city_pair  # noqa: E402
+from utils.city_gazetteer import load_gazetteer  # noqa: E402
+from utils.call_transcript_info_extractor import extract_get_details_concern, extract_info  # noqa: E402
+from utils.turn_table import extract_get_details_concerns, extract_info_columns  # noqa: E402
+from utils.reason_labeler import categorize_reason, categorize_reasons  # noqa: E402
+from utils.offer_extractor import extract_offers, extract_offer_columns  # noqa: E402
+from utils.clean_primary_call_reason_cell import clean_primary_call_reason  # noqa: E402
+from utils.aht_ast_calculator import calculate_aht_ast  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+GAZETTEER = load_gazetteer()
+DATETIME_FORMAT = '%m/%d/%Y %H:%M'
+
+# Building blocks of the synthetic transcripts, in the "Agent:"/"Customer:" turn format the extractors parse
+CITIES = ['Chicago', 'Los Angeles', 'New York', 'Boston', 'Denver', 'Houston', 'Seattle', 'Miami', 'LA', 'NYC',
+          'San Francisco', 'Atlanta']
+OPENERS = [
+    "I'm calling about my flight from {a} to {b} next week.",
+    "I'm calling because my flight from {a} to {b} was delayed and I missed my connecting flight.",
+    "I'm calling to complain about the service on my trip from {a} to {b}.",
+    "I'm calling to inquire about baggage limits.",
+    "I'm calling regarding a change to my booking from {a} to {b} tomorrow.",
+    "I'm calling because my flight got cancelled.",
+    "Hi, my bag never arrived after flying from {a} to {b}.",
+    "I'm calling cause I wanted to check my flight status.",
+]
+AGENT_LINES = [
+    "I'd be happy to process a full refund for you.",
+    "Unfortunately the ticket is non-refundable.",
+    "I can offer you a $150 travel voucher.",
+    "Let me add 5,000 bonus sky miles to your account.",
+    "We can waive the change fee this time.",
+    "There's a $75 change fee for that.",
+    "The new fare is $120 more.",
+    "Is there anything else I can help with?",
+    "Would you like a reminder before departure?",
+    "I can offer a credit of $1,200 toward a future trip.",
+    "Let me check on that for you.",
+]
+CUSTOMER_LINES = [
+    "Yes, please remind me about the schedule.",
+    "Thanks, that works.",
+    "Can I upgrade to first class?",
+    "What is the baggage weight limit for carry-on?",
+    "I'm worried about weather delays.",
+    "I'd like a refund please.",
+    "Okay.",
+]
+PRIMARY_CALL_REASONS = ['Voluntary Change', 'Voluntary  Cancel', 'Mileage   Plus', 'IRROPS', 'Baggage',
+                        'Post-Flight', 'Check In', 'Products & Services', 'Upgrade', '', None]
+
+
+def synthetic_transcript(rng, turns):
+    a, b = rng.sample(CITIES, 2)
+    lines = ["", "Agent: Thank you for calling United Airlines customer service, how can I help you?", "",
+             "Customer: " + rng.choice(OPENERS).format(a=a, b=b)]
+    for _ in range(turns):
+        lines.append("Agent: " + rng.choice(AGENT_LINES))
+        lines.append("")
+        lines.append("Customer: " + rng.choice(CUSTOMER_LINES))
+    return "\n".join(lines)
+
+
+def synthetic_calls(rows, turns, seed):
+    # The same seed, size and transcript length always produce the same calls
+    rng = random.Random(f"{seed}-{rows}-{turns}")
+    base = datetime(2024, 8, 1)
+    starts = [base + timedelta(minutes=rng.randint(0, 60 * 24 * 30)) for _ in range(rows)]
+    assigned = [start + timedelta(minutes=rng.randint(0, 10)) for start in starts]
+    ends = [start + timedelta(minutes=rng.randint(1, 40)) for start in assigned]
+    calls = pd.DataFrame({
+        'call_transcript': [synthetic_transcript(rng, turns) for _ in range(rows)],
+        'primary_call_reason': [rng.choice(PRIMARY_CALL_REASONS) for _ in range(rows)],
+        'call_start_datetime': [start.strftime(DATETIME_FORMAT) for start in starts],
+        'agent_assigned_datetime': [start.strftime(DATETIME_FORMAT) for start in assigned],
+        'call_end_datetime': [end.strftime(DATETIME_FORMAT) for end in ends],
+    })
+    # The downstream extractors take the output of extract_info, as in main.py
+    extracted = pd.DataFrame([extract_info(transcript) for transcript in calls['call_transcript']])
+    calls = pd.concat([calls, extracted], axis=1)
+    calls['reason_label'] = categorize_reasons(calls['actual_call_reason'])
+    return calls
+
+
+def _row_benchmark(func, *columns):
+    def run(calls):
+        for values in zip(*(calls[column].tolist() for column in columns)):
+            func(*values)
+    return run
+
+
+def _frame_benchmark(func):
+    def run(calls):
+        func(calls.copy())
+    return run
+
+
+# (name, how it is called, function over the prepared calls)
+BENCHMARKS = [
+    ('extract_first_city_pair', 'row', _row_benchmark(extract_first_city_pair, 'call_transcript')),
+    ('gazetteer.extract_route', 'row', _row_benchmark(GAZETTEER.extract_route, 'call_transcript')),
+    ('extract_info', 'row', _row_benchmark(extract_info, 'call_transcript')),
+    ('extract_info_columns', 'column', lambda calls: extract_info_columns(calls['call_transcript'])),
+    ('extract_get_details_concern', 'row', _row_benchmark(extract_get_details_concern, 'call_transcript')),
+    ('extract_get_details_concerns', 'column', lambda calls: extract_get_details_concerns(calls['call_transcript'])),
+    ('categorize_reason', 'row', _row_benchmark(categorize_reason, 'actual_call_reason')),
+    ('categorize_reasons', 'column', lambda calls: categorize_reasons(calls['actual_call_reason'])),
+    ('extract_offers', 'row', _row_benchmark(extract_offers, 'agent_solutions', 'reason_label')),
+    ('extract_offer_columns', 'column',
+     lambda calls: extract_offer_columns(calls['agent_solutions'].to_numpy(), calls['reason_label'].to_numpy())),
+    ('clean_primary_call_reason', 'frame', _frame_benchmark(clean_primary_call_reason)),
+    ('calculate_aht_ast', 'frame', _frame_benchmark(calculate_aht_ast)),
+]
+
+
+def run_benchmarks(sizes, turns_list, repeat, seed, selected=None):
+    results = []
+    for turns in turns_list:
+        for rows in sizes:
+            calls = synthetic_calls(rows, turns, seed)
+            chars = int(calls['call_transcript'].str.len().mean())
+            for name, kind, run in BENCHMARKS:
+                if selected and name not in selected:
+                    continue
+                # Best of several runs, the least disturbed by other processes
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    run(calls)
+                    timings.append(time.perf_counter() - start)
+                seconds = min(timings)
+                results.append({
+                    'function': name, 'kind': kind, 'rows': rows, 'turns': turns, 'transcript_chars': chars,
+                    'seconds': seconds, 'us_per_row': seconds / rows * 1e6, 'rows_per_sec': rows / seconds,
+                })
+                print(f"{name:<26} rows={rows:<7} turns={turns:<3} {results[-1]['us_per_row']:10.2f} us/row")
+    return results
+
+
+def case_key(result):
+    return result['function'], result['rows'], result['turns']
+
+
+def compare(results, baseline_file, tolerance):
+    # Prints the change against an earlier results file and returns the cases that got slower than tolerance
+    with open(baseline_file) as f:
+        baseline = {case_key(result): result for result in json.load(f)['results']}
+
+    table, regressions = [], []
+    for result in results:
+        before = baseline.get(case_key(result))
+        if before is None:
+            continue
+        ratio = result['seconds'] / before['seconds']
+        table.append([*case_key(result), round(before['us_per_row'], 2), round(result['us_per_row'], 2), round(ratio, 2)])
+        if ratio > tolerance:
+            regressions.append(case_key(result))
+    print(tabulate(table, headers=['function', 'rows', 'turns', 'before us/row', 'now us/row', 'ratio'],
+                   tablefmt='fancy_grid'))
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the utils extraction functions on synthetic calls")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000], help="Number of calls per run")
+    parser.add_argument('--turns', type=int, nargs='+', default=[3, 10, 30],
+                        help="Agent/customer exchanges per transcript after the opening")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per case, the fastest one is reported")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--only', nargs='+', choices=[name for name, _, _ in BENCHMARKS],
+                        help="Only benchmark these functions")
+    parser.add_argument('--output', help="Results file (default: benchmarks/results/extractors_<timestamp>.json)")
+    parser.add_argument('--compare', help="Earlier results file to compare against")
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help="With --compare, exit with status 1 when a case is this many times slower")
+    return parser.parse_args()
+
+
+def main(args):
+    results = run_benchmarks(args.sizes, args.turns, args.repeat, args.seed, args.only)
+
+    output_file = args.output or os.path.join(RESULTS_DIR, f"extractors_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    with open(output_file, 'w') as f:
+        json.dump({
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'machine': platform.platform(),
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'results': results,
+        }, f, indent=2)
+    print(f"\nResults saved to: {output_file}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} cases are more than {args.tolerance}x slower: {regressions}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(parse_args())
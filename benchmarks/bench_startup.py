@@ -0,0 +1,115 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from tabulate import tabulate
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# Packages whose import time is reported separately, the ones worth keeping off the quick paths
+HEAVY_MODULES = ['spacy', 'pandas', 'pyarrow', 'numpy']
+# None of the cases resolves locations, so loading spaCy in any of them is a regression by itself
+NEVER_IMPORTED = ['spacy']
+
+# (name, script and arguments, wall-time budget in seconds). {agent_id} is filled in from --agent-id.
+# The long-running commands may load pandas up front; the reporting scripts only once they have their arguments.
+CASES = [
+    ('main --help', ['main.py', '--help'], 1.0),
+    ('query_server --help', ['query_server.py', '--help'], 1.0),
+    ('get_agent_metrics --help', ['get_agent_metrics.py', '--help'], 0.25),
+    ('get_details_metrics --help', ['get_details_metrics.py', '--help'], 0.25),
+    ('get_agent_metrics --agent-id', ['get_agent_metrics.py', '--agent-id', '{agent_id}'], 0.75),
+]
+
+
+def run_case(argv, cwd):
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, *argv], cwd=cwd, capture_output=True, text=True,
+                               stdin=subprocess.DEVNULL)
+    return time.perf_counter() - start, completed.returncode
+
+
+def import_times(argv, cwd):
+    # Cumulative import time in seconds of each heavy package the command loads, from python -X importtime
+    completed = subprocess.run([sys.executable, '-X', 'importtime', *argv], cwd=cwd, capture_output=True, text=True,
+                               stdin=subprocess.DEVNULL)
+    times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or line.count('|') != 2:
+            continue
+        _, cumulative, name = line.split('|')
+        if name.strip() in HEAVY_MODULES and cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def run_benchmarks(data_root, agent_id, repeat, selected=None):
+    results = []
+    for name, argv, budget in CASES:
+        if selected and name not in selected:
+            continue
+        argv = [os.path.join(REPO_ROOT, argv[0]), *(arg.format(agent_id=agent_id) for arg in argv[1:])]
+        # Best of several runs; the first one also warms the OS file cache
+        runs = [run_case(argv, data_root) for _ in range(repeat)]
+        seconds = min(wall for wall, _ in runs)
+        returncode = runs[-1][1]
+        results.append({
+            'case': name, 'seconds': seconds, 'budget_seconds': budget, 'returncode': returncode,
+            'imports': import_times(argv, data_root),
+        })
+        forbidden = [module for module in NEVER_IMPORTED if module in results[-1]['imports']]
+        results[-1]['over_budget'] = seconds > budget or bool(forbidden)
+        status = 'OVER BUDGET' if results[-1]['over_budget'] else 'ok'
+        print(f"{name:<30} {seconds:6.3f}s (budget {budget:.2f}s) {status}"
+              f"{'' if returncode == 0 else f', exit status {returncode}'}")
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure the start-up time of the command line entry points "
+                                                 "against their time budgets")
+    parser.add_argument('--data-root', default=REPO_ROOT,
+                        help="Directory with data/ and output/ to run the commands in (default: the repository)")
+    parser.add_argument('--agent-id', default='1', help="Agent for the single-agent query")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per case, the fastest one is reported")
+    parser.add_argument('--only', nargs='+', choices=[name for name, _, _ in CASES], help="Only run these cases")
+    parser.add_argument('--output', help="Results file (default: benchmarks/results/startup_<timestamp>.json)")
+    return parser.parse_args()
+
+
+def main(args):
+    results = run_benchmarks(args.data_root, args.agent_id, args.repeat, args.only)
+    print(tabulate(
+        [[result['case'], round(result['seconds'], 3), result['budget_seconds'],
+          *(round(result['imports'][module], 3) if module in result['imports'] else '-' for module in HEAVY_MODULES)]
+         for result in results],
+        headers=['case', 'seconds', 'budget', *(f"{module} import s" for module in HEAVY_MODULES)],
+        tablefmt='fancy_grid'
+    ))
+
+    output_file = args.output or os.path.join(RESULTS_DIR, f"startup_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    with open(output_file, 'w') as f:
+        json.dump({
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.platform(),
+            'repeat': args.repeat,
+            'results': results,
+        }, f, indent=2)
+    print(f"\nResults saved to: {output_file}")
+
+    over_budget = [result['case'] for result in results if result['over_budget']]
+    if over_budget:
+        print(f"\n{len(over_budget)} cases are over their start-up budget or import {NEVER_IMPORTED}: {over_budget}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -1,62 +1,92 @@
-import pandas as pd
+import argparse
+import hashlib
 import os
-from datetime import datetime
 from tabulate import tabulate
 
-# Load the dataset
-df = pd.read_csv('output/processed_dataset_with_ext.csv')
 
-# Ensure agent_id_x is treated as string
-df['agent_id_x'] = df['agent_id_x'].astype(str)
+def report_file_for(fingerprint, date_from=None, date_to=None):
+    # Reports are named after the dataset and date window they summarize, so an unchanged dataset is never
+    # reported twice
+    key = fingerprint if not (date_from or date_to) else f"{fingerprint}:{date_from or ''}:{date_to or ''}"
+    return f"output/agent_report_{hashlib.sha1(key.encode()).hexdigest()[:12]}.csv"
+
 
 # Function to get the summary report
-def get_summary(agent_id=None):
-    # Filter data if agent_id is provided
+def get_summary(agent_id=None, date_from=None, date_to=None):
+    # Imported here so --help and the agent_id prompt come up before pandas is loaded
+    from utils.agent_rollup import agent_summary, current_rollup
+
     if agent_id:
-        agent_data = df[df['agent_id_x'] == str(agent_id)]
-        if agent_data.empty:
-            print(f"No data found for agent_id: {agent_id}")
-            return
+        # A single agent is looked up in the indexed call store instead of folding the rollup of every agent
+        from utils.call_store import connect, current_call_store, store_rollup
+
+        connection = connect(current_call_store(), read_only=True)
+        try:
+            rollup = store_rollup(connection, agent_id, date_from, date_to)
+        finally:
+            connection.close()
     else:
-        agent_data = df
-
-    # Group data by agent_id_x and reason_label, with aggregations
-    summary = agent_data.groupby(['agent_id_x', 'reason_label']).agg(
-        num_calls=('reason_label', 'size'),
-        avg_aht=('aht', 'mean'),
-        avg_ast=('ast', 'mean'),
-        avg_sentiment=('average_sentiment', 'mean'),
-        avg_silence=('silence_percent_average', 'mean'),
-        refund_offers=('refund_offer', lambda x: (x == 'Refund offered').sum()),
-        voucher_offers=('voucher_offer', lambda x: (x == 'Voucher offered').sum()),
-        skymiles_offers=('sky_miles_offer', lambda x: (x == 'SkyMiles offered').sum())
-    ).reset_index()
-
-    # Round for better readability
-    summary['avg_aht'] = summary['avg_aht'].round(2)
-    summary['avg_ast'] = summary['avg_ast'].round(2)
-    summary['avg_sentiment'] = summary['avg_sentiment'].round(2)
-    summary['avg_silence'] = summary['avg_silence'].round(2)
+        rollup, fingerprint = current_rollup(date_from=date_from, date_to=date_to)
+    summary = agent_summary(rollup, agent_id, date_from, date_to)
 
     if agent_id:
+        if summary.empty:
+            print(f"No data found for agent_id: {agent_id}")
+            return
         # Print the summary for the agent to the console in a nice table format
         print(f"\nSummary for agent_id: {agent_id}")
         print(tabulate(summary, headers='keys', tablefmt='fancy_grid', showindex=False))
+        # Means hide the long calls, so the percentiles of the agent's calls follow
+        print_percentiles('agent', agent_id, date_from, date_to)
     else:
         # Generate a CSV report for all agents
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_file = f'output/agent_report_{timestamp}.csv'
+        output_file = report_file_for(fingerprint, date_from, date_to)
+        if os.path.exists(output_file):
+            print(f"\nThe dataset has not changed since the last report: {output_file}")
+            return
         os.makedirs('output', exist_ok=True)
         summary.to_csv(output_file, index=False)
 
         print(f"\nCSV report generated and saved to: {output_file}")
 
 
-# Ask for agent_id or generate a full report
-agent_id_input = input("Enter the agent_id (or press Enter to generate a full report for all agents): ")
+def print_percentiles(by, key=None, date_from=None, date_to=None):
+    # p50/p90/p99 AHT and AST and distinct customers per agent, reason or route, merged from the stored sketches
+    from utils.metric_sketches import current_sketches, sketch_summary
+
+    sketches = current_sketches(date_from=date_from, date_to=date_to)
+    percentiles = sketch_summary(sketches, by, key, date_from, date_to)
+    print(f"\nAHT/AST percentiles (mins) and distinct customers per {by}")
+    print(tabulate(percentiles, headers='keys', tablefmt='fancy_grid', showindex=False))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Agent performance report from the processed dataset")
+    parser.add_argument('--agent-id', help="Print the summary of a single agent")
+    parser.add_argument('--all', action='store_true', help="Write the CSV report for all agents")
+    parser.add_argument('--from', dest='date_from', help="First call date to report, YYYY-MM-DD")
+    parser.add_argument('--to', dest='date_to', help="Last call date to report, YYYY-MM-DD")
+    parser.add_argument('--percentiles', choices=['agent', 'reason', 'route'],
+                        help="Print the p50/p90/p99 AHT and AST and the distinct customers of every agent, reason "
+                             "or route instead")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.percentiles:
+        # --agent-id narrows the per-agent percentiles down to that agent
+        agent_key = args.agent_id if args.percentiles == 'agent' else None
+        print_percentiles(args.percentiles, agent_key, args.date_from, args.date_to)
+    else:
+        if args.agent_id or args.all:
+            agent_id_input = args.agent_id
+        else:
+            # Ask for agent_id or generate a full report
+            agent_id_input = input("Enter the agent_id (or press Enter to generate a full report for all agents): ")
 
-# Generate the report based on user input
-if agent_id_input:
-    get_summary(agent_id_input)
-else:
-    get_summary()
+        # Generate the report based on user input
+        if agent_id_input:
+            get_summary(agent_id_input, args.date_from, args.date_to)
+        else:
+            get_summary(date_from=args.date_from, date_to=args.date_to)
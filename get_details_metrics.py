@@ -1,13 +1,6 @@
-import pandas as pd
-import re
+import argparse
 from tabulate import tabulate
 
-# Load data from CSV
-df = pd.read_csv('output/processed_dataset_with_ext.csv')
-
-# Check the content of 'reason_label' column to confirm available categories
-print("Unique values in 'reason_label':", df['reason_label'].unique())
-
 # Define the keywords for each metric
 metrics = {
     'Wants Reminder': ['remind', 'reminder', 'notify', 'notification'],
@@ -25,75 +18,47 @@ config = {
     'travelling_to': 'Los Angeles'  # Specify the travelling_to value or leave empty for no filter
 }
 
-# Sample: Extract 'Get Details' customer dialogues
-def extract_get_details_concern(call_transcript):
-    lines = call_transcript.split('\n')
-    customer_dialogues = []
-    
-    # Iterate over the lines to find "Agent:" with a question mark and capture following "Customer:" lines
-    for i, line in enumerate(lines):
-        if re.search(r'Agent:.*\?', line):
-            # Look ahead in the next few lines for the "Customer:" response(s)
-            for j in range(i + 1, min(i + 4, len(lines))):  # Check up to 3 lines after the agent's question
-                if "Customer:" in lines[j]:
-                    customer_dialogue = lines[j].split("Customer:")[-1].strip()
-                    customer_dialogues.append(customer_dialogue)  # Append the customer response
 
-    # Combine all customer responses into one string, if multiple responses are found
-    combined_dialogue = ' '.join(customer_dialogues) if customer_dialogues else None
-    return combined_dialogue
+def parse_args():
+    parser = argparse.ArgumentParser(description="Concern breakdown of the customer answers in 'Get Details' calls")
+    parser.add_argument('--travelling-from', default=config['travelling_from'],
+                        help="Only count calls from this city (default: %(default)s)")
+    parser.add_argument('--travelling-to', default=config['travelling_to'],
+                        help="Only count calls to this city (default: %(default)s)")
+    parser.add_argument('--any-route', action='store_true', help="Count calls on every route")
+    parser.add_argument('--all-routes', action='store_true',
+                        help="Print the number of calls per route and concern for every route at once")
+    parser.add_argument('--reason', default='Get Details', help="reason_label of the calls to count (default: %(default)s)")
+    parser.add_argument('--from', dest='date_from', help="First call date to count, YYYY-MM-DD")
+    parser.add_argument('--to', dest='date_to', help="Last call date to count, YYYY-MM-DD")
+    return parser.parse_args()
 
-# Analyze each dialogue for the defined metrics
-def analyze_concerns(dialogue):
-    analysis = {}
-    if dialogue:
-        for metric, keywords in metrics.items():
-            found = any(re.search(r'\b' + keyword + r'\b', dialogue, re.IGNORECASE) for keyword in keywords)
-            analysis[metric] = found
-    else:
-        for metric in metrics.keys():
-            analysis[metric] = False
-    return analysis
 
-# Initialize a dictionary to count occurrences and accumulate aht/ast for each concern
-concern_stats = {metric: {'count': 0, 'aht_sum': 0, 'ast_sum': 0} for metric in metrics.keys()}
+def main(args):
+    # Imported here so --help and argument errors return before pandas is loaded
+    from utils.concern_index import concern_breakdown, current_concern_index, route_concern_matrix
 
-# Process each entry where the 'reason_label' is 'Get Details'
-for index, row in df[df['reason_label'] == 'Get Details'].iterrows():
-    
-    # Apply travel filter if configured
-    if config['filter_by_travel']:
-        if not (
-            (config['travelling_from'] == row['travelling_from'] if config['travelling_from'] else True) and
-            (config['travelling_to'] == row['travelling_to'] if config['travelling_to'] else True)
-        ):
-            continue  # Skip this row if it doesn't match the travelling_from/to filter
-    
-    call_transcript = row['call_transcript']
-    customer_dialogue = extract_get_details_concern(call_transcript)
-    
-    # Analyze the extracted dialogue and update the concern stats
-    if customer_dialogue:
-        concerns_analysis = analyze_concerns(customer_dialogue)
-        for metric, result in concerns_analysis.items():
-            if result:
-                concern_stats[metric]['count'] += 1
-                concern_stats[metric]['aht_sum'] += row['aht']  # Sum up aht
-                concern_stats[metric]['ast_sum'] += row['ast']  # Sum up ast
+    # Answered from the concern index, which is only rebuilt when the processed dataset changed. A date-partitioned
+    # dataset that changed since is only read for the dates asked for.
+    index = current_concern_index(date_from=args.date_from, date_to=args.date_to)
 
-# Prepare the data for tabulation (include average aht and ast calculations)
-concern_data = []
-for metric, stats in concern_stats.items():
-    if stats['count'] > 0:
-        avg_aht = stats['aht_sum'] / stats['count']
-        avg_ast = stats['ast_sum'] / stats['count']
-    else:
-        avg_aht = avg_ast = 0  # Avoid division by zero
+    # Check the content of 'reason_label' column to confirm available categories
+    print("Unique values in 'reason_label':", index.docs['reason_label'].unique())
+
+    filters = {'reason_label': args.reason, 'date_from': args.date_from, 'date_to': args.date_to}
+    if args.all_routes:
+        matrix = route_concern_matrix(index, metrics, **filters)
+        print(tabulate(matrix, headers='keys', tablefmt='fancy_grid', showindex=False))
+        return
+
+    # Apply travel filter if configured
+    if config['filter_by_travel'] and not args.any_route:
+        filters.update(travelling_from=args.travelling_from, travelling_to=args.travelling_to)
+    concern_data_df = concern_breakdown(index, metrics, **filters)
 
-    concern_data.append([metric, stats['count'], round(avg_aht, 2), round(avg_ast, 2)])
+    # Display the table beautifully on the console using tabulate
+    print(tabulate(concern_data_df, headers='keys', tablefmt='fancy_grid', showindex=False))
 
-# Convert the concern data to a DataFrame for better visualization
-concern_data_df = pd.DataFrame(concern_data, columns=['Concern', 'Frequency', 'Average AHT (mins)', 'Average AST (mins)'])
 
-# Display the table beautifully on the console using tabulate
-print(tabulate(concern_data_df, headers='keys', tablefmt='fancy_grid', showindex=False))
+if __name__ == '__main__':
+    main(parse_args())
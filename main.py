@@ -1,72 +1,457 @@
+import argparse
 import logging
-import spacy
+import os
+import signal
+import time
+import numpy as np
 import pandas as pd
 from utils.logger import setup_logging
-from utils.data_loader import load_csv_data
+from utils.data_loader import (
+    DATA_DIR, LOOKUP_TABLES, iter_call_chunks, load_csv_data, load_lookup_tables, read_inputs, validate_inputs
+)
 from utils.dataframe_merger import merge_data
 from utils.clean_primary_call_reason_cell import clean_primary_call_reason
-from utils.city_extraction_utils import extract_first_city_pair, extract_location
-from utils.call_transcript_info_extractor import extract_info
-from utils.reason_labeler import categorize_reason
+from utils.city_extraction_utils import (
+    LazyModel, extract_first_city_pair, load_location_cache, resolve_locations, save_location_cache
+)
+from utils.city_gazetteer import GAZETTEER_FILE, load_gazetteer
+from utils.turn_table import extract_info_columns
+from utils.reason_labeler import categorize_reasons
 from utils.aht_ast_calculator import calculate_aht_ast
-from utils.offer_extractor import extract_offers
+from utils.offer_extractor import OFFER_COLUMNS, extract_offer_columns
+from utils.parallel_executor import map_chunks, map_rows
+from utils.incremental import apply_delta, filter_unprocessed, ledger_file_for, load_ledger, update_ledger
+from utils.near_duplicates import DUPLICATE_COLUMN, duplicate_of, expand, find_duplicates, transcript_hashes
+from utils.micro_batch import WATCH_METRICS_FILE, DropDirectory, append_metrics, batch_metrics
+from utils.output_store import (
+    output_columns, output_file_for, output_fingerprint, read_output, remove_output, write_frames
+)
+from utils.transcript_store import STORED_TEXT_COLUMNS, TranscriptWriter
+from utils.agent_rollup import build_rollup, merge_rollups, update_rollup
+from utils.metric_sketches import build_sketches, merge_sketches, update_sketches
+from utils.call_store import store_columns, update_call_store
+from utils.run_telemetry import RunTelemetry
+from utils.stage_graph import CHECKPOINT_DIR, CheckpointStore, code_digest, file_digest, files_identity, run_stage
+from utils.dtype_schema import CSV_SCHEMAS, compact_frame, log_memory_usage
 
-# Step 1: Setup Logging
-setup_logging()
+SPACY_MODEL = "en_core_web_sm"
+ROUTE_COLUMNS = ['travelling_from', 'travelling_to']
+INFO_COLUMNS = ['actual_call_reason', 'agent_solutions', 'customer_accepted']
+TIMESTAMP_COLUMNS = CSV_SCHEMAS['calls']['parse_dates']
+# The code behind steps 2-3; the merged frame checkpoint is also keyed by the input files
+MERGE_MODULES = ['utils.data_loader', 'utils.dtype_schema', 'utils.dataframe_merger']
 
-# Step 2: Load Data
-calls, customers, reasons, sentiments = load_csv_data()
 
-# Step 3: Merge Dataframes
-ccasr = merge_data(calls, sentiments, reasons, customers)
+def parse_args():
+    parser = argparse.ArgumentParser(description="Process the raw call data into output/processed_dataset_with_ext")
+    parser.add_argument('--data-dir', default=DATA_DIR,
+                        help="Directory with calls, customers, reason and sentiment as .csv, .csv.gz or .csv.zst "
+                             "(default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of worker processes for the transcript extraction stages (default: 1, serial)")
+    parser.add_argument('--resolver', choices=['gazetteer', 'spacy'], default='gazetteer',
+                        help="gazetteer matches the cities after 'from'/'to' against a table of city names, aliases "
+                             "and airport codes, misspellings included; spacy takes the words after 'from'/'to' "
+                             "and keeps the place names spaCy's NER finds in them")
+    parser.add_argument('--gazetteer', default=GAZETTEER_FILE, help="city,alias CSV used by --resolver gazetteer")
+    parser.add_argument('--location-cache', default='output/location_cache.json',
+                        help="JSON file that keeps spaCy location results between runs (--resolver spacy)")
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help="Stream the calls file in chunks of this many calls so memory depends on the chunk "
+                             "size instead of the dataset size (default: load everything at once)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only process calls that are new or changed since the last run (tracked per output "
+                             "format in output/processed_ledger*.csv) and merge them into the existing output")
+    parser.add_argument('--output-format', choices=['csv', 'parquet', 'partitioned'], default='csv',
+                        help="csv writes one wide CSV; parquet writes a zstd-compressed, typed columnar file with "
+                             "dictionary-encoded labels that the reporting scripts can read column by column; "
+                             "partitioned writes the same Parquet files split by call_date, with a manifest of "
+                             "row counts and min/max per date, so date-bounded reports only read their dates")
+    parser.add_argument('--transcript-store', action='store_true',
+                        help="Keep call_transcript and agent_solutions out of the processed dataset and store the "
+                             "transcripts once in output/transcripts/ (an append-only blob with an index by "
+                             "call_id) that the reporting scripts read only when they need the text")
+    parser.add_argument('--near-duplicates', type=float, metavar='THRESHOLD', default=None,
+                        help="Also treat calls whose transcripts are near-identical (estimated Jaccard similarity of "
+                             "their 5-word shingles of at least THRESHOLD, e.g. 0.9) as duplicates and reuse the "
+                             "extracted fields of the first one; by default only identical transcripts are")
+    parser.add_argument('--checkpoint', action='store_true',
+                        help="Keep the merged data and the columns every extraction step adds in --checkpoint-dir, "
+                             "keyed by a hash of the step's input and code, so the next run only recomputes the "
+                             "steps whose input files, input columns or rules changed")
+    parser.add_argument('--checkpoint-dir', default=CHECKPOINT_DIR,
+                        help="Directory of the --checkpoint files; only those of the last run are kept "
+                             "(default: %(default)s)")
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help="DEBUG adds sample rows and null counts after each step, which costs time on large "
+                             "datasets (default: INFO)")
+    parser.add_argument('--run-report', default='output/run_report.json',
+                        help="JSON file with the wall time, CPU time, rows and memory of every stage of the run")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="Also record the peak Python allocations per stage with tracemalloc (slows the run down)")
+    parser.add_argument('--watch', metavar='DIR',
+                        help="Run as a daemon that picks up calls*, sentiment* and reason* files dropped into DIR "
+                             "and merges their calls into the output in micro-batches, as --incremental runs "
+                             "(customers are read from --data-dir)")
+    parser.add_argument('--poll-interval', type=float, default=2.0,
+                        help="Seconds between two scans of the --watch directory (default: %(default)s)")
+    parser.add_argument('--max-wait', type=float, default=300.0,
+                        help="Seconds a dropped call waits for its sentiment and reason rows before it is processed "
+                             "without them (default: %(default)s)")
+    parser.add_argument('--watch-metrics', default=WATCH_METRICS_FILE,
+                        help="JSON lines file with the latency and backlog after every micro-batch "
+                             "(default: %(default)s)")
+    return parser.parse_args()
 
-# Step 4: Clean 'primary_call_reason'
-ccasr = clean_primary_call_reason(ccasr)
 
-# Step 5: Extract 'travelling_from' and 'travelling_to' from 'call_transcript'
-ccasr[['travelling_from', 'travelling_to']] = ccasr['call_transcript'].apply(
-    lambda x: pd.Series(extract_first_city_pair(x))
-)
-logging.debug(f"Sample of extracted locations: \n{ccasr[['travelling_from', 'travelling_to']].head()}")
+def clean_reasons(ccasr, context):
+    return clean_primary_call_reason(ccasr[['primary_call_reason']].copy())
 
-# Load spaCy's English model
-logging.info("Loading spaCy model...")
-nlp = spacy.load("en_core_web_sm")
-logging.info("SpaCy model loaded successfully.")
 
+def resolve_routes(ccasr, context):
+    args, locations = context['args'], context['locations']
+    transcripts = ccasr['call_transcript'].iloc[context['distinct_rows']]
+    if args.resolver == 'gazetteer':
+        # Match the cities after 'from'/'to' against the gazetteer, no model involved
+        logging.info("Resolving 'travelling_from' and 'travelling_to' with the city gazetteer...")
+        route_chunks = map_chunks(locations['gazetteer'].extract_routes, transcripts, workers=args.workers)
+        routes = pd.concat([pd.DataFrame(chunk) for chunk in route_chunks], ignore_index=True)
+    else:
+        # Extract the words after 'from'/'to', then correct them by matching them with gpe/ner
+        city_pairs = map_rows(extract_first_city_pair, transcripts, workers=args.workers)
+        routes = pd.DataFrame(city_pairs, columns=ROUTE_COLUMNS)
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(f"Sample of extracted locations: \n{routes.head()}")
+        logging.info("Correcting 'travelling_from' and 'travelling_to' locations using spaCy...")
+        for column in ROUTE_COLUMNS:
+            routes[column] = resolve_locations(routes[column], locations['nlp'], locations['cache'])
+    return expand(routes, context['representatives'], ccasr.index)
 
-# Step 6: Correct the extracted location by matching them with gpe/ner
-logging.info("Correcting 'travelling_from' and 'travelling_to' locations using spaCy...")
-ccasr['travelling_from'] = ccasr['travelling_from'].apply(lambda x: extract_location(x, nlp))
-ccasr['travelling_to'] = ccasr['travelling_to'].apply(lambda x: extract_location(x, nlp))
-logging.debug(f"Corrected locations: \n{ccasr[['travelling_from', 'travelling_to']].head()}")
 
+def extract_transcript_info(ccasr, context):
+    logging.info("Extracting call reason, solutions, and customer responses from transcripts...")
+    # Each transcript is split into a turn table once and the fields are read off it column-wise
+    transcripts = ccasr['call_transcript'].iloc[context['distinct_rows']]
+    info_chunks = map_chunks(extract_info_columns, transcripts, workers=context['args'].workers)
+    extracted_df = pd.concat([pd.DataFrame(chunk) for chunk in info_chunks], ignore_index=True)
+    return expand(extracted_df, context['representatives'], ccasr.index)
 
-# Step 7: Extract call reason, solutions, and customer responses from transcripts
-logging.info("Extracting call reason, solutions, and customer responses from transcripts...")
-df_extracted = ccasr['call_transcript'].apply(extract_info)
-extracted_df = pd.DataFrame(list(df_extracted))
-logging.debug(f"Extracted call reasons and solutions: \n{extracted_df.head()}")
-ccasr = pd.concat([ccasr, extracted_df], axis=1)
 
-# Step 8: Categorize call reason
-logging.info("Categorizing based on 'actual_call_reason'...")
-ccasr['reason_label'] = ccasr['actual_call_reason'].apply(categorize_reason)
+def label_reasons(ccasr, context):
+    logging.info("Categorizing based on 'actual_call_reason'...")
+    return pd.DataFrame({'reason_label': categorize_reasons(ccasr['actual_call_reason'])})
 
-# Step 9: Calculate AHT, AST, and extract Call Date
-logging.info("Calculating AHT, AST, and extracting 'call_date'...")
-ccasr = calculate_aht_ast(ccasr)
 
-# Step 10: Extract structured offers based on agent solutions for different categories
-logging.info("Extracting structured offers from 'agent_solutions' for irregular operations...")
-offer_columns = ccasr.apply(
-    lambda row: pd.Series(extract_offers(row['agent_solutions'], row['reason_label'])),
-    axis=1
-)
-ccasr = pd.concat([ccasr, offer_columns], axis=1)
+def aht_ast(ccasr, context):
+    logging.info("Calculating AHT, AST, and extracting 'call_date'...")
+    return calculate_aht_ast(ccasr[TIMESTAMP_COLUMNS].copy())
+
+
+def extract_offers(ccasr, context):
+    # Structured offers based on agent solutions for different categories
+    logging.info("Extracting structured offers from 'agent_solutions' for irregular operations...")
+    distinct_rows = context['distinct_rows']
+    offer_chunks = map_chunks(
+        extract_offer_columns, ccasr['agent_solutions'].iloc[distinct_rows],
+        ccasr['reason_label'].iloc[distinct_rows], workers=context['args'].workers
+    )
+    offer_columns = pd.concat([pd.DataFrame(chunk) for chunk in offer_chunks], ignore_index=True)
+    return expand(offer_columns, context['representatives'], ccasr.index)
+
+
+def route_settings(args):
+    if args.resolver == 'gazetteer':
+        return [args.resolver, file_digest(args.gazetteer)]
+    return [args.resolver, SPACY_MODEL]
+
+
+# Steps 4-10 as a graph over the columns of the merged frame, in the order they run: every stage reads its
+# inputs and adds or replaces its outputs. With --checkpoint the outputs are stored under a key made of the
+# input columns, the stage code, the source of its modules and its settings, so a rerun only recomputes the
+# stages whose inputs or rules changed.
+EXTRACTION_STAGES = [
+    {'name': '4 clean primary_call_reason', 'run': clean_reasons, 'inputs': ['primary_call_reason'],
+     'outputs': ['primary_call_reason'], 'modules': ['utils.clean_primary_call_reason_cell']},
+    {'name': '5 resolve routes', 'run': resolve_routes, 'inputs': ['call_transcript', DUPLICATE_COLUMN],
+     'outputs': ROUTE_COLUMNS, 'modules': ['utils.city_gazetteer', 'utils.city_extraction_utils'],
+     'params': route_settings},
+    {'name': '7 extract transcript info', 'run': extract_transcript_info,
+     'inputs': ['call_transcript', DUPLICATE_COLUMN], 'outputs': INFO_COLUMNS, 'modules': ['utils.turn_table']},
+    {'name': '8 categorize reasons', 'run': label_reasons, 'inputs': ['actual_call_reason'],
+     'outputs': ['reason_label'], 'modules': ['utils.reason_labeler']},
+    {'name': '9 calculate aht/ast', 'run': aht_ast, 'inputs': TIMESTAMP_COLUMNS, 'outputs': ['aht', 'ast', 'call_date'],
+     'modules': ['utils.aht_ast_calculator']},
+    {'name': '10 extract offers', 'run': extract_offers, 'inputs': ['agent_solutions', 'reason_label'],
+     'outputs': OFFER_COLUMNS, 'modules': ['utils.offer_extractor']},
+]
+
+
+def process_calls(ccasr, locations, args, telemetry, checkpoints=None, earlier=None):
+    # Steps 4-10 for one merged frame: the whole dataset in batch mode, a single chunk in streaming mode.
+    # earlier: list of frames with the call_id and transcript_hash of the calls processed before this one (the
+    # ledger, earlier chunks), which this frame's calls are added to
+    log_memory_usage(ccasr, "merging")
+    rows = len(ccasr)
+
+    # Calls with the same transcript (re-exports of one call, or with --near-duplicates near-identical
+    # re-recordings) are flagged with the call_id of the first one, and steps 5-10 only extract the text of
+    # that first call; the others get its results. A transcript an earlier chunk or run already had is flagged
+    # with that call, but extracted again.
+    with telemetry.stage('4 find duplicate transcripts', rows) as stage:
+        representatives, exact, near = find_duplicates(ccasr['call_transcript'], args.near_duplicates)
+        if earlier is None:
+            ccasr[DUPLICATE_COLUMN] = duplicate_of(ccasr['call_id'], representatives)
+        else:
+            hashes = transcript_hashes(ccasr['call_transcript'])
+            ccasr[DUPLICATE_COLUMN] = duplicate_of(ccasr['call_id'], representatives, hashes,
+                                                   pd.concat(earlier, ignore_index=True) if earlier else None)
+            earlier.append(pd.DataFrame({'call_id': ccasr['call_id'].to_numpy(),
+                                         'transcript_hash': pd.array(hashes, dtype='UInt64')}))
+        distinct_rows = np.unique(representatives)
+        stage.update(rows_out=len(distinct_rows), exact_duplicates=exact, near_duplicates=near)
+    if len(distinct_rows) < rows:
+        logging.info(f"{rows - len(distinct_rows)} of {rows} calls ({1 - len(distinct_rows) / rows:.1%}) repeat an "
+                     f"earlier transcript ({exact} identical, {near} near-identical) and reuse its extraction.")
+
+    context = {'args': args, 'locations': locations, 'representatives': representatives,
+               'distinct_rows': distinct_rows}
+    for extraction_stage in EXTRACTION_STAGES:
+        ccasr = run_stage(extraction_stage, ccasr, context, telemetry, checkpoints)
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(f"Resolved locations: \n{ccasr[ROUTE_COLUMNS].head()}")
+        logging.debug(f"Extracted call reasons and solutions: \n{ccasr[INFO_COLUMNS].head()}")
+
+    with telemetry.stage('10 compact dtypes', rows):
+        ccasr = compact_frame(ccasr)
+    log_memory_usage(ccasr, "extraction")
+    return ccasr
+
+
+def merged_frames(args, telemetry, checkpoints=None):
+    if args.chunk_size:
+        # Generator pipeline: read a chunk of calls and join it against the in-memory lookup tables
+        with telemetry.stage('2 load lookup tables'):
+            # The calls header is checked too, so a broken calls file fails before the tables are read
+            validate_inputs(['calls'] + LOOKUP_TABLES, args.data_dir)
+            customers, reasons, sentiments = load_lookup_tables(args.data_dir)
+        chunks = telemetry.measure_producer('2 load calls', iter_call_chunks(args.chunk_size, args.data_dir))
+        for chunk_number, calls in enumerate(chunks, start=1):
+            logging.info(f"Processing chunk {chunk_number} ({len(calls)} calls)...")
+            with telemetry.stage('3 merge', len(calls)):
+                ccasr = merge_data(calls, sentiments, reasons, customers)
+            yield ccasr
+    else:
+        if checkpoints is not None:
+            # The merged frame is reused while the input files and the code that loads and merges them are the same
+            paths = validate_inputs(['calls'] + LOOKUP_TABLES, args.data_dir).values()
+            key = code_digest(merge_data, MERGE_MODULES, [files_identity(paths)])
+            with telemetry.stage('3 load merge checkpoint') as stage:
+                ccasr = checkpoints.load('3 merge', key)
+                stage['rows_out'] = None if ccasr is None else len(ccasr)
+            if ccasr is not None:
+                logging.info("Merged data loaded from its checkpoint.")
+                yield ccasr
+                return
+
+        # Step 2: Load Data
+        with telemetry.stage('2 load data') as stage:
+            calls, customers, reasons, sentiments = load_csv_data(args.data_dir)
+            stage['rows_out'] = len(calls)
+
+        # Step 3: Merge Dataframes
+        with telemetry.stage('3 merge', len(calls)):
+            ccasr = merge_data(calls, sentiments, reasons, customers)
+            if checkpoints is not None:
+                checkpoints.save('3 merge', key, ccasr)
+        yield ccasr
+
+
+def processed_frames(args, merged, locations, ledger, delta, rollups, sketches, transcripts, telemetry,
+                     checkpoints=None):
+    # Calls of the earlier runs and chunks, whose transcripts later calls are matched against
+    earlier = [] if ledger is None else [ledger[['call_id', 'transcript_hash']]]
+    for ccasr in merged:
+        if args.incremental:
+            # Skip calls whose merged input row was already processed by an earlier run
+            with telemetry.stage('3 filter unprocessed', len(ccasr)) as stage:
+                ccasr, fingerprints, replaced_ids = filter_unprocessed(ccasr, ledger)
+                stage['rows_out'] = len(ccasr)
+            delta['fingerprints'].append(fingerprints)
+            delta['replaced_ids'].extend(replaced_ids)
+            if ccasr.empty:
+                continue
+
+        # Steps 4-10: Clean, extract and label
+        ccasr = process_calls(ccasr, locations, args, telemetry, checkpoints, earlier)
+        with telemetry.stage('12 agent rollup', len(ccasr)):
+            rollups.append(build_rollup(ccasr))
+        with telemetry.stage('12 metric sketches', len(ccasr)):
+            sketches.append(build_sketches(ccasr))
+        if transcripts is not None:
+            # The dataset keeps only call_id as the reference to the text
+            with telemetry.stage('11 store transcripts', len(ccasr)):
+                transcripts.write(ccasr['call_id'], ccasr['call_transcript'])
+                ccasr = ccasr.drop(columns=STORED_TEXT_COLUMNS)
+        yield ccasr
+
+
+def load_locations(args):
+    if args.resolver == 'gazetteer':
+        return {'gazetteer': load_gazetteer(args.gazetteer)}
+    # spaCy's English model is loaded by step 6, and only when some location is not in the cache yet
+    return {'nlp': LazyModel(SPACY_MODEL), 'cache': load_location_cache(args.location_cache, SPACY_MODEL)}
+
+
+def run_pipeline(args, telemetry, locations=None, merged=None):
+    # merged: the merged frames to process, read from --data-dir when not given
+    locations = locations or load_locations(args)
+    checkpoints = CheckpointStore(args.checkpoint_dir) if args.checkpoint else None
+    merged = merged if merged is not None else merged_frames(args, telemetry, checkpoints)
+
+    # Step 11: Save the final dataset; every processed chunk is appended as soon as it is ready.
+    # Incremental runs write to a delta file first and merge it into the existing output at the end.
+    output_file = output_file_for(args.output_format)
+    ledger_file = ledger_file_for(output_file)
+    ledger = load_ledger(ledger_file, output_file) if args.incremental else None
+    delta = {'fingerprints': [], 'replaced_ids': []}
+    delta_file = output_file.replace('processed_dataset_with_ext', 'processed_dataset_delta')
+    target_file = delta_file if args.incremental else output_file
+    remove_output(delta_file)  # left behind by an interrupted incremental run
+    if args.incremental and os.path.exists(output_file):
+        # A delta must have the same columns as the output it is merged into
+        if ('call_transcript' in output_columns(output_file)) == args.transcript_store:
+            raise ValueError(f"{output_file} was written {'without' if args.transcript_store else 'with'} "
+                             f"--transcript-store; run once without --incremental to switch.")
+    base_fingerprint = output_fingerprint(output_file)
+    rollups, sketches = [], []
+    transcripts = TranscriptWriter(append=args.incremental) if args.transcript_store else None
+    logging.info(f"Saving the final dataset to {target_file}...")
+    frames = processed_frames(args, merged, locations, ledger, delta, rollups, sketches, transcripts, telemetry,
+                              checkpoints)
+    rows_written = write_frames(telemetry.measure_consumer('11 write output', frames), target_file)
+    if transcripts is not None:
+        transcripts.close()
+
+    delta_calls = None
+    if args.incremental:
+        # Without a ledger nothing in the existing output can be trusted to match, so it is rebuilt
+        with telemetry.stage('11 merge delta into output'):
+            if ledger is not None and os.path.exists(delta_file):
+                # The call store takes the delta rows as they are, before they disappear into the output
+                delta_calls = read_output(columns=store_columns(delta_file), output_file=delta_file)
+            apply_delta(output_file, delta_file, delta['replaced_ids'], rebuild=ledger is None)
+            update_ledger(ledger, delta['fingerprints'], ledger_file)
+
+    # Step 12: Keep the agent rollup, the AHT/AST percentile and distinct customer sketches and the indexed call
+    # store used by get_agent_metrics.py and query_server.py in step with the output. New calls are added to the
+    # stored ones; changed calls would have to be taken out of the rollup and sketches first, so those runs
+    # rebuild them.
+    if os.path.exists(output_file):
+        with telemetry.stage('12 save agent rollup'):
+            if not args.incremental:
+                update_rollup(output_file, merge_rollups(rollups))
+                update_sketches(output_file, merge_sketches(sketches))
+            elif ledger is not None and not delta['replaced_ids']:
+                update_rollup(output_file, merge_rollups(rollups), base_fingerprint)
+                update_sketches(output_file, merge_sketches(sketches), base_fingerprint)
+            else:
+                update_rollup(output_file, None)
+                update_sketches(output_file, None)
+        # The indexed call store replaces changed calls by call_id, so only a run without a ledger rebuilds it
+        with telemetry.stage('12 save call store'):
+            if args.incremental and ledger is not None:
+                update_call_store(output_file, delta_calls, base_fingerprint)
+            else:
+                update_call_store(output_file)
+
+    if args.resolver == 'spacy':
+        save_location_cache(locations['cache'], args.location_cache, SPACY_MODEL)
+    if checkpoints is not None:
+        checkpoints.prune()
+    return rows_written
+
+
+def watch_pipeline(args, telemetry):
+    # Micro-batch mode: every poll reads the files dropped since the last one, joins the calls whose rows are
+    # complete against the customers and runs them through steps 4-12 as an --incremental run, so they show up
+    # in the reports as soon as the batch is merged. Rows that are not processed yet are kept in
+    # output/watch_state/ and survive a restart.
+    output_file = output_file_for(args.output_format)
+    ledger_file = ledger_file_for(output_file)
+    if os.path.exists(output_file) and not os.path.exists(ledger_file):
+        raise ValueError(f"{output_file} has no {ledger_file}; run main.py --incremental once before --watch.")
+    if args.checkpoint:
+        raise ValueError("--checkpoint keeps the steps of one full run and does not apply to --watch.")
+    args.incremental = True
+    locations = load_locations(args)
+    customers, = read_inputs(['customers'], args.data_dir)
+    drop_directory = DropDirectory(args.watch, args.max_wait)
+    logging.info(f"Watching {args.watch} for new call, sentiment and reason files...")
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    # A service manager stops the daemon with SIGTERM; it finishes like Ctrl+C, with a final run report
+    signal.signal(signal.SIGTERM, stop)
+    batches, rows_written, status = 0, 0, 'running'
+    try:
+        while True:
+            poll_started = time.time()
+            new_files = drop_directory.new_files()
+            if new_files:
+                with telemetry.stage('watch read drop files'):
+                    drop_directory.scan(new_files)
+            batch = drop_directory.release()
+            if batch is not None:
+                calls, sentiments, reasons, arrived = batch
+                logging.info(f"Processing a micro-batch of {len(calls)} calls...")
+                with telemetry.stage('3 merge', len(calls)):
+                    ccasr = merge_data(calls, sentiments, reasons, customers)
+                rows_written += run_pipeline(args, telemetry, locations, [ccasr])
+                # Only now are the released rows out of the pending ones for good
+                drop_directory.save()
+                batches += 1
+                record = {
+                    'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'batch': batches,
+                    **batch_metrics(arrived, time.time()), 'batch_seconds': round(time.time() - poll_started, 3),
+                    **drop_directory.backlog(),
+                }
+                append_metrics(record, args.watch_metrics)
+                logging.info(f"Micro-batch {batches}: {record['calls']} calls, latency p50 "
+                             f"{record['latency_p50_seconds']}s / max {record['latency_max_seconds']}s, "
+                             f"{record['pending_calls']} calls pending, {record['unread_files']} files unread.")
+                telemetry.write_report(args.run_report, status=status, rows_written=rows_written, batches=batches,
+                                       last_batch=record, args=vars(args))
+            time.sleep(max(0.0, args.poll_interval - (time.time() - poll_started)))
+    except KeyboardInterrupt:
+        status = 'stopped'
+        logging.info("Stopped watching.")
+    except Exception:
+        status = 'failed'
+        raise
+    finally:
+        telemetry.write_report(args.run_report, status=status, rows_written=rows_written, batches=batches,
+                               backlog=drop_directory.backlog(), args=vars(args))
+
+
+def main(args):
+    # Step 1: Setup Logging
+    setup_logging(args.log_level)
+    telemetry = RunTelemetry(trace_memory=args.trace_memory)
+    if args.watch:
+        watch_pipeline(args, telemetry)
+        return
+
+    # The run report is written even when a stage fails, so a broken nightly run still leaves its timings
+    status, rows_written = 'failed', None
+    try:
+        rows_written = run_pipeline(args, telemetry)
+        status = 'succeeded'
+    finally:
+        telemetry.write_report(args.run_report, status=status, rows_written=rows_written, args=vars(args))
+    logging.info("Process completed successfully.")
+
 
-# Step 11: Save the final dataset
-output_file = 'output/processed_dataset_with_ext.csv'
-logging.info(f"Saving the final dataset to {output_file}...")
-ccasr.to_csv(output_file, index=False)
-logging.info("Process completed successfully.")
\ No newline at end of file
+# The guard keeps worker processes (spawned on macOS/Windows) from re-running the pipeline on import
+if __name__ == '__main__':
+    main(parse_args())
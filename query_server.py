@@ -0,0 +1,197 @@
+import argparse
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from get_details_metrics import config, metrics
+from utils.agent_rollup import agent_summary, current_rollup
+from utils.call_store import connect, current_call_store, find_calls
+from utils.concern_index import concern_breakdown, current_concern_index, route_concern_matrix
+from utils.metric_sketches import SKETCH_DIMENSIONS, current_sketches, sketch_summary
+from utils.output_store import current_output_file, output_fingerprint
+
+
+# Query parameters of /calls: (parameter, call store column)
+CALL_PARAMS = {
+    'agent_id': 'agent_id',
+    'customer_id': 'customer_id',
+    'reason': 'reason_label',
+    'travelling_from': 'travelling_from',
+    'travelling_to': 'travelling_to',
+}
+
+
+def records(df):
+    # JSON-ready rows; NaN averages become null
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+class Snapshot:
+    # Everything the endpoints need for one version of the processed dataset
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self.rollup, self.fingerprint = current_rollup(output_file)
+        self.concern_index = current_concern_index(output_file)
+        self.sketches = current_sketches(output_file)
+        # Individual calls stay on disk in the indexed call store; every request reads them through its own
+        # read-only connection
+        self.call_store = current_call_store(output_file)
+        # Per-agent index: the summary of every agent is computed once and looked up by agent_id
+        summary = agent_summary(self.rollup)
+        self.all_agents = records(summary)
+        self.agents = {agent_id: records(rows) for agent_id, rows in summary.groupby('agent_id', sort=False)}
+
+
+class QueryState:
+    def __init__(self, reload_interval):
+        self.snapshot = None
+        self.reload_interval = reload_interval
+        self.stopped = threading.Event()
+
+    def reload_if_changed(self):
+        output_file = current_output_file()
+        snapshot = self.snapshot
+        if snapshot is None or (output_file, output_fingerprint(output_file)) != (snapshot.output_file, snapshot.fingerprint):
+            logging.info(f"Loading {output_file}...")
+            # The new snapshot is built on the side and swapped in, requests keep using the old one meanwhile
+            self.snapshot = Snapshot(output_file)
+            logging.info(f"Serving {output_file} ({self.snapshot.fingerprint}).")
+
+    def watch(self):
+        while not self.stopped.wait(self.reload_interval):
+            try:
+                self.reload_if_changed()
+            except Exception:
+                logging.exception("Reloading the processed dataset failed, still serving the previous one.")
+
+
+def agent_summary_response(snapshot, params):
+    agent_id = params.get('agent_id')
+    if not agent_id:
+        return 200, {'fingerprint': snapshot.fingerprint, 'summary': snapshot.all_agents}
+    if agent_id not in snapshot.agents:
+        return 404, {'error': f"No data found for agent_id: {agent_id}"}
+    return 200, {'fingerprint': snapshot.fingerprint, 'agent_id': agent_id, 'summary': snapshot.agents[agent_id]}
+
+
+def detail_filters(params):
+    return {
+        'reason_label': params.get('reason', 'Get Details'),
+        'date_from': params.get('from'),
+        'date_to': params.get('to'),
+    }
+
+
+def concerns_response(snapshot, params):
+    filters = detail_filters(params)
+    # Same default route as get_details_metrics.py; any_route=1 counts every route
+    if config['filter_by_travel'] and params.get('any_route') not in ('1', 'true'):
+        filters['travelling_from'] = params.get('travelling_from', config['travelling_from'])
+        filters['travelling_to'] = params.get('travelling_to', config['travelling_to'])
+    breakdown = concern_breakdown(snapshot.concern_index, metrics, **filters)
+    return 200, {'fingerprint': snapshot.fingerprint, 'filters': filters, 'concerns': records(breakdown)}
+
+
+def routes_response(snapshot, params):
+    filters = detail_filters(params)
+    matrix = route_concern_matrix(snapshot.concern_index, metrics, **filters)
+    return 200, {'fingerprint': snapshot.fingerprint, 'filters': filters, 'routes': records(matrix)}
+
+
+def percentiles_response(snapshot, params):
+    by = params.get('by', 'agent')
+    if by not in SKETCH_DIMENSIONS:
+        raise ValueError(f"by must be one of {list(SKETCH_DIMENSIONS)}, got '{by}'")
+    percentiles = sketch_summary(snapshot.sketches, by, params.get('key'), params.get('from'), params.get('to'))
+    return 200, {'fingerprint': snapshot.fingerprint, 'by': by, 'percentiles': records(percentiles)}
+
+
+def calls_response(snapshot, params):
+    filters = {column: params[name] for name, column in CALL_PARAMS.items() if params.get(name)}
+    limit = params.get('limit', '100')
+    if not limit.isdigit():
+        raise ValueError(f"limit must be a positive number, got '{limit}'")
+    connection = connect(snapshot.call_store, read_only=True)
+    try:
+        calls = find_calls(connection, params.get('from'), params.get('to'), int(limit), **filters)
+    finally:
+        connection.close()
+    return 200, {'fingerprint': snapshot.fingerprint, 'filters': filters, 'calls': records(calls)}
+
+
+def health_response(snapshot, params):
+    return 200, {'fingerprint': snapshot.fingerprint, 'output_file': snapshot.output_file}
+
+
+ENDPOINTS = {
+    '/agent_summary': agent_summary_response,
+    '/concerns': concerns_response,
+    '/concerns/routes': routes_response,
+    '/percentiles': percentiles_response,
+    '/calls': calls_response,
+    '/health': health_response,
+}
+
+
+class QueryServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 makes bursts of dashboard requests wait for TCP retransmits
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def make_handler(state):
+    class QueryHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            endpoint = ENDPOINTS.get(url.path.rstrip('/') or '/')
+            if endpoint is None:
+                status, body = 404, {'error': f"Unknown endpoint {url.path}, expected one of {sorted(ENDPOINTS)}"}
+            else:
+                params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+                try:
+                    status, body = endpoint(state.snapshot, params)
+                except ValueError as error:
+                    status, body = 400, {'error': str(error)}
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            logging.debug(f"{self.address_string()} {format % args}")
+
+    return QueryHandler
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the agent and Get Details reports over HTTP from memory")
+    parser.add_argument('--host', default='127.0.0.1', help="Interface to listen on (default: %(default)s)")
+    parser.add_argument('--port', type=int, default=8050, help="Port to listen on (default: %(default)s)")
+    parser.add_argument('--reload-interval', type=float, default=5.0,
+                        help="Seconds between checks for new pipeline output (default: %(default)s)")
+    return parser.parse_args()
+
+
+def main(args):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    state = QueryState(args.reload_interval)
+    state.reload_if_changed()
+    threading.Thread(target=state.watch, daemon=True).start()
+
+    server = QueryServer((args.host, args.port), make_handler(state))
+    logging.info(f"Query server listening on http://{args.host}:{args.port} ({', '.join(sorted(ENDPOINTS))})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        state.stopped.set()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main(parse_args())
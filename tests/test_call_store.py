@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.agent_rollup import build_rollup
+from utils.call_store import (connect, find_calls, store_columns, store_rollup, stored_fingerprint,
+                              update_call_store)
+from utils.output_store import merge_into_output, output_fingerprint, read_output, write_frames
+
+
+def calls_frame(call_ids, aht_offset=0):
+    call_ids = np.asarray(call_ids, dtype='int64')
+    n_calls = len(call_ids)
+    return pd.DataFrame({
+        'call_id': call_ids,
+        'customer_id': call_ids % 4 + 500,
+        'agent_id': call_ids % 3 + 100000,
+        'call_start_datetime': pd.Timestamp('2024-08-01 08:00') + pd.to_timedelta(call_ids * 7, unit='h'),
+        'call_transcript': [f"Agent: Hello, call {call_id}." for call_id in call_ids],
+        'reason_label': np.array(['Baggage', 'Upgrade'])[call_ids % 2],
+        'travelling_from': np.array(['JFK', 'SFO', None])[call_ids % 3],
+        'travelling_to': 'ORD',
+        'elite_level_code': (call_ids % 5).astype('float64'),
+        'aht': call_ids * 10 + aht_offset,
+        'ast': call_ids % 7,
+        'average_sentiment': np.linspace(-0.5, 0.5, n_calls).round(2),
+        'silence_percent_average': np.full(n_calls, 0.25),
+        'refund_offer': 'Refund not offered',
+        'voucher_offer': np.array(['Voucher offered', 'Voucher not offered'])[call_ids % 2],
+        'sky_miles_offer': 'SkyMiles not offered',
+    }).assign(call_date=lambda df: df['call_start_datetime'].dt.date)
+
+
+@pytest.fixture(params=['csv', 'parquet'])
+def store(tmp_path, request):
+    # A store built from 12 calls, like the first run of main.py
+    output_file = str(tmp_path / f"processed_dataset.{request.param}")
+    store_file = str(tmp_path / 'calls.sqlite')
+    write_frames([calls_frame(range(1, 13))], output_file)
+    update_call_store(output_file, store_file=store_file)
+    return output_file, store_file
+
+
+def test_incremental_upsert_replaces_changed_calls(store):
+    output_file, store_file = store
+    # The delta of an --incremental run: calls 2 and 5 changed, 13 and 14 are new
+    replaced_ids = np.array([2, 5], dtype='int64')
+    delta_file = output_file.replace('dataset', 'delta')
+    write_frames([calls_frame([2, 5, 13, 14], aht_offset=1)], delta_file)
+    delta_calls = read_output(columns=store_columns(delta_file), output_file=delta_file)
+    base_fingerprint = output_fingerprint(output_file)
+    merge_into_output(output_file, delta_file, replaced_ids)
+    update_call_store(output_file, delta_calls, base_fingerprint, store_file=store_file)
+
+    connection = connect(store_file, read_only=True)
+    try:
+        stored = pd.read_sql_query('SELECT * FROM calls', connection)
+        assert sorted(stored['call_id']) == list(range(1, 15))
+        assert stored.set_index('call_id').loc[[1, 2, 5, 14], 'aht'].tolist() == [10, 21, 51, 141]
+        assert 'call_transcript' not in stored
+        assert stored_fingerprint(connection) == output_fingerprint(output_file)
+
+        output = read_output(output_file=output_file)
+        for agent_id, agent_calls in output.groupby('agent_id'):
+            pd.testing.assert_frame_equal(
+                store_rollup(connection, agent_id).sort_values('call_date').reset_index(drop=True),
+                build_rollup(agent_calls).sort_values('call_date').reset_index(drop=True), check_dtype=False,
+            )
+    finally:
+        connection.close()
+
+
+def test_find_calls_filters_and_limits(store):
+    output_file, store_file = store
+    calls = read_output(output_file=output_file)
+    connection = connect(store_file, read_only=True)
+    try:
+        found = find_calls(connection, agent_id=100001, reason_label='Upgrade')
+        expected = calls[(calls['agent_id'] == 100001) & (calls['reason_label'] == 'Upgrade')]
+        assert found['call_id'].tolist() == expected['call_id'].iloc[::-1].tolist() == [7, 1]
+
+        found = find_calls(connection, travelling_from='JFK', travelling_to='ORD', date_from='2024-08-02',
+                           date_to='2024-08-03')
+        assert found['call_id'].tolist() == [9, 6, 3]
+
+        # Newest first, and a filter of None is left out
+        found = find_calls(connection, limit=3, agent_id=None)
+        assert found['call_id'].tolist() == [12, 11, 10]
+        assert found['call_start_datetime'].tolist() == sorted(found['call_start_datetime'], reverse=True)
+
+        with pytest.raises(ValueError, match='can only be filtered'):
+            find_calls(connection, call_transcript='Hello')
+    finally:
+        connection.close()
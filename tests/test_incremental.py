@@ -0,0 +1,113 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.incremental import apply_delta, filter_unprocessed, load_ledger, update_ledger
+from utils.near_duplicates import duplicate_of, find_duplicates, transcript_hashes
+from utils.output_store import merge_into_output, read_output, write_frames
+
+
+def calls_frame(n_calls):
+    # Processed-looking calls with the values a careless CSV round trip changes: integer codes with gaps,
+    # nullable ids, 'N/A' labels and transcripts that span several lines
+    call_ids = np.arange(1000, 1000 + n_calls, dtype='int64') * 1000003
+    return pd.DataFrame({
+        'call_id': call_ids,
+        'agent_id': np.arange(n_calls, dtype='int64') % 3 + 100000,
+        'call_transcript': [f"Agent: Hello, call {i}.\nCustomer: \"My flight\", I said, was late."
+                            for i in range(n_calls)],
+        'elite_level_code': pd.array([4, None, 1, 2, 4, None, 3, 0, 1, 2][:n_calls], dtype='Int64').astype('float64'),
+        'duplicate_of': pd.array(
+            [None, None, call_ids[0], None, call_ids[1], None, None, call_ids[0], None, None][:n_calls], dtype='Int64'
+        ),
+        'voucher_value': ['N/A', '150$', 'N/A', None, 'N/A', '50$', 'N/A', 'N/A', '100$', 'N/A'][:n_calls],
+        'average_sentiment': np.linspace(-1, 1, n_calls).round(2),
+        'call_date': pd.date_range('2024-08-01', periods=n_calls, freq='12h').date,
+    })
+
+
+def incremental_pass(frame, output_file, ledger_file):
+    # What main.py --incremental does around steps 4-10, with the processing itself left out
+    delta_file = output_file.replace('dataset', 'delta')
+    ledger = load_ledger(ledger_file, output_file)
+    pending, fingerprints, replaced_ids = filter_unprocessed(frame, ledger)
+    if len(pending):
+        write_frames([pending], delta_file)
+    apply_delta(output_file, delta_file, replaced_ids, rebuild=ledger is None)
+    update_ledger(ledger, [fingerprints], ledger_file)
+    return len(pending), len(replaced_ids)
+
+
+@pytest.mark.parametrize('extension', ['csv', 'parquet'])
+def test_incremental_passes_match_a_full_pass(tmp_path, extension):
+    frame = calls_frame(10)
+    # The last call of the first batch changes, so it is rewritten where a full pass writes it
+    changed = frame.copy()
+    changed.loc[5, 'average_sentiment'] = 0.99
+
+    full_file = str(tmp_path / f"full_dataset.{extension}")
+    write_frames([changed], full_file)
+
+    output_file = str(tmp_path / f"processed_dataset.{extension}")
+    ledger_file = str(tmp_path / 'ledger.csv')
+    assert incremental_pass(frame.iloc[:6].reset_index(drop=True), output_file, ledger_file) == (6, 0)
+    assert incremental_pass(changed, output_file, ledger_file) == (5, 1)
+    assert len(load_ledger(ledger_file)) == 10
+
+    if extension == 'csv':
+        with open(output_file, 'rb') as incremental, open(full_file, 'rb') as full:
+            assert incremental.read() == full.read()
+    pd.testing.assert_frame_equal(read_output(output_file=output_file), read_output(output_file=full_file))
+
+    # Nothing new: the output is left as it is
+    before = os.stat(output_file).st_mtime_ns
+    assert incremental_pass(changed, output_file, ledger_file) == (0, 0)
+    assert os.stat(output_file).st_mtime_ns == before
+
+
+def test_csv_delta_with_other_columns_is_refused(tmp_path):
+    frame = calls_frame(4)
+    output_file, delta_file = str(tmp_path / 'dataset.csv'), str(tmp_path / 'delta.csv')
+    write_frames([frame.iloc[:2]], output_file)
+    write_frames([frame.iloc[2:].drop(columns='voucher_value')], delta_file)
+    with pytest.raises(ValueError, match='other columns'):
+        merge_into_output(output_file, delta_file, [])
+    with pytest.raises(ValueError, match='other columns'):
+        merge_into_output(output_file, delta_file, frame['call_id'].iloc[:1].to_numpy())
+
+
+def flag_duplicates(frame, earlier):
+    # What step 4 of main.py does for one frame, given the calls processed before it
+    representatives, _, _ = find_duplicates(frame['call_transcript'])
+    hashes = transcript_hashes(frame['call_transcript'])
+    flagged = duplicate_of(frame['call_id'], representatives, hashes, pd.concat(earlier) if earlier else None)
+    earlier.append(pd.DataFrame({'call_id': frame['call_id'], 'transcript_hash': pd.array(hashes, dtype='UInt64')}))
+    return dict(zip(frame['call_id'], flagged))
+
+
+def test_duplicates_of_calls_processed_by_earlier_runs_are_flagged(tmp_path):
+    frame = pd.DataFrame({
+        'call_id': np.arange(1, 8, dtype='int64'),
+        'call_transcript': ['A', 'B', 'A', 'C', 'B', 'D', 'A'],
+        'average_sentiment': np.zeros(7),
+    })
+    full = flag_duplicates(frame, [])
+    assert [full[call_id] for call_id in range(1, 8)] == [pd.NA, pd.NA, 1, pd.NA, 2, pd.NA, 1]
+
+    ledger_file = str(tmp_path / 'ledger.csv')
+    _, fingerprints, _ = filter_unprocessed(frame.iloc[:4], None)
+    update_ledger(None, [fingerprints], ledger_file)
+    # The first call of A and one of its duplicates change, and the rest arrives in two chunks
+    changed = frame.assign(average_sentiment=np.where(frame['call_id'].isin([1, 3]), 0.5, 0.0))
+    ledger = load_ledger(ledger_file)
+    pending, fingerprints, replaced_ids = filter_unprocessed(changed, ledger)
+    assert pending['call_id'].tolist() == [1, 3, 5, 6, 7] and replaced_ids.tolist() == [1, 3]
+    earlier = [ledger[['call_id', 'transcript_hash']]]
+    flagged = {**flag_duplicates(pending.iloc[:3], earlier), **flag_duplicates(pending.iloc[3:], earlier)}
+    assert flagged == {call_id: full[call_id] for call_id in [1, 3, 5, 6, 7]}
+
+    # Changed calls keep their place in the ledger, so the first call of a transcript stays first
+    update_ledger(ledger, [fingerprints], ledger_file)
+    assert load_ledger(ledger_file)['call_id'].tolist() == list(range(1, 8))
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.metric_sketches import (QUANTILE_KEYS, DISTINCT_KEYS, RELATIVE_ACCURACY, REPORT_QUANTILES, build_sketches,
+                                   merge_sketches, sketch_summary)
+
+
+@pytest.fixture
+def calls():
+    # Long-tailed handle times over a few agents, reasons, routes and dates, and customers that call more than once
+    rng = np.random.default_rng(7)
+    n_calls = 30000
+    return pd.DataFrame({
+        'agent_id': rng.integers(100000, 100005, n_calls),
+        'reason_label': rng.choice(['Baggage', 'Upgrade', 'Voluntary Cancel'], n_calls),
+        'travelling_from': rng.choice(['JFK', 'SFO', None], n_calls),
+        'travelling_to': rng.choice(['ORD', 'LAX'], n_calls),
+        'call_date': pd.to_datetime('2024-08-01') + pd.to_timedelta(rng.integers(0, 4, n_calls), unit='D'),
+        'customer_id': rng.integers(0, 20000, n_calls) * 7919 + 1000003,
+        'aht': np.ceil(rng.lognormal(2, 0.8, n_calls)),
+        'ast': rng.integers(0, 40, n_calls),
+    })
+
+
+def sorted_sketches(sketches):
+    quantiles, distinct = sketches
+    return (quantiles.sort_values(QUANTILE_KEYS).reset_index(drop=True),
+            distinct.sort_values(DISTINCT_KEYS).reset_index(drop=True))
+
+
+def test_merged_sketches_equal_one_sketch_of_every_row(calls):
+    whole = sorted_sketches(build_sketches(calls))
+    # Chunks share agents and dates, so their buckets and registers overlap
+    chunks = [build_sketches(calls.iloc[start:start + 10000]) for start in range(0, len(calls), 10000)]
+    merged = sorted_sketches(merge_sketches(chunks))
+    pd.testing.assert_frame_equal(merged[0], whole[0])
+    pd.testing.assert_frame_equal(merged[1], whole[1])
+    assert merge_sketches([None, chunks[0]]) is chunks[0]
+
+
+@pytest.mark.parametrize('date_from, date_to', [(None, None), ('2024-08-02', '2024-08-03')])
+def test_percentiles_within_relative_accuracy(calls, date_from, date_to):
+    summary = sketch_summary(build_sketches(calls), 'agent', date_from=date_from,
+                             date_to=date_to).set_index('agent')
+    window = calls[calls['call_date'].between(date_from or '2000-01-01', date_to or '2100-01-01')]
+    for agent_id, agent_calls in window.groupby('agent_id'):
+        row = summary.loc[str(agent_id)]
+        assert row['num_calls'] == len(agent_calls)
+        for measure in ['aht', 'ast']:
+            for q in REPORT_QUANTILES:
+                # The value at rank floor(q * (n - 1)), give or take the summary's rounding to cents
+                exact = np.quantile(agent_calls[measure], q, method='lower')
+                assert abs(row[f'{measure}_p{round(q * 100)}'] - exact) <= RELATIVE_ACCURACY * exact + 0.005 + 1e-9
+
+
+def test_distinct_customers_within_error(calls):
+    summary = sketch_summary(build_sketches(calls), 'reason').set_index('reason')
+    for reason, reason_calls in calls.groupby('reason_label'):
+        assert summary.loc[reason, 'distinct_customers'] == pytest.approx(reason_calls['customer_id'].nunique(),
+                                                                           rel=0.05)
+    # Small groups go through linear counting and come out close to exact
+    few = calls.iloc[:200]
+    summary = sketch_summary(build_sketches(few), 'agent').set_index('agent')
+    for agent_id, agent_calls in few.groupby('agent_id'):
+        assert summary.loc[str(agent_id), 'distinct_customers'] == pytest.approx(agent_calls['customer_id'].nunique(),
+                                                                                 abs=2)
@@ -0,0 +1,123 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import utils.output_store as output_store
+from utils.output_store import load_manifest, merge_into_output, partition_files, read_output, write_frames
+
+
+def calls_frame(call_ids, dates, aht_offset=0):
+    starts = pd.to_datetime(dates) + pd.to_timedelta(np.arange(len(call_ids)) % 5, unit='h')
+    return pd.DataFrame({
+        'call_id': np.asarray(call_ids, dtype='int64'),
+        'call_start_datetime': starts,
+        'aht': np.arange(len(call_ids), dtype='int64') + 10 + aht_offset,
+        'ast': np.arange(len(call_ids), dtype='int64') % 7,
+        'call_date': pd.to_datetime(dates).date,
+    })
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    # 12 calls over three dates, four per date
+    output_dir = str(tmp_path / 'processed_dataset_by_date')
+    frame = calls_frame(range(1, 13), np.repeat(['2024-08-01', '2024-08-02', '2024-08-03'], 4))
+    write_frames([frame], output_dir)
+    return output_dir, frame
+
+
+def merge_delta(output_dir, delta, replaced_ids):
+    # The delta of an --incremental run that replaces every call of 2024-08-01 and one of 2024-08-02 and adds a date
+    delta_dir = output_dir.replace('processed_dataset', 'processed_delta')
+    write_frames([delta], delta_dir)
+    merge_into_output(output_dir, delta_dir, replaced_ids)
+    return delta_dir
+
+
+def replacement(frame):
+    replaced_ids = np.array([1, 2, 3, 4, 6], dtype='int64')
+    delta = pd.concat([
+        calls_frame(replaced_ids, ['2024-08-01'] * 4 + ['2024-08-02'], aht_offset=100),
+        calls_frame([13, 14], ['2024-08-04'] * 2),
+    ], ignore_index=True)
+    expected = pd.concat([frame[~frame['call_id'].isin(replaced_ids)], delta], ignore_index=True)
+    return delta, replaced_ids, expected
+
+
+def listed_files(output_dir):
+    return sorted(os.path.relpath(path, output_dir) for path in partition_files(output_dir))
+
+
+def files_on_disk(output_dir):
+    return sorted(os.path.relpath(os.path.join(root, name), output_dir)
+                  for root, _, names in os.walk(output_dir) for name in names if name.endswith('.parquet'))
+
+
+def test_merge_replacing_calls_keeps_manifest_in_step(dataset):
+    output_dir, frame = dataset
+    delta, replaced_ids, expected = replacement(frame)
+    merge_delta(output_dir, delta, replaced_ids)
+
+    manifest = load_manifest(output_dir)
+    assert manifest['rows'] == len(expected) == 14
+    assert sorted(manifest['partitions']) == ['2024-08-01', '2024-08-02', '2024-08-03', '2024-08-04']
+    for key, partition in manifest['partitions'].items():
+        calls = expected[expected['call_date'].astype(str) == key]
+        assert partition['rows'] == len(calls) == sum(entry['rows'] for entry in partition['files'])
+        assert partition['min']['aht'] == calls['aht'].min() and partition['max']['aht'] == calls['aht'].max()
+        assert partition['min']['call_start_datetime'] == calls['call_start_datetime'].min().isoformat()
+        assert partition['max']['call_start_datetime'] == calls['call_start_datetime'].max().isoformat()
+    # The fully replaced partition holds only the delta's file, and nothing unlisted is left behind
+    assert [entry['rows'] for entry in manifest['partitions']['2024-08-01']['files']] == [4]
+    assert listed_files(output_dir) == files_on_disk(output_dir)
+
+    merged = read_output(output_file=output_dir).sort_values('call_id').reset_index(drop=True)
+    assert merged['call_id'].tolist() == list(range(1, 15))
+    assert merged.set_index('call_id')['aht'].to_dict() == expected.set_index('call_id')['aht'].to_dict()
+
+
+def test_interrupted_merge_leaves_previous_dataset_readable(dataset, monkeypatch):
+    output_dir, frame = dataset
+    delta, replaced_ids, expected = replacement(frame)
+    delta_dir = output_dir.replace('processed_dataset', 'processed_delta')
+    write_frames([delta], delta_dir)
+    write_manifest = output_store._write_manifest
+
+    def crash(*args, **kwargs):
+        raise RuntimeError('interrupted before the manifest')
+
+    monkeypatch.setattr(output_store, '_write_manifest', crash)
+    with pytest.raises(RuntimeError):
+        merge_into_output(output_dir, delta_dir, replaced_ids)
+    assert listed_files(output_dir) != files_on_disk(output_dir)
+    before = read_output(output_file=output_dir).sort_values('call_id').reset_index(drop=True)
+    pd.testing.assert_frame_equal(before[frame.columns], frame.astype({'call_date': object}), check_dtype=False)
+
+    # The next merge picks up where it stopped and clears the files the interrupted one wrote
+    monkeypatch.setattr(output_store, '_write_manifest', write_manifest)
+    merge_into_output(output_dir, delta_dir, replaced_ids)
+    assert load_manifest(output_dir)['rows'] == len(expected)
+    assert listed_files(output_dir) == files_on_disk(output_dir)
+    assert not os.path.exists(delta_dir)
+
+
+def test_date_bounded_read_opens_only_the_files_of_the_window(dataset):
+    output_dir, frame = dataset
+    delta, replaced_ids, _ = replacement(frame)
+    merge_delta(output_dir, delta, replaced_ids)
+
+    window = partition_files(output_dir, '2024-08-02', '2024-08-03')
+    assert {os.path.relpath(path, output_dir).split(os.sep)[0] for path in window} == {
+        'call_date=2024-08-02', 'call_date=2024-08-03'
+    }
+    assert read_output(columns=['call_id'], output_file=output_dir, date_from='2024-08-05').empty
+    # Files outside the window are never opened, so breaking them does not affect the read
+    for path in set(partition_files(output_dir)) - set(window):
+        with open(path, 'wb') as f:
+            f.write(b'not parquet')
+    calls = read_output(columns=['call_id', 'call_date'], output_file=output_dir,
+                        date_from='2024-08-02', date_to='2024-08-03')
+    assert sorted(calls['call_id']) == [5, 6, 7, 8, 9, 10, 11, 12]
+    assert sorted(set(calls['call_date'].astype(str))) == ['2024-08-02', '2024-08-03']
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.reason_labeler import categorize_reason, categorize_reasons
+
+# At least one reason per branch of REASON_RULES and TOPIC_RULES, plus the values that fall through to the default
+REASONS = [
+    'To complain about the seat',
+    'to inquire about my booking',
+    'About my trip, I wanted to check the gate',
+    'Regarding the change of my flight',
+    'about my cancelled flight',
+    'About my baggage',
+    'about the bag that went missing',
+    'Regarding the staff, I am not happy',
+    'about a complaint I filed',
+    'About my upcoming trip',
+    'because I need to change my flight',
+    'because my flight was delayed and I missed my connecting flight',
+    'cause the flight got delayed',
+    'because my flight was cancelled',
+    'because my bag is lost',
+    'because I want to file a complaint',
+    'because of the weather',
+    'I need to change my seat',
+    'the delay made me miss the connecting flight',
+    'my flight is delayed',
+    'they cancelled my flight',
+    'baggage claim',
+    'I want to complain',
+    'something else entirely',
+    '  To Inquire about upgrades  ',
+    '',
+    '   ',
+    np.nan,
+    None,
+]
+
+
+@pytest.mark.parametrize('reason', REASONS)
+def test_categorize_reasons_matches_categorize_reason(reason):
+    assert categorize_reasons(pd.Series([reason], dtype=object)).tolist() == [categorize_reason(reason)]
+
+
+def test_categorize_reasons_keeps_index_and_repeats():
+    reasons = pd.Series(REASONS * 3, index=range(100, 100 + 3 * len(REASONS)), dtype=object)
+    labels = categorize_reasons(reasons)
+    assert labels.index.equals(reasons.index)
+    assert labels.tolist() == [categorize_reason(reason) for reason in reasons]
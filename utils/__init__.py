@@ -1,9 +1,26 @@
 from .logger import setup_logging
-from .data_loader import load_csv_data
+from .data_loader import input_path, iter_call_chunks, load_csv_data, load_lookup_tables, validate_inputs
 from .clean_primary_call_reason_cell import clean_primary_call_reason
 from .dataframe_merger import merge_data
-from .city_extraction_utils import extract_first_city_pair, extract_location
-from .call_transcript_info_extractor import extract_info
-from .reason_labeler import categorize_reason
-from .offer_extractor import extract_offers
-from .aht_ast_calculator import calculate_aht_ast
\ No newline at end of file
+from .city_extraction_utils import (
+    LazyModel, extract_first_city_pair, extract_location, load_location_cache, resolve_locations, save_location_cache
+)
+from .call_transcript_info_extractor import extract_get_details_concern, extract_info
+from .reason_labeler import categorize_reason, categorize_reasons
+from .offer_extractor import extract_offers, extract_offer_columns
+from .aht_ast_calculator import calculate_aht_ast
+from .parallel_executor import map_chunks, map_rows
+from .incremental import apply_delta, filter_unprocessed, ledger_file_for, load_ledger, update_ledger
+from .output_store import partition_files, read_output, write_frames
+from .dtype_schema import compact_frame, log_memory_usage, read_csv_with_schema, read_table_with_schema
+from .agent_rollup import agent_summary, build_rollup, current_rollup, merge_rollups, update_rollup
+from .concern_index import concern_breakdown, current_concern_index, route_concern_matrix
+from .run_telemetry import RunTelemetry
+from .turn_table import build_turn_table, extract_get_details_concerns, extract_info_columns
+from .transcript_store import TranscriptStore, TranscriptWriter, read_transcripts
+from .city_gazetteer import Gazetteer, load_gazetteer
+from .micro_batch import DropDirectory
+from .metric_sketches import build_sketches, current_sketches, merge_sketches, sketch_summary, update_sketches
+from .near_duplicates import duplicate_of, find_duplicates, minhash_signatures
+from .stage_graph import CheckpointStore, run_stage
+from .call_store import current_call_store, find_calls, store_rollup, update_call_store
\ No newline at end of file
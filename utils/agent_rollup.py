@@ -0,0 +1,122 @@
+import logging
+
+import pandas as pd
+
+from .output_store import current_derived, load_fingerprinted, read_output, save_fingerprinted, update_derived
+
+ROLLUP_FILE = 'output/agent_rollup.parquet'
+ROLLUP_KEYS = ['agent_id', 'reason_label', 'call_date', 'elite_level_code']
+# Output columns averaged by the agent report: (output column, rollup column prefix)
+ROLLUP_MEASURES = [
+    ('aht', 'aht'), ('ast', 'ast'), ('average_sentiment', 'sentiment'), ('silence_percent_average', 'silence')
+]
+# Output columns counted by the agent report: (output column, value that is counted, rollup column)
+ROLLUP_OFFERS = [
+    ('refund_offer', 'Refund offered', 'refund_offers'),
+    ('voucher_offer', 'Voucher offered', 'voucher_offers'),
+    ('sky_miles_offer', 'SkyMiles offered', 'skymiles_offers'),
+]
+ROLLUP_SOURCE_COLUMNS = (
+    ROLLUP_KEYS + [column for column, _ in ROLLUP_MEASURES] + [column for column, _, _ in ROLLUP_OFFERS]
+)
+# Averages reported per agent and reason: (report column, rollup column prefix)
+AVERAGE_COLUMNS = [
+    ('avg_aht', 'aht'), ('avg_ast', 'ast'), ('avg_sentiment', 'sentiment'), ('avg_silence', 'silence')
+]
+
+
+def build_rollup(df):
+    # Additive per-group sums and counts, so rollups of separate batches can simply be added together.
+    # Averages are recovered as sum / count at report time.
+    keys = pd.DataFrame({
+        'agent_id': df['agent_id'].to_numpy(),
+        'reason_label': df['reason_label'].astype(str).to_numpy(),
+        'call_date': pd.to_datetime(df['call_date']).to_numpy(),
+        'elite_level_code': pd.to_numeric(df['elite_level_code'].astype(object), errors='coerce').to_numpy(),
+    })
+    values = {'num_calls': 1}
+    for column, prefix in ROLLUP_MEASURES:
+        measure = pd.to_numeric(df[column], errors='coerce').to_numpy()
+        if measure.dtype == 'float32':
+            # Widen through the shortest decimal form, the value the CSV output holds, not float32's binary error
+            measure = measure.astype(str)
+        measure = measure.astype('float64')
+        values[f'{prefix}_sum'] = pd.Series(measure).fillna(0).to_numpy()
+        values[f'{prefix}_count'] = (~pd.isna(measure)).astype('int64')
+    for column, offered, name in ROLLUP_OFFERS:
+        values[name] = (df[column].astype(object) == offered).to_numpy(dtype='int64')
+
+    rows = keys.assign(**values)
+    return rows.groupby(ROLLUP_KEYS, dropna=False, sort=False).sum().reset_index()
+
+
+def merge_rollups(rollups):
+    rollups = [rollup for rollup in rollups if rollup is not None and not rollup.empty]
+    if not rollups:
+        return None
+    if len(rollups) == 1:
+        return rollups[0]
+    return pd.concat(rollups, ignore_index=True).groupby(ROLLUP_KEYS, dropna=False, sort=False).sum().reset_index()
+
+
+def rollup_from_output(output_file, date_from=None, date_to=None):
+    logging.info(f"Building the agent rollup from {output_file}...")
+    return build_rollup(read_output(columns=ROLLUP_SOURCE_COLUMNS, output_file=output_file,
+                                    date_from=date_from, date_to=date_to))
+
+
+def load_rollup(rollup_file=ROLLUP_FILE):
+    # Returns the stored rollup and the fingerprint of the output it was built from, (None, None) if missing
+    tables, fingerprint = load_fingerprinted([rollup_file])
+    return (tables[0].to_pandas(), fingerprint) if tables else (None, None)
+
+
+def save_rollup(rollup, fingerprint, rollup_file=ROLLUP_FILE):
+    import pyarrow as pa
+
+    save_fingerprinted({rollup_file: pa.Table.from_pandas(rollup, preserve_index=False)}, fingerprint)
+    logging.info(f"Agent rollup with {len(rollup)} groups saved to {rollup_file}.")
+
+
+def update_rollup(output_file, rollup, base_fingerprint=None, rollup_file=ROLLUP_FILE):
+    # rollup covers the whole output_file, or with base_fingerprint only the calls appended to the output
+    # that had that fingerprint (see update_derived)
+    return update_derived(
+        'agent rollup', output_file, rollup, base_fingerprint, lambda: load_rollup(rollup_file),
+        lambda rollup, fingerprint: save_rollup(rollup, fingerprint, rollup_file),
+        lambda stored, rollup: merge_rollups([stored, rollup]), rollup_from_output,
+    )
+
+
+def current_rollup(output_file=None, rollup_file=ROLLUP_FILE, date_from=None, date_to=None):
+    # The rollup of the current processed dataset and its fingerprint, rebuilt only when the dataset changed
+    # since it was stored (see current_derived)
+    return current_derived(
+        output_file, lambda: load_rollup(rollup_file),
+        lambda rollup, fingerprint: save_rollup(rollup, fingerprint, rollup_file), rollup_from_output,
+        date_from, date_to,
+    )
+
+
+def agent_summary(rollup, agent_id=None, date_from=None, date_to=None):
+    # Folds the agent x reason x date x elite level rollup down to agent x reason and turns sums into averages,
+    # optionally over the call dates from date_from to date_to only
+    rollup = rollup.assign(agent_id=rollup['agent_id'].astype(str))
+    if agent_id:
+        rollup = rollup[rollup['agent_id'] == str(agent_id)]
+    if date_from:
+        rollup = rollup[rollup['call_date'] >= pd.Timestamp(date_from)]
+    if date_to:
+        rollup = rollup[rollup['call_date'] <= pd.Timestamp(date_to)]
+
+    sum_columns = ['num_calls'] + [f'{prefix}_{part}' for _, prefix in ROLLUP_MEASURES for part in ('sum', 'count')]
+    offer_columns = [name for _, _, name in ROLLUP_OFFERS]
+    totals = rollup.groupby(['agent_id', 'reason_label'])[sum_columns + offer_columns].sum()
+
+    summary = totals[['num_calls']].copy()
+    for name, prefix in AVERAGE_COLUMNS:
+        # Round for better readability
+        summary[name] = (totals[f'{prefix}_sum'] / totals[f'{prefix}_count'].where(totals[f'{prefix}_count'] > 0)).round(2)
+    for name in offer_columns:
+        summary[name] = totals[name]
+    return summary.reset_index()
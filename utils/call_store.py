@@ -0,0 +1,208 @@
+import logging
+import os
+import sqlite3
+
+import pandas as pd
+
+from .agent_rollup import ROLLUP_SOURCE_COLUMNS, build_rollup
+from .output_store import current_derived, output_columns, read_output, update_derived
+from .transcript_store import STORED_TEXT_COLUMNS
+
+CALL_STORE_FILE = 'output/calls.sqlite'
+CALLS_TABLE = 'calls'
+# Secondary indexes of the calls table besides the one on call_id: (index name, columns). call_date comes second
+# where it narrows the lookup of an agent or reason down to a date range.
+CALL_STORE_INDEXES = [
+    ('calls_agent_date', ['agent_id', 'call_date']),
+    ('calls_reason_date', ['reason_label', 'call_date']),
+    ('calls_call_date', ['call_date']),
+    ('calls_route', ['travelling_from', 'travelling_to']),
+    ('calls_customer', ['customer_id']),
+]
+# Columns find_calls can filter on with an equality
+CALL_FILTER_COLUMNS = ['agent_id', 'customer_id', 'reason_label', 'travelling_from', 'travelling_to']
+DATETIME_TEXT_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Busy readers or a writer hold the database for a moment at most; wait for them instead of failing
+BUSY_TIMEOUT_SECONDS = 30
+
+
+def connect(store_file=CALL_STORE_FILE, read_only=False):
+    # Writers switch the file to write-ahead logging, so any number of readers keep reading the last committed
+    # version while a pipeline run writes the next one
+    if read_only:
+        connection = sqlite3.connect(f"file:{os.path.abspath(store_file)}?mode=ro", uri=True,
+                                     timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+    else:
+        connection = sqlite3.connect(store_file, timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT)')
+    return connection
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _sql_type(series):
+    dtype = series.dtype.categories.dtype if isinstance(series.dtype, pd.CategoricalDtype) else series.dtype
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    return 'TEXT'
+
+
+def _sql_rows(df):
+    # Python values for sqlite3: timestamps and dates as ISO text, which sorts like the dates themselves, and
+    # nulls as None
+    df = df.copy()
+    for column in df:
+        if pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = df[column].dt.strftime(DATETIME_TEXT_FORMAT)
+        elif df[column].dtype == 'float32':
+            # Widened through the shortest decimal form like in build_rollup, not with float32's binary error
+            df[column] = df[column].astype(str).astype('float64')
+    if 'call_date' in df:
+        df['call_date'] = pd.to_datetime(df['call_date']).dt.strftime('%Y-%m-%d')
+    return df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+
+def store_columns(output_file):
+    # Everything but the transcript text, which stays in the output or the transcript store
+    return [column for column in output_columns(output_file) if column not in STORED_TEXT_COLUMNS]
+
+
+def stored_fingerprint(connection):
+    row = connection.execute("SELECT value FROM store_meta WHERE key = 'input_fingerprint'").fetchone()
+    return row[0] if row else None
+
+
+def _table_columns(connection):
+    return [row[1] for row in connection.execute(f"PRAGMA table_info({CALLS_TABLE})")]
+
+
+def _create_table(connection, calls):
+    # call_id is unique rather than the primary key, so the rowid keeps the order of the output
+    definitions = [f"{_quote(column)} {_sql_type(calls[column])}" + (' UNIQUE' if column == 'call_id' else '')
+                   for column in calls.columns]
+    connection.execute(f"DROP TABLE IF EXISTS {CALLS_TABLE}")
+    connection.execute(f"CREATE TABLE {CALLS_TABLE} ({', '.join(definitions)})")
+
+
+def _create_indexes(connection, columns):
+    for name, index_columns in CALL_STORE_INDEXES:
+        if all(column in columns for column in index_columns):
+            connection.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {CALLS_TABLE} "
+                               f"({', '.join(_quote(column) for column in index_columns)})")
+
+
+def _insert(connection, calls):
+    placeholders = ', '.join('?' * len(calls.columns))
+    columns = ', '.join(_quote(column) for column in calls.columns)
+    connection.executemany(f"INSERT OR REPLACE INTO {CALLS_TABLE} ({columns}) VALUES ({placeholders})",
+                           _sql_rows(calls))
+
+
+def load_call_store(store_file=CALL_STORE_FILE):
+    # (columns of the calls table, fingerprint of the output it was loaded from), (None, None) if missing
+    if not os.path.exists(store_file):
+        return None, None
+    connection = connect(store_file, read_only=True)
+    try:
+        return _table_columns(connection) or None, stored_fingerprint(connection)
+    except sqlite3.OperationalError:
+        return None, None
+    finally:
+        connection.close()
+
+
+def save_call_store(change, fingerprint, store_file=CALL_STORE_FILE):
+    # change is ('rebuild', every call) or ('upsert', new and changed calls or None). It is applied in one
+    # transaction together with the fingerprint, so readers never see a half-written store.
+    mode, calls = change
+    connection = connect(store_file)
+    try:
+        connection.execute('BEGIN IMMEDIATE')
+        if mode == 'rebuild':
+            _create_table(connection, calls)
+            _insert(connection, calls)
+            # Building the indexes once after the bulk insert is cheaper than updating them row by row
+            _create_indexes(connection, list(calls.columns))
+        elif calls is not None and not calls.empty:
+            _insert(connection, calls)
+        connection.execute("INSERT OR REPLACE INTO store_meta VALUES ('input_fingerprint', ?)", (fingerprint,))
+        connection.execute('COMMIT')
+    except BaseException:
+        connection.execute('ROLLBACK') if connection.in_transaction else None
+        raise
+    finally:
+        connection.close()
+    logging.info(f"Call store {store_file} updated with {len(calls) if calls is not None else 0} calls.")
+
+
+def _rebuild(output_file):
+    return 'rebuild', read_output(columns=store_columns(output_file), output_file=output_file)
+
+
+def _upsert(columns, calls):
+    # Rows with other columns than the stored table mean the output changed shape, so the store is rebuilt
+    if calls is not None and not calls.empty and columns != list(calls.columns):
+        return None
+    return 'upsert', calls
+
+
+def update_call_store(output_file, calls=None, base_fingerprint=None, store_file=CALL_STORE_FILE):
+    # Same contract as update_rollup: without base_fingerprint the store is rebuilt from output_file; with it,
+    # calls holds the rows just merged into the output that had that fingerprint and replaces the stored rows
+    # with the same call_id
+    update_derived(
+        'call store', output_file, None if base_fingerprint is None else calls, base_fingerprint,
+        lambda: load_call_store(store_file),
+        lambda change, fingerprint: save_call_store(change, fingerprint, store_file), _upsert, _rebuild,
+    )
+
+
+def current_call_store(output_file=None, store_file=CALL_STORE_FILE):
+    # Path of the store of the current processed dataset, rebuilt only when the dataset changed since
+    current_derived(
+        output_file, lambda: load_call_store(store_file),
+        lambda change, fingerprint: save_call_store(change, fingerprint, store_file), _rebuild,
+    )
+    return store_file
+
+
+def _where(filters, date_from=None, date_to=None):
+    clauses, values = [], []
+    for column, value in filters.items():
+        if value is not None:
+            clauses.append(f"{_quote(column)} = ?")
+            values.append(value)
+    if date_from:
+        clauses.append('call_date >= ?')
+        values.append(pd.Timestamp(date_from).strftime('%Y-%m-%d'))
+    if date_to:
+        clauses.append('call_date <= ?')
+        values.append(pd.Timestamp(date_to).strftime('%Y-%m-%d'))
+    return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), values
+
+
+def store_rollup(connection, agent_id=None, date_from=None, date_to=None):
+    # The agent rollup rows (see build_rollup) of the calls of one agent, read through the (agent_id, call_date)
+    # index instead of from the whole dataset. Rows come back in the order they were stored, the order of the
+    # output, so the sums match the stored rollup to the last bit. An agent_id given as text is compared with the
+    # integer column as a number.
+    where, values = _where({'agent_id': agent_id}, date_from, date_to)
+    columns = ', '.join(_quote(column) for column in ROLLUP_SOURCE_COLUMNS)
+    calls = pd.read_sql_query(f"SELECT {columns} FROM {CALLS_TABLE}{where} ORDER BY rowid", connection,
+                              params=values)
+    return build_rollup(calls)
+
+
+def find_calls(connection, date_from=None, date_to=None, limit=100, **filters):
+    # The calls matching every given filter (see CALL_FILTER_COLUMNS) and date bound, newest first
+    unknown = [column for column in filters if column not in CALL_FILTER_COLUMNS]
+    if unknown:
+        raise ValueError(f"Calls can only be filtered on {CALL_FILTER_COLUMNS}, got {unknown}")
+    where, values = _where(filters, date_from, date_to)
+    query = f"SELECT * FROM {CALLS_TABLE}{where} ORDER BY call_start_datetime DESC LIMIT ?"
+    return pd.read_sql_query(query, connection, params=values + [int(limit)])
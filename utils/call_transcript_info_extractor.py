@@ -1,4 +1,5 @@
 import logging
+import re
 
 def extract_info(transcript):
     call_reason = []
@@ -49,4 +50,23 @@ def extract_info(transcript):
         "actual_call_reason": call_reason,
         "agent_solutions": " | ".join(formatted_solutions),
         "customer_accepted": customer_accepted
-    }
\ No newline at end of file
+    }
+
+
+# Extract the customer's answers to the agent's questions (the 'Get Details' concerns)
+def extract_get_details_concern(call_transcript):
+    lines = call_transcript.split('\n')
+    customer_dialogues = []
+    
+    # Iterate over the lines to find "Agent:" with a question mark and capture following "Customer:" lines
+    for i, line in enumerate(lines):
+        if re.search(r'Agent:.*\?', line):
+            # Look ahead in the next few lines for the "Customer:" response(s)
+            for j in range(i + 1, min(i + 4, len(lines))):  # Check up to 3 lines after the agent's question
+                if "Customer:" in lines[j]:
+                    customer_dialogue = lines[j].split("Customer:")[-1].strip()
+                    customer_dialogues.append(customer_dialogue)  # Append the customer response
+
+    # Combine all customer responses into one string, if multiple responses are found
+    combined_dialogue = ' '.join(customer_dialogues) if customer_dialogues else None
+    return combined_dialogue
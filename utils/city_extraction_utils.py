@@ -1,5 +1,14 @@
+import json
+import logging
+import os
+import time
+from importlib import metadata
+
 import pandas as pd
 
+# Only the entity recognizer is needed to find GPEs, the rest of the pipeline is skipped while resolving
+UNUSED_NER_PIPES = ('tagger', 'parser', 'attribute_ruler', 'lemmatizer', 'senter', 'morphologizer')
+
 def extract_first_city_pair(transcript):
     lower_transcript = str(transcript).lower()
 
@@ -40,11 +49,86 @@ def extract_location(text, nlp):
     if pd.isna(text):  # Handle NaN cases
         return ""
     
-    doc = nlp(text)
-    
+    return _first_gpe(nlp(text))
+
+
+def _first_gpe(doc):
     # Extract GPE (Geopolitical Entity) from the text
     for ent in doc.ents:
         if ent.label_ == "GPE":
             return ent.text
     
-    return ""
\ No newline at end of file
+    return ""
+
+
+class LazyModel:
+    # Stands in for a spaCy model and only imports spaCy and loads the model the first time a location has
+    # to be resolved, so runs whose locations are all cached never pay for it
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self._nlp = None
+
+    @property
+    def loaded(self):
+        return self._nlp is not None
+
+    def get(self):
+        if self._nlp is None:
+            start = time.perf_counter()
+            import spacy
+
+            logging.info(f"Loading spaCy model {self.model_name}...")
+            self._nlp = spacy.load(self.model_name)
+            logging.info(f"SpaCy model loaded in {time.perf_counter() - start:.2f}s.")
+        return self._nlp
+
+
+def _model_key(model_name):
+    # Cached entities are only valid for the model version that produced them
+    try:
+        return f"{model_name}=={metadata.version(model_name)}"
+    except metadata.PackageNotFoundError:
+        return model_name
+
+
+def load_location_cache(cache_file, model_name):
+    if not os.path.exists(cache_file):
+        return {}
+
+    with open(cache_file) as f:
+        cache = json.load(f).get(_model_key(model_name), {})
+    logging.info(f"Loaded {len(cache)} cached locations from {cache_file}.")
+    return cache
+
+
+def save_location_cache(cache, cache_file, model_name):
+    entries = {}
+    if os.path.exists(cache_file):
+        with open(cache_file) as f:
+            entries = json.load(f)
+    entries[_model_key(model_name)] = cache
+
+    os.makedirs(os.path.dirname(cache_file) or '.', exist_ok=True)
+    tmp_file = f"{cache_file}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(entries, f)
+    os.replace(tmp_file, cache_file)
+
+
+def resolve_locations(texts, nlp, cache, batch_size=1000):
+    # Same result as texts.apply(lambda x: extract_location(x, nlp)), but every distinct string goes
+    # through spaCy at most once and results are remembered in `cache` (string -> GPE) across calls
+    texts = pd.Series(texts)
+    missing = texts.isna()
+    pending = [text for text in pd.unique(texts[~missing]) if text not in cache]
+
+    if pending:
+        logging.info(f"Resolving {len(pending)} new location strings with spaCy ({len(cache)} already cached)...")
+        if isinstance(nlp, LazyModel):
+            nlp = nlp.get()
+        disabled = [name for name in UNUSED_NER_PIPES if name in nlp.pipe_names]
+        with nlp.select_pipes(disable=disabled):
+            for text, doc in zip(pending, nlp.pipe(pending, batch_size=batch_size)):
+                cache[text] = _first_gpe(doc)
+
+    return texts.map(cache).where(~missing, "")
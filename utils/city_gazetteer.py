@@ -0,0 +1,164 @@
+import csv
+import os
+import re
+from itertools import combinations
+
+GAZETTEER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'city_gazetteer.csv')
+WORD_RE = re.compile(r"[A-Za-z]+")
+# Words that introduce the two ends of a route, and how many words may sit between the origin and "to".
+# The spellings of "from" are searched with str.find, which is several times faster than a regex scan.
+ORIGIN_SPELLINGS = ('from', 'From', 'FROM')
+DESTINATION_WORD = 'to'
+MAX_GAP_WORDS = 4
+# Only this many characters after a "from" are split into words, enough for both cities and the gap
+WINDOW_CHARS = 200
+# Misspellings are matched within 1 edit for names of 5+ characters and within 2 edits from 9 characters on
+FUZZY_MIN_LENGTH = 5
+FUZZY_TWO_EDITS_LENGTH = 9
+# Fuzzy lookups are remembered per Gazetteer; the memo is cleared when it grows past this many spans
+FUZZY_CACHE_SIZE = 100000
+
+
+def _key(word):
+    # All-caps words of an alias ("LAX", "NYC", the "D" and "C" of "D.C.") are codes and only match in
+    # capitals, so "sea" or "den" in a sentence are not mistaken for SEA or DEN; every other word is lowercased
+    return word if word.isupper() else word.lower()
+
+
+def _origin_ends(transcript):
+    # Positions right after every standalone "from" in the transcript, in order
+    ends = []
+    for spelling in ORIGIN_SPELLINGS:
+        start = transcript.find(spelling)
+        while start != -1:
+            end = start + len(spelling)
+            standalone = start == 0 or not transcript[start - 1].isalnum()
+            if standalone and (end == len(transcript) or not transcript[end].isalnum()):
+                ends.append(end)
+            start = transcript.find(spelling, end)
+    return sorted(ends)
+
+
+def max_edits(length):
+    if length >= FUZZY_TWO_EDITS_LENGTH:
+        return 2
+    return 1 if length >= FUZZY_MIN_LENGTH else 0
+
+
+def _deletions(word, edits):
+    # word with up to `edits` characters removed, word itself included
+    variants = {word}
+    for count in range(1, min(edits, len(word) - 1) + 1):
+        for positions in combinations(range(len(word)), count):
+            variants.add(''.join(char for i, char in enumerate(word) if i not in positions))
+    return variants
+
+
+def edit_distance(a, b, limit):
+    # Optimal string alignment distance (an adjacent swap counts as one edit); anything above limit is limit + 1
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+    return current[-1]
+
+
+class Gazetteer:
+    # City names, aliases and airport codes in a token trie, plus a deletion index over the spelled-out names
+    # for misspellings. A trie node is a dict of word -> child node; the city of an alias that ends at a node
+    # is stored under the None key.
+    def __init__(self, aliases):
+        self.trie = {}
+        self.max_words = 1
+        self.fuzzy_index = {}
+        for city, alias in aliases:
+            words = [_key(word) for word in WORD_RE.findall(alias)]
+            if not words:
+                continue
+            node = self.trie
+            for word in words:
+                node = node.setdefault(word, {})
+            node[None] = city
+            self.max_words = max(self.max_words, len(words))
+
+            name = ' '.join(words)
+            if name.islower() and max_edits(len(name)):
+                for variant in _deletions(name, 2):
+                    self.fuzzy_index.setdefault(variant, set()).add((name, city))
+        self._fuzzy_matches = {}
+
+    def match(self, words, start):
+        # (city, end) of the longest alias at words[start:], misspelled ones included; None when there is none
+        node, found = self.trie, None
+        for end in range(start, min(start + self.max_words, len(words))):
+            word = words[end]
+            node = node.get(word) or node.get(word.lower())
+            if node is None:
+                break
+            if None in node:
+                found = node[None], end + 1
+        if found or not self.fuzzy_index:
+            return found
+        for end in range(min(start + self.max_words, len(words)), start, -1):
+            city = self.fuzzy_match(' '.join(words[start:end]).lower())
+            if city:
+                return city, end
+        return None
+
+    def fuzzy_match(self, text):
+        # The city whose spelled-out name is closest to text within max_edits, ties going to the first alias
+        if text not in self._fuzzy_matches:
+            if len(self._fuzzy_matches) >= FUZZY_CACHE_SIZE:
+                self._fuzzy_matches.clear()
+            limit, best = max_edits(len(text)), None
+            if limit:
+                candidates = set()
+                for variant in _deletions(text, limit):
+                    candidates |= self.fuzzy_index.get(variant, set())
+                for name, city in sorted(candidates):
+                    distance = edit_distance(text, name, min(limit, max_edits(len(name))))
+                    if distance <= min(limit, max_edits(len(name))) and (best is None or distance < best[0]):
+                        best = distance, city
+            self._fuzzy_matches[text] = best[1] if best else None
+        return self._fuzzy_matches[text]
+
+    def extract_route(self, transcript):
+        # (travelling_from, travelling_to) of the first "from <city>" in the transcript, with the city after the
+        # "to" that follows it within MAX_GAP_WORDS words; '' for an end that is not found
+        if not isinstance(transcript, str):
+            return "", ""
+        for origin_end in _origin_ends(transcript):
+            window_end = origin_end + WINDOW_CHARS
+            words = WORD_RE.findall(transcript, origin_end, window_end)
+            if words and WORD_RE.fullmatch(transcript, window_end - 1, window_end + 1):
+                words.pop()  # cut off by the window
+            origin = self.match(words, 0)
+            if origin is None:
+                continue
+            city, end = origin
+            for j in range(end, min(end + MAX_GAP_WORDS + 1, len(words))):
+                if words[j].lower() == DESTINATION_WORD:
+                    destination = self.match(words, j + 1)
+                    if destination:
+                        return city, destination[0]
+            return city, ""
+        return "", ""
+
+    def extract_routes(self, transcripts):
+        # Chunk-friendly for map_chunks: the routes of many transcripts as two lists
+        routes = [self.extract_route(transcript) for transcript in transcripts]
+        return {'travelling_from': [route[0] for route in routes], 'travelling_to': [route[1] for route in routes]}
+
+
+def load_gazetteer(gazetteer_file=GAZETTEER_FILE):
+    # city,alias rows; every city should also be listed as an alias of itself
+    with open(gazetteer_file, newline='', encoding='utf-8') as f:
+        return Gazetteer((row['city'], row['alias']) for row in csv.DictReader(f))
@@ -1,28 +1,38 @@
 import logging
 
+import numpy as np
+import pandas as pd
+
 def clean_primary_call_reason(ccasr):
     logging.info("Cleaning 'primary_call_reason' column in the dataset...")
 
+    # Every distinct reason is cleaned once and the result is mapped back through the factorized codes
+    codes, uniques = pd.factorize(ccasr['primary_call_reason'])
+    reasons = pd.Series(list(uniques) + [np.nan], dtype=object)
+
     # Replace NaNs with empty strings and convert to lowercase
-    ccasr['primary_call_reason'] = ccasr['primary_call_reason'].fillna('').astype(str).str.lower()
+    reasons = reasons.fillna('').astype(str).str.lower()
 
     # Remove special characters
     logging.info("Removing special characters from 'primary_call_reason'...")
-    ccasr['primary_call_reason'] = ccasr['primary_call_reason'].str.replace(r'[^\w\s]', '', regex=True)
+    reasons = reasons.str.replace(r'[^\w\s]', '', regex=True)
 
     # Remove stopwords
     stop_words = ['and']
     logging.info("Removing stopwords from 'primary_call_reason'...")
-    ccasr['primary_call_reason'] = ccasr['primary_call_reason'].apply(
+    reasons = reasons.apply(
         lambda x: ' '.join(word for word in x.split() if word not in stop_words)
     )
 
     # Remove extra spaces
     logging.info("Removing extra spaces from 'primary_call_reason'...")
-    ccasr['primary_call_reason'] = ccasr['primary_call_reason'].str.replace(r'\s+', '', regex=True)
+    reasons = reasons.str.replace(r'\s+', '', regex=True)
 
     # Replace empty values with 'othertopics'
     logging.info("Replacing empty values in 'primary_call_reason' with 'othertopics'...")
-    ccasr['primary_call_reason'] = ccasr['primary_call_reason'].replace('', 'othertopics')
+    reasons = reasons.replace('', 'othertopics')
+
+    # NaN rows have code -1, which picks the cleaned NaN entry appended at the end
+    ccasr['primary_call_reason'] = pd.Categorical(reasons.to_numpy()[codes])
 
-    return ccasr
\ No newline at end of file
+    return ccasr
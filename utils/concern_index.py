@@ -0,0 +1,184 @@
+import logging
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from .turn_table import extract_get_details_concerns
+from .output_store import current_derived, load_fingerprinted, read_output, save_fingerprinted
+
+CONCERN_INDEX_DIR = 'output/concern_index'
+DOCS_FILE = 'docs.parquet'
+POSTINGS_FILE = 'postings.parquet'
+# Phrases of up to this many words are indexed, enough for every keyword in get_details_metrics.py
+MAX_PHRASE_WORDS = 3
+WORD_RE = re.compile(r'\w+')
+DOC_COLUMNS = ['call_id', 'reason_label', 'travelling_from', 'travelling_to', 'call_date', 'aht', 'ast']
+INDEX_SOURCE_COLUMNS = DOC_COLUMNS + ['call_transcript']
+
+
+def dialogue_phrases(dialogue):
+    # Every run of 1 to MAX_PHRASE_WORDS words, as the lowercased text from the first word to the last.
+    # re.search(r'\b' + keyword + r'\b', dialogue, re.IGNORECASE) finds a keyword exactly when it is one of them.
+    if not dialogue:
+        return set()
+    dialogue = dialogue.lower()
+    words = [match.span() for match in WORD_RE.finditer(dialogue)]
+    phrases = set()
+    for i, (start, _) in enumerate(words):
+        for _, end in words[i:i + MAX_PHRASE_WORDS]:
+            phrases.add(dialogue[start:end])
+    return phrases
+
+
+class ConcernIndex:
+    # Posting lists of the customer answers: the sorted row numbers of every phrase, stored back to back in
+    # rows and delimited by offsets. docs holds the filterable attributes of each row.
+    def __init__(self, docs, phrases, offsets, rows, fingerprint=None):
+        self.docs = docs
+        self.phrases = list(phrases)
+        self.positions = {phrase: i for i, phrase in enumerate(self.phrases)}
+        self.offsets = offsets
+        self.rows = rows
+        self.fingerprint = fingerprint
+        # Lazily built lookups, so repeated queries (e.g. from query_server.py) skip the set operations
+        self._keyword_matches = {}
+        self._attribute_rows = {}
+
+    def rows_with(self, keyword):
+        keyword = keyword.lower()
+        if len(WORD_RE.findall(keyword)) > MAX_PHRASE_WORDS:
+            raise ValueError(f"'{keyword}' is longer than the {MAX_PHRASE_WORDS} words kept in the concern index.")
+        position = self.positions.get(keyword)
+        if position is None:
+            return self.rows[:0]
+        return self.rows[self.offsets[position]:self.offsets[position + 1]]
+
+    def rows_with_any(self, keywords):
+        keywords = tuple(keywords)
+        if keywords not in self._keyword_matches:
+            matched = [self.rows_with(keyword) for keyword in keywords]
+            self._keyword_matches[keywords] = np.unique(np.concatenate(matched)) if matched else self.rows[:0]
+        return self._keyword_matches[keywords]
+
+    def rows_where(self, column, value):
+        # Posting list of an attribute value: the rows where docs[column] == value
+        if column not in self._attribute_rows:
+            self._attribute_rows[column] = self.docs.groupby(column, sort=False).indices
+        return self._attribute_rows[column].get(value, self.rows[:0])
+
+    def select(self, reason_label=None, travelling_from=None, travelling_to=None, date_from=None, date_to=None):
+        # Boolean mask over the rows for the attribute filters; None leaves an attribute unfiltered
+        docs = self.docs
+        selected = np.ones(len(docs), dtype=bool)
+        for column, value in [('reason_label', reason_label), ('travelling_from', travelling_from),
+                              ('travelling_to', travelling_to)]:
+            if value:
+                matching = np.zeros(len(docs), dtype=bool)
+                matching[self.rows_where(column, value)] = True
+                selected &= matching
+        if date_from:
+            selected &= (docs['call_date'] >= pd.Timestamp(date_from)).to_numpy(dtype=bool)
+        if date_to:
+            selected &= (docs['call_date'] <= pd.Timestamp(date_to)).to_numpy(dtype=bool)
+        return selected
+
+
+def build_concern_index(df):
+    logging.info(f"Indexing the customer answers of {len(df)} calls...")
+    docs = df[DOC_COLUMNS].reset_index(drop=True)
+    docs['call_date'] = pd.to_datetime(docs['call_date'])
+    for column in ['reason_label', 'travelling_from', 'travelling_to']:
+        docs[column] = docs[column].astype(object)
+
+    postings = {}
+    for row, dialogue in enumerate(extract_get_details_concerns(df['call_transcript'])):
+        for phrase in dialogue_phrases(dialogue):
+            postings.setdefault(phrase, []).append(row)
+
+    phrases = sorted(postings)
+    offsets = np.zeros(len(phrases) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(postings[phrase]) for phrase in phrases])
+    rows = np.array([row for phrase in phrases for row in postings[phrase]], dtype=np.int32)
+    return ConcernIndex(docs, phrases, offsets, rows)
+
+
+def save_concern_index(index, fingerprint, index_dir=CONCERN_INDEX_DIR):
+    import pyarrow as pa
+
+    postings = pa.table({
+        'phrase': pa.array(index.phrases, type=pa.string()),
+        'rows': pa.ListArray.from_arrays(pa.array(index.offsets, type=pa.int32()), pa.array(index.rows)),
+    })
+    docs = pa.Table.from_pandas(index.docs, preserve_index=False)
+    save_fingerprinted({os.path.join(index_dir, DOCS_FILE): docs, os.path.join(index_dir, POSTINGS_FILE): postings},
+                       fingerprint)
+    index.fingerprint = fingerprint
+    logging.info(f"Concern index with {len(index.phrases)} phrases over {len(index.docs)} calls saved to {index_dir}.")
+
+
+def load_concern_index(index_dir=CONCERN_INDEX_DIR):
+    # The stored index, or None when it is missing or its two files come from different builds
+    tables, fingerprint = load_fingerprinted([os.path.join(index_dir, name) for name in (DOCS_FILE, POSTINGS_FILE)],
+                                             memory_map=True)
+    if tables is None:
+        return None
+    docs, postings = tables
+    rows = postings.column('rows').combine_chunks()
+    return ConcernIndex(
+        docs.to_pandas(), postings.column('phrase').to_pylist(), rows.offsets.to_numpy(),
+        rows.values.to_numpy(), fingerprint
+    )
+
+
+def index_from_output(output_file, date_from=None, date_to=None):
+    return build_concern_index(read_output(columns=INDEX_SOURCE_COLUMNS, output_file=output_file,
+                                           date_from=date_from, date_to=date_to))
+
+
+def current_concern_index(output_file=None, index_dir=CONCERN_INDEX_DIR, date_from=None, date_to=None):
+    # The index of the current processed dataset, rebuilt only when the dataset changed since it was stored.
+    # A stale index asked for a date window of a partitioned dataset is built from the partitions of that
+    # window only and not stored.
+    def load():
+        index = load_concern_index(index_dir)
+        return index, index.fingerprint if index is not None else None
+
+    index, _ = current_derived(
+        output_file, load, lambda index, fingerprint: save_concern_index(index, fingerprint, index_dir),
+        index_from_output, date_from, date_to,
+    )
+    return index
+
+
+def concern_breakdown(index, concerns, **filters):
+    # Frequency and average AHT/AST of the calls that mention any keyword of each concern
+    selected = index.select(**filters)
+    aht = index.docs['aht'].to_numpy()
+    ast = index.docs['ast'].to_numpy()
+    concern_data = []
+    for concern, keywords in concerns.items():
+        matched = index.rows_with_any(keywords)
+        matched = matched[selected[matched]]
+        count = len(matched)
+        avg_aht = aht[matched].sum() / count if count else 0
+        avg_ast = ast[matched].sum() / count if count else 0
+        concern_data.append([concern, count, round(avg_aht, 2), round(avg_ast, 2)])
+    return pd.DataFrame(concern_data, columns=['Concern', 'Frequency', 'Average AHT (mins)', 'Average AST (mins)'])
+
+
+def route_concern_matrix(index, concerns, **filters):
+    # Calls per (travelling_from, travelling_to) route that mention each concern, for every route at once
+    selected = index.select(**filters)
+    routes = pd.MultiIndex.from_arrays([index.docs['travelling_from'].fillna(''), index.docs['travelling_to'].fillna('')])
+    route_codes, route_values = pd.factorize(routes)
+    route_values = route_values.set_names(['travelling_from', 'travelling_to'])
+    matrix = pd.DataFrame(
+        {'Calls': np.bincount(route_codes[selected], minlength=len(route_values))}, index=route_values
+    )
+    for concern, keywords in concerns.items():
+        matched = index.rows_with_any(keywords)
+        matched = matched[selected[matched]]
+        matrix[concern] = np.bincount(route_codes[matched], minlength=len(route_values))
+    return matrix[matrix['Calls'] > 0].sort_index().reset_index()
@@ -1,16 +1,78 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
 import logging
+from .dtype_schema import (
+    CSV_SCHEMAS, INPUT_SUFFIXES, check_header, check_timestamps, log_memory_usage, read_table_with_schema
+)
+
+DATA_DIR = 'data'
+LOOKUP_TABLES = ['customers', 'reason', 'sentiment']
+
+
+def input_path(name, data_dir=DATA_DIR):
+    # data/<name>.csv, or its gzip/zstd-compressed version
+    candidates = [os.path.join(data_dir, name + suffix) for suffix in INPUT_SUFFIXES]
+    for path in candidates:
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(f"No input file for '{name}', expected one of {candidates}.")
+
+
+def validate_inputs(names, data_dir=DATA_DIR):
+    # Finds every input and checks its header against the contract before anything is loaded
+    paths = {name: input_path(name, data_dir) for name in names}
+    for name, path in paths.items():
+        check_header(path, name)
+    return paths
+
+
+def read_inputs(names, data_dir=DATA_DIR):
+    # The files are read concurrently; Arrow parses each of them on its own thread pool outside the GIL
+    paths = validate_inputs(names, data_dir)
+    logging.info(f"Reading {', '.join(paths.values())}...")
+    with ThreadPoolExecutor(max_workers=len(paths)) as executor:
+        tables = dict(zip(paths, executor.map(read_table_with_schema, paths.values(), paths)))
+    return [tables[name] for name in names]
+
 
-def load_csv_data():
+def load_csv_data(data_dir=DATA_DIR):
     logging.info("Reading CSV files...")
-    calls = pd.read_csv('data/calls.csv')
-    customers = pd.read_csv('data/customers.csv')
-    reasons = pd.read_csv('data/reason.csv')
-    sentiments = pd.read_csv('data/sentiment.csv')
-
-    logging.debug(f"Calls data shape: {calls.shape}, Sample:\n{calls.head()}")
-    logging.debug(f"Customers data shape: {customers.shape}, Sample:\n{customers.head()}")
-    logging.debug(f"Reasons data shape: {reasons.shape}, Sample:\n{reasons.head()}")
-    logging.debug(f"Sentiments data shape: {sentiments.shape}, Sample:\n{sentiments.head()}")
-    
-    return calls, customers, reasons, sentiments
\ No newline at end of file
+    calls, customers, reasons, sentiments = read_inputs(['calls'] + LOOKUP_TABLES, data_dir)
+
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(f"Calls data shape: {calls.shape}, Sample:\n{calls.head()}")
+    log_memory_usage(calls, "loading 'calls'")
+    _log_lookup_tables(customers, reasons, sentiments)
+
+    return calls, customers, reasons, sentiments
+
+
+def load_lookup_tables(data_dir=DATA_DIR):
+    # The tables that every call is joined against; they stay in memory for the whole run
+    customers, reasons, sentiments = read_inputs(LOOKUP_TABLES, data_dir)
+    _log_lookup_tables(customers, reasons, sentiments)
+    return customers, reasons, sentiments
+
+
+def _log_lookup_tables(customers, reasons, sentiments):
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(f"Customers data shape: {customers.shape}, Sample:\n{customers.head()}")
+        logging.debug(f"Reasons data shape: {reasons.shape}, Sample:\n{reasons.head()}")
+        logging.debug(f"Sentiments data shape: {sentiments.shape}, Sample:\n{sentiments.head()}")
+    for name, table in [('customers', customers), ('reasons', reasons), ('sentiments', sentiments)]:
+        log_memory_usage(table, f"loading '{name}'")
+
+
+def iter_call_chunks(chunk_size, data_dir=DATA_DIR):
+    # Streams the calls file so only `chunk_size` transcripts are held in memory at a time
+    import pyarrow as pa
+
+    path = validate_inputs(['calls'], data_dir)['calls']
+    logging.info(f"Streaming '{path}' in chunks of {chunk_size} rows...")
+    with pa.input_stream(path, compression='detect') as stream:
+        with pd.read_csv(stream, chunksize=chunk_size, **CSV_SCHEMAS['calls']) as reader:
+            for calls in reader:
+                check_timestamps(calls, path, 'calls')
+                yield calls.reset_index(drop=True)
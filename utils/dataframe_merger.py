@@ -1,17 +1,59 @@
 import pandas as pd
 import logging
+from pandas.api.extensions import ExtensionDtype, take
+
+def _lookup(keys, table, key, name):
+    # Indexes `table` by `key` once and returns its other columns aligned row by row with `keys`;
+    # keys without a match get missing values, like a left merge
+    indexed = table.set_index(key)
+    if not indexed.index.is_unique:
+        duplicated = indexed.index[indexed.index.duplicated()].unique()
+        raise pd.errors.MergeError(
+            f"'{name}' must have one row per '{key}', found duplicates for {len(duplicated)} keys "
+            f"(e.g. {list(duplicated[:5])})"
+        )
+
+    # Position of every key in the lookup table, -1 where it has no row
+    positions = indexed.index.get_indexer(keys)
+    attached = pd.DataFrame({
+        column: take(_values(indexed[column]), positions, allow_fill=True) for column in indexed.columns
+    })
+    logging.info(f"Attached {list(attached.columns)} from '{name}' on '{key}', "
+                 f"{(positions == -1).sum()} calls without a match.")
+    return attached
+
+
+def _values(series):
+    # Extension arrays (categoricals, Arrow strings, nullable ints) keep their dtype through take
+    return series.array if isinstance(series.dtype, ExtensionDtype) else series.to_numpy()
+
 
 def merge_data(calls, sentiments, reasons, customers):
-    logging.info("Merging 'calls' with 'sentiments' on 'call_id'...")
-    cas = pd.merge(calls, sentiments, on='call_id', how='left')
-    logging.debug(f"After merging 'calls' and 'sentiments', shape: {cas.shape}, Null counts:\n{cas.isnull().sum()}")
+    # Single-pass left join: sentiment and reason are one-to-one with calls on 'call_id', customers are
+    # many-to-one on 'customer_id'. Each lookup table is indexed once and its columns are attached to
+    # calls in one concat, so no intermediate merged frames are materialized.
+    if not calls['call_id'].is_unique:
+        raise pd.errors.MergeError("'calls' must have one row per 'call_id' for the one-to-one joins")
+
+    calls = calls.reset_index(drop=True)
+    call_ids = calls['call_id'].to_numpy()
+
+    logging.info("Attaching 'sentiments' and 'reasons' on 'call_id'...")
+    sentiment_columns = _lookup(call_ids, sentiments, 'call_id', 'sentiments')
+    reason_columns = _lookup(call_ids, reasons, 'call_id', 'reasons')
+
+    logging.info("Attaching 'customers' on 'customer_id'...")
+    customer_columns = _lookup(calls['customer_id'].to_numpy(), customers, 'customer_id', 'customers')
 
-    logging.info("Merging 'cas' with 'reasons' on 'call_id'...")
-    casr = pd.merge(cas, reasons, on='call_id', how='left')
-    logging.debug(f"After merging 'cas' with 'reasons', shape: {casr.shape}, Null counts:\n{casr.isnull().sum()}")
+    # The call record is the source of truth for the handling agent; sentiment's copy is only cross-checked
+    if 'agent_id' in sentiment_columns:
+        sentiment_agents = sentiment_columns.pop('agent_id')
+        mismatched = (sentiment_agents.notna() & (sentiment_agents != calls['agent_id'])).sum()
+        if mismatched:
+            logging.warning(f"{mismatched} calls have a different agent_id in 'sentiments', keeping the one from 'calls'.")
 
-    logging.info("Merging 'casr' with 'customers' on 'customer_id'...")
-    ccasr = pd.merge(casr, customers, on='customer_id', how='left')
-    logging.debug(f"After merging 'casr' with 'customers', shape: {ccasr.shape}, Null counts:\n{ccasr.isnull().sum()}")
+    ccasr = pd.concat([calls, sentiment_columns, reason_columns, customer_columns], axis=1)
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(f"After attaching all tables, shape: {ccasr.shape}, Null counts:\n{ccasr.isnull().sum()}")
 
-    return ccasr
\ No newline at end of file
+    return ccasr
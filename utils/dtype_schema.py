@@ -0,0 +1,137 @@
+import logging
+
+import pandas as pd
+
+DATETIME_FORMAT = '%m/%d/%Y %H:%M'
+
+try:
+    import pyarrow  # noqa: F401
+    TEXT_DTYPE = 'string[pyarrow]'
+except ImportError:
+    TEXT_DTYPE = 'string'
+
+# read_csv arguments per input file: low-cardinality labels become categoricals, free text is stored in Arrow
+# string buffers, timestamps are parsed while reading and numbers get the smallest type that fits the data.
+# Call, customer and agent IDs can be 10-digit numbers past 2**31, so all of them are int64.
+CSV_SCHEMAS = {
+    'calls': {
+        'dtype': {'call_id': 'int64', 'customer_id': 'int64', 'agent_id': 'int64', 'call_transcript': TEXT_DTYPE},
+        'parse_dates': ['call_start_datetime', 'agent_assigned_datetime', 'call_end_datetime'],
+        'date_format': DATETIME_FORMAT,
+    },
+    'customers': {
+        'dtype': {'customer_id': 'int64', 'customer_name': TEXT_DTYPE, 'elite_level_code': 'category'},
+    },
+    'reason': {
+        'dtype': {'call_id': 'int64', 'primary_call_reason': 'category'},
+    },
+    'sentiment': {
+        'dtype': {
+            'call_id': 'int64', 'agent_id': 'Int64', 'agent_tone': 'category', 'customer_tone': 'category',
+            'average_sentiment': 'float32', 'silence_percent_average': 'float32'
+        },
+    },
+}
+
+# Input files may be compressed; they are looked up with these suffixes in this order
+INPUT_SUFFIXES = ['.csv', '.csv.gz', '.csv.zst']
+
+# Columns produced by the pipeline itself, compacted once processing is done
+DERIVED_LABEL_COLUMNS = [
+    'travelling_from', 'travelling_to', 'reason_label', 'refund_offer', 'voucher_offer', 'voucher_value',
+    'sky_miles_offer', 'sky_miles_value', 'change_fee_offer', 'change_fee_value'
+]
+DERIVED_TEXT_COLUMNS = ['actual_call_reason', 'agent_solutions', 'customer_accepted']
+
+
+def read_csv_with_schema(path, name, **kwargs):
+    return pd.read_csv(path, **CSV_SCHEMAS[name], **kwargs)
+
+
+def schema_columns(name):
+    schema = CSV_SCHEMAS[name]
+    return list(schema['dtype']) + schema.get('parse_dates', [])
+
+
+def _arrow_type(dtype):
+    import pyarrow as pa
+
+    if dtype == 'category':
+        return pa.dictionary(pa.int32(), pa.string())
+    if dtype == TEXT_DTYPE:
+        return pa.large_string()
+    # Nullable extension types such as Int64 read as their numpy counterpart and are converted back afterwards
+    dtype = pd.api.types.pandas_dtype(dtype)
+    return pa.from_numpy_dtype(getattr(dtype, 'numpy_dtype', dtype))
+
+
+def check_header(path, name):
+    # Fails before any data is read when the file lacks a column of its contract; extra columns are allowed
+    import pyarrow.csv as pcsv
+
+    reader = pcsv.open_csv(path, parse_options=pcsv.ParseOptions(newlines_in_values=True))
+    columns = reader.schema.names
+    reader.close()
+    missing = [column for column in schema_columns(name) if column not in columns]
+    if missing:
+        raise ValueError(f"{path} does not match the '{name}' contract: missing columns {missing} "
+                         f"(found {columns}).")
+
+
+def read_table_with_schema(path, name):
+    # Same frame as read_csv_with_schema, read by Arrow's multi-threaded CSV reader, which also decompresses
+    # .gz/.zst files. Values that do not convert to their declared type, such as a timestamp not in
+    # DATETIME_FORMAT, fail the read with the file name instead of surfacing in a later step.
+    import pyarrow as pa
+    import pyarrow.csv as pcsv
+
+    schema = CSV_SCHEMAS[name]
+    column_types = {column: _arrow_type(dtype) for column, dtype in schema['dtype'].items()}
+    for column in schema.get('parse_dates', []):
+        column_types[column] = pa.timestamp('ns')
+    try:
+        table = pcsv.read_csv(
+            path,
+            parse_options=pcsv.ParseOptions(newlines_in_values=True),
+            convert_options=pcsv.ConvertOptions(column_types=column_types, timestamp_parsers=[DATETIME_FORMAT],
+                                                strings_can_be_null=True),
+        )
+    except pa.ArrowInvalid as error:
+        raise ValueError(f"{path} does not match the '{name}' contract: {error}") from error
+
+    df = table.to_pandas(types_mapper={pa.large_string(): pd.StringDtype('pyarrow')}.get)
+    # Nullable integers come back as floats and dictionaries in order of appearance; read_csv sorts categories
+    for column, dtype in schema['dtype'].items():
+        if dtype == 'category':
+            df[column] = df[column].cat.reorder_categories(sorted(df[column].cat.categories))
+        elif df[column].dtype != pd.api.types.pandas_dtype(dtype):
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def check_timestamps(df, path, name):
+    # read_csv leaves a timestamp column as text when a value does not match DATETIME_FORMAT
+    for column in CSV_SCHEMAS[name].get('parse_dates', []):
+        if not pd.api.types.is_datetime64_any_dtype(df[column]):
+            parsed = pd.to_datetime(df[column], format=DATETIME_FORMAT, errors='coerce')
+            bad = df[column][parsed.isna() & df[column].notna()]
+            raise ValueError(f"{path} does not match the '{name}' contract: {column} value {bad.iloc[0]!r} "
+                             f"is not a {DATETIME_FORMAT} timestamp.")
+
+
+def compact_frame(ccasr):
+    # Gives the columns added by the extraction stages the same compact types as the ingested ones
+    for column in DERIVED_LABEL_COLUMNS:
+        if column in ccasr and ccasr[column].dtype == object:
+            ccasr[column] = ccasr[column].astype('category')
+    for column in DERIVED_TEXT_COLUMNS:
+        if column in ccasr and ccasr[column].dtype == object:
+            ccasr[column] = ccasr[column].astype(TEXT_DTYPE)
+    return ccasr
+
+
+def log_memory_usage(df, stage):
+    # deep=True walks every Python object, so the report is only computed when it will be logged
+    if logging.getLogger().isEnabledFor(logging.INFO):
+        megabytes = df.memory_usage(deep=True).sum() / 1024 ** 2
+        logging.info(f"Memory after {stage}: {megabytes:.1f} MB for {len(df)} rows")
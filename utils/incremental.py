@@ -0,0 +1,94 @@
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from .near_duplicates import transcript_hashes
+from .output_store import CSV_OUTPUT_FILE, PARQUET_OUTPUT_FILE, PARTITIONED_OUTPUT_DIR, merge_into_output, remove_output
+
+LEDGER_FILE = 'output/processed_ledger.csv'
+# Every output format has its own ledger, since a call processed into one output is not in the others
+LEDGER_FILES = {
+    CSV_OUTPUT_FILE: LEDGER_FILE,
+    PARQUET_OUTPUT_FILE: 'output/processed_ledger_parquet.csv',
+    PARTITIONED_OUTPUT_DIR: 'output/processed_ledger_partitioned.csv',
+}
+
+
+def ledger_file_for(output_file):
+    return LEDGER_FILES[output_file]
+
+
+def load_ledger(ledger_file=LEDGER_FILE, output_file=None):
+    # call_id -> fingerprint of the merged input row it was processed from; None when nothing is recorded yet.
+    # A ledger whose output_file is gone describes calls that are no longer anywhere, so it counts as missing.
+    if not os.path.exists(ledger_file):
+        logging.info(f"No ledger found at {ledger_file}, every call will be processed.")
+        return None
+    if output_file is not None and not os.path.exists(output_file):
+        logging.warning(f"{ledger_file} exists but {output_file} does not, every call will be processed.")
+        return None
+
+    ledger = pd.read_csv(ledger_file, dtype={'row_hash': np.uint64, 'transcript_hash': 'UInt64'})
+    if 'transcript_hash' not in ledger:
+        # Ledgers written before transcripts were hashed; their calls are not matched as earlier duplicates
+        ledger['transcript_hash'] = pd.array([pd.NA] * len(ledger), dtype='UInt64')
+    logging.info(f"Loaded ledger with {len(ledger)} processed calls from {ledger_file}.")
+    return ledger
+
+
+def row_fingerprints(ccasr):
+    # Hash of every input column of the merged row, so edited sentiment/reason/customer data also counts as a change,
+    # and of the transcript alone, so later runs can flag calls that repeat the transcript of a processed one
+    return pd.DataFrame({
+        'call_id': ccasr['call_id'].to_numpy(),
+        'row_hash': pd.util.hash_pandas_object(ccasr, index=False).to_numpy(),
+        'transcript_hash': pd.array(transcript_hashes(ccasr['call_transcript']), dtype='UInt64'),
+    })
+
+
+def filter_unprocessed(ccasr, ledger):
+    # Returns the new or changed rows, their fingerprints, and the call_ids whose previous output must be replaced
+    fingerprints = row_fingerprints(ccasr)
+    if ledger is None:
+        return ccasr, fingerprints, np.array([], dtype=fingerprints['call_id'].dtype)
+
+    positions = pd.Index(ledger['call_id']).get_indexer(fingerprints['call_id'])
+    known = positions != -1
+    unchanged = np.zeros(len(ccasr), dtype=bool)
+    unchanged[known] = ledger['row_hash'].to_numpy()[positions[known]] == fingerprints['row_hash'].to_numpy()[known]
+
+    pending = ~unchanged
+    replaced_ids = fingerprints['call_id'].to_numpy()[known & pending]
+    logging.info(f"{pending.sum()} of {len(ccasr)} calls are new or changed ({len(replaced_ids)} changed).")
+    return (ccasr[pending].reset_index(drop=True), fingerprints[pending].reset_index(drop=True), replaced_ids)
+
+
+def update_ledger(ledger, fingerprints, ledger_file=LEDGER_FILE):
+    updated = pd.concat([frame for frame in [ledger, *fingerprints] if frame is not None], ignore_index=True)
+    # A changed call keeps its place with its new fingerprints, so the first call of a transcript stays first
+    places = pd.Index(updated['call_id'].drop_duplicates()).get_indexer(updated['call_id'])
+    updated = updated.assign(place=places).drop_duplicates('call_id', keep='last')
+    updated = updated.sort_values('place', kind='stable').drop(columns='place')
+    tmp_file = f"{ledger_file}.tmp"
+    updated.to_csv(tmp_file, index=False)
+    os.replace(tmp_file, ledger_file)
+    logging.info(f"Ledger updated, {len(updated)} processed calls recorded in {ledger_file}.")
+
+
+def apply_delta(output_file, delta_file, replaced_ids, rebuild=False):
+    # Merges the freshly processed rows in delta_file into output_file: new calls are appended and the
+    # previous rows of changed calls are dropped
+    if not os.path.exists(delta_file):
+        logging.info("No new or changed calls, the output is already up to date.")
+        return
+
+    if rebuild or not os.path.exists(output_file):
+        if os.path.isdir(output_file):
+            remove_output(output_file)  # os.replace cannot overwrite a non-empty directory
+        os.replace(delta_file, output_file)
+        return
+
+    logging.info(f"Merging {len(replaced_ids)} changed and the new calls into {output_file}...")
+    merge_into_output(output_file, delta_file, replaced_ids)
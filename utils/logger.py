@@ -1,5 +1,5 @@
 import logging
 
-def setup_logging():
-    logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+def setup_logging(level=logging.DEBUG):
+    logging.basicConfig(level=level, format='%(asctime)s - %(levelname)s - %(message)s')
     logging.info("Logging initialized successfully.")
\ No newline at end of file
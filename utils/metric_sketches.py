@@ -0,0 +1,205 @@
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from .output_store import current_derived, load_fingerprinted, read_output, save_fingerprinted, update_derived
+
+SKETCH_DIR = 'output/metric_sketches'
+QUANTILES_FILE = 'quantiles.parquet'
+DISTINCT_FILE = 'distinct.parquet'
+# Groups a sketch is kept for: (dimension, output columns that make up its key)
+SKETCH_DIMENSIONS = {
+    'agent': ['agent_id'],
+    'reason': ['reason_label'],
+    'route': ['travelling_from', 'travelling_to'],
+}
+ROUTE_SEPARATOR = ' -> '
+QUANTILE_MEASURES = ['aht', 'ast']
+REPORT_QUANTILES = [0.5, 0.9, 0.99]
+SKETCH_SOURCE_COLUMNS = (
+    [column for columns in SKETCH_DIMENSIONS.values() for column in columns] + ['call_date', 'customer_id']
+    + QUANTILE_MEASURES
+)
+# DDSketch: a value x > 0 is counted in bucket ceil(log_gamma(x)), so every quantile comes back within 1% of
+# the value at its rank. Zero (and the odd negative AST) share one bucket below all others.
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+ZERO_BUCKET = np.iinfo(np.int32).min
+# HyperLogLog with 2**12 registers per group and date, about 1.6% standard error on distinct customers.
+# Only the registers that were hit are stored, so a small group costs as many rows as it has customers.
+HLL_PRECISION = 12
+HLL_REGISTERS = 2 ** HLL_PRECISION
+# Both sketches are kept per group and call date, so they merge across chunks and runs (bucket counts add
+# up, registers take the maximum) and any date window can be merged at report time
+QUANTILE_KEYS = ['dimension', 'key', 'call_date', 'measure', 'bucket']
+DISTINCT_KEYS = ['dimension', 'key', 'call_date', 'register']
+
+
+def bucket_index(values):
+    values = np.asarray(values, dtype='float64')
+    buckets = np.full(len(values), ZERO_BUCKET, dtype=np.int32)
+    positive = values > 0
+    buckets[positive] = np.ceil(np.log(values[positive]) / np.log(GAMMA))
+    return buckets
+
+
+def bucket_value(buckets):
+    # The midpoint of a bucket in relative terms, within RELATIVE_ACCURACY of every value counted in it
+    buckets = np.asarray(buckets)
+    values = 2 * GAMMA ** buckets.astype('float64') / (GAMMA + 1)
+    return np.where(buckets == ZERO_BUCKET, 0.0, values)
+
+
+def hll_registers(values):
+    # (register, rank) of every value: the top HLL_PRECISION bits of its 64-bit hash pick the register, the
+    # rank is the position of the first set bit in the rest
+    hashes = pd.util.hash_array(np.asarray(values))
+    registers = (hashes >> np.uint64(64 - HLL_PRECISION)).astype(np.int16)
+    rest = hashes & np.uint64(2 ** (64 - HLL_PRECISION) - 1)
+    # frexp's exponent is the bit length of the integer
+    bit_length = np.frexp(rest.astype('float64'))[1]
+    # (float64 rounding can push the bit length of the largest values one too high)
+    ranks = np.maximum(64 - HLL_PRECISION - bit_length + 1, 1).astype(np.int8)
+    return registers, ranks
+
+
+def hll_estimate(ranks_per_register):
+    # Distinct count of one group from its non-empty registers (rank per register), with the linear counting
+    # correction for small counts
+    ranks = np.asarray(ranks_per_register, dtype='float64')
+    empty = HLL_REGISTERS - len(ranks)
+    alpha = 0.7213 / (1 + 1.079 / HLL_REGISTERS)
+    estimate = alpha * HLL_REGISTERS ** 2 / (np.exp2(-ranks).sum() + empty)
+    if estimate <= 2.5 * HLL_REGISTERS and empty:
+        estimate = HLL_REGISTERS * np.log(HLL_REGISTERS / empty)
+    return estimate
+
+
+def _group_keys(df, columns):
+    if len(columns) == 1:
+        keys = df[columns[0]].astype(object)
+        return np.where(keys.notna().to_numpy(), keys.astype(str).to_numpy(dtype=object), None)
+    # Routes are only kept when both ends were resolved
+    ends = [df[column].astype(object) for column in columns]
+    resolved = np.logical_and.reduce([(end.notna() & (end != '')).to_numpy() for end in ends])
+    keys = ends[0].astype(str)
+    for end in ends[1:]:
+        keys = keys + ROUTE_SEPARATOR + end.astype(str)
+    return np.where(resolved, keys.to_numpy(dtype=object), None)
+
+
+def build_sketches(df):
+    # (quantiles, distinct) sketch tables of a processed frame: DDSketch bucket counts of AHT and AST and
+    # HyperLogLog registers of customer_id, per dimension, key and call date
+    dates = pd.to_datetime(df['call_date']).to_numpy()
+    registers, ranks = hll_registers(pd.to_numeric(df['customer_id']).to_numpy())
+    quantiles, distinct = [], []
+    for dimension, columns in SKETCH_DIMENSIONS.items():
+        keys = _group_keys(df, columns)
+        has_key = np.array([key is not None for key in keys], dtype=bool)
+        for measure in QUANTILE_MEASURES:
+            values = pd.to_numeric(df[measure], errors='coerce').to_numpy(dtype='float64')
+            kept = has_key & ~np.isnan(values)
+            quantiles.append(pd.DataFrame({
+                'dimension': dimension, 'key': keys[kept], 'call_date': dates[kept], 'measure': measure,
+                'bucket': bucket_index(values[kept]), 'count': 1,
+            }).groupby(QUANTILE_KEYS, sort=False)['count'].sum().reset_index())
+        distinct.append(pd.DataFrame({
+            'dimension': dimension, 'key': keys[has_key], 'call_date': dates[has_key],
+            'register': registers[has_key], 'rank': ranks[has_key],
+        }).groupby(DISTINCT_KEYS, sort=False)['rank'].max().reset_index())
+    return pd.concat(quantiles, ignore_index=True), pd.concat(distinct, ignore_index=True)
+
+
+def merge_sketches(sketches):
+    sketches = [sketch for sketch in sketches if sketch is not None]
+    if not sketches:
+        return None
+    if len(sketches) == 1:
+        return sketches[0]
+    quantiles = pd.concat([quantile for quantile, _ in sketches], ignore_index=True)
+    distinct = pd.concat([distinct for _, distinct in sketches], ignore_index=True)
+    return (
+        quantiles.groupby(QUANTILE_KEYS, sort=False)['count'].sum().reset_index(),
+        distinct.groupby(DISTINCT_KEYS, sort=False)['rank'].max().reset_index(),
+    )
+
+
+def sketches_from_output(output_file, date_from=None, date_to=None):
+    logging.info(f"Building the metric sketches from {output_file}...")
+    return build_sketches(read_output(columns=SKETCH_SOURCE_COLUMNS, output_file=output_file,
+                                      date_from=date_from, date_to=date_to))
+
+
+def load_sketches(sketch_dir=SKETCH_DIR):
+    # The stored sketches and the fingerprint of the output they were built from, (None, None) if missing
+    paths = [os.path.join(sketch_dir, name) for name in (QUANTILES_FILE, DISTINCT_FILE)]
+    tables, fingerprint = load_fingerprinted(paths)
+    return (tuple(table.to_pandas() for table in tables), fingerprint) if tables else (None, None)
+
+
+def save_sketches(sketches, fingerprint, sketch_dir=SKETCH_DIR):
+    import pyarrow as pa
+
+    save_fingerprinted({os.path.join(sketch_dir, name): pa.Table.from_pandas(frame, preserve_index=False)
+                        for name, frame in zip((QUANTILES_FILE, DISTINCT_FILE), sketches)}, fingerprint)
+    logging.info(f"Metric sketches with {len(sketches[0])} buckets and {len(sketches[1])} registers saved to "
+                 f"{sketch_dir}.")
+
+
+def update_sketches(output_file, sketches, base_fingerprint=None, sketch_dir=SKETCH_DIR):
+    # Same contract as update_rollup: sketches of the whole output, or with base_fingerprint of the calls
+    # appended to the output that had that fingerprint
+    return update_derived(
+        'metric sketches', output_file, sketches, base_fingerprint, lambda: load_sketches(sketch_dir),
+        lambda sketches, fingerprint: save_sketches(sketches, fingerprint, sketch_dir),
+        lambda stored, sketches: merge_sketches([stored, sketches]), sketches_from_output,
+    )
+
+
+def current_sketches(output_file=None, sketch_dir=SKETCH_DIR, date_from=None, date_to=None):
+    # The sketches of the current processed dataset, rebuilt only when the dataset changed since they were
+    # stored; like current_rollup, a stale date window of a partitioned dataset only reads its partitions
+    sketches, _ = current_derived(
+        output_file, lambda: load_sketches(sketch_dir),
+        lambda sketches, fingerprint: save_sketches(sketches, fingerprint, sketch_dir), sketches_from_output,
+        date_from, date_to,
+    )
+    return sketches
+
+
+def _in_window(frame, date_from, date_to):
+    if date_from:
+        frame = frame[frame['call_date'] >= pd.Timestamp(date_from)]
+    if date_to:
+        frame = frame[frame['call_date'] <= pd.Timestamp(date_to)]
+    return frame
+
+
+def sketch_summary(sketches, dimension, key=None, date_from=None, date_to=None):
+    # p50/p90/p99 AHT and AST and distinct customers per key of a dimension, merged over the call dates
+    # from date_from to date_to
+    quantiles, distinct = (_in_window(frame[frame['dimension'] == dimension], date_from, date_to)
+                           for frame in sketches)
+    if key is not None:
+        quantiles, distinct = quantiles[quantiles['key'] == str(key)], distinct[distinct['key'] == str(key)]
+
+    buckets = quantiles.groupby(['key', 'measure', 'bucket'])['count'].sum().reset_index()
+    cumulative = buckets.groupby(['key', 'measure'])['count'].cumsum()
+    totals = buckets.groupby(['key', 'measure'])['count'].transform('sum')
+    first_measure = buckets[buckets['measure'] == QUANTILE_MEASURES[0]]
+    summary = first_measure.groupby('key')['count'].sum().rename('num_calls').to_frame()
+    for measure in QUANTILE_MEASURES:
+        for q in REPORT_QUANTILES:
+            # The bucket holding the value of rank q * (n - 1), counting from 0
+            reached = (buckets['measure'] == measure) & (cumulative > np.floor(q * (totals - 1)))
+            first = buckets[reached].groupby('key').head(1)
+            summary[f'{measure}_p{round(q * 100)}'] = pd.Series(
+                bucket_value(first['bucket'].to_numpy()).round(2), index=first['key'].to_numpy()
+            )
+
+    registers = distinct.groupby(['key', 'register'])['rank'].max().reset_index()
+    summary['distinct_customers'] = registers.groupby('key')['rank'].agg(hll_estimate).round().astype('int64')
+    return summary.rename_axis(dimension).reset_index()
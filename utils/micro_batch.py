@@ -0,0 +1,203 @@
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+from .dtype_schema import CSV_SCHEMAS, INPUT_SUFFIXES, check_header, read_table_with_schema
+
+# Files dropped into the watched directory are named after the table they add rows to, e.g.
+# calls_20240801_1205.csv.gz. Producers should write under another name (e.g. .part) and rename when done.
+DROP_TABLES = ['calls', 'sentiment', 'reason']
+ARCHIVE_DIR = 'processed'
+REJECTED_DIR = 'rejected'
+# Rows that arrived but were not merged into the output yet, kept across restarts of the daemon
+WATCH_STATE_DIR = 'output/watch_state'
+WATCH_METRICS_FILE = 'output/watch_metrics.jsonl'
+ARRIVED_COLUMN = 'arrived_at'
+
+
+def drop_table(file_name):
+    # The table a dropped file belongs to, None for anything else (including files still being written)
+    if not file_name.endswith(tuple(INPUT_SUFFIXES)):
+        return None
+    for name in DROP_TABLES:
+        if file_name.startswith(name):
+            return name
+    return None
+
+
+def arrival_time(path):
+    # When the file was written or, if later, renamed into the directory (a rename only updates st_ctime)
+    stat = os.stat(path)
+    return max(stat.st_mtime, stat.st_ctime)
+
+
+def _restore_dtypes(df, name):
+    # Concatenating rows from several files widens categoricals to object; the ingest dtypes are put back
+    return df.astype({column: dtype for column, dtype in CSV_SCHEMAS[name]['dtype'].items() if column in df})
+
+
+class DropDirectory:
+    # Calls, sentiments and reasons that arrived in drop_dir and were not processed yet. A call is released
+    # for processing once its sentiment and reason rows have arrived too, or after max_wait seconds without
+    # them. Sentiment and reason rows whose call does not arrive within max_wait are dropped.
+    def __init__(self, drop_dir, max_wait, state_dir=WATCH_STATE_DIR):
+        self.drop_dir = drop_dir
+        self.max_wait = max_wait
+        self.state_dir = state_dir
+        self.pending = {name: None for name in DROP_TABLES}
+        for name in DROP_TABLES:
+            path = os.path.join(state_dir, f"{name}.parquet")
+            if os.path.exists(path):
+                self.pending[name] = pd.read_parquet(path)
+        restored = sum(len(rows) for rows in self.pending.values() if rows is not None)
+        if restored:
+            logging.info(f"Restored {restored} pending rows from {state_dir}.")
+
+    def new_files(self):
+        names = [name for name in os.listdir(self.drop_dir)
+                 if drop_table(name) and os.path.isfile(os.path.join(self.drop_dir, name))]
+        return sorted(names, key=lambda name: arrival_time(os.path.join(self.drop_dir, name)))
+
+    def scan(self, names=None):
+        # Reads every new file, oldest first, into the pending rows. The rows are saved before the files are
+        # moved to processed/, so a crash in between reads a file twice at worst; duplicates keep the last row.
+        read = []
+        for name in self.new_files() if names is None else names:
+            path, table = os.path.join(self.drop_dir, name), drop_table(name)
+            try:
+                check_header(path, table)
+                rows = read_table_with_schema(path, table)
+            except (ValueError, OSError):
+                logging.exception(f"Could not read {path}, moving it to {REJECTED_DIR}/.")
+                self._move(name, REJECTED_DIR)
+                continue
+            rows[ARRIVED_COLUMN] = arrival_time(path)
+            self.pending[table] = self._append(self.pending[table], rows)
+            read.append(name)
+        if read:
+            self.save()
+            for name in read:
+                self._move(name, ARCHIVE_DIR)
+            logging.info(f"Read {len(read)} new files from {self.drop_dir}.")
+        return len(read)
+
+    def release(self, now=None):
+        # (calls, sentiments, reasons, arrived) of the calls that are ready, where arrived holds for every call
+        # when the last of its rows arrived; None when no call is ready. The released rows leave the pending
+        # ones in memory only, save() makes that permanent once they are in the output.
+        now = time.time() if now is None else now
+        calls = self.pending['calls']
+        if calls is None or calls.empty:
+            self._drop_orphans(now)
+            return None
+
+        has = {name: self._call_ids_in(name, calls['call_id']) for name in ('sentiment', 'reason')}
+        complete = has['sentiment'] & has['reason']
+        expired = calls[ARRIVED_COLUMN].to_numpy() <= now - self.max_wait
+        ready = complete | expired
+        if (expired & ~complete).any():
+            logging.warning(f"{(expired & ~complete).sum()} calls waited {self.max_wait}s for their sentiment or "
+                            f"reason rows and are processed without them.")
+        self.pending['calls'] = calls[~ready].reset_index(drop=True)
+        if not ready.any():
+            self._drop_orphans(now)
+            return None
+
+        calls = calls[ready].reset_index(drop=True)
+        arrived = calls[ARRIVED_COLUMN].to_numpy()
+        released = {}
+        for name in ('sentiment', 'reason'):
+            rows = self.pending[name]
+            if rows is None:
+                released[name] = _restore_dtypes(pd.DataFrame(columns=list(CSV_SCHEMAS[name]['dtype'])), name)
+                continue
+            taken = rows['call_id'].isin(calls['call_id'])
+            released[name] = rows[taken].reset_index(drop=True)
+            self.pending[name] = rows[~taken].reset_index(drop=True)
+            times = pd.Series(released[name][ARRIVED_COLUMN].to_numpy(), index=released[name]['call_id'])
+            arrived = np.fmax(arrived, times.reindex(calls['call_id']).to_numpy())
+        self._drop_orphans(now)
+        return (
+            _restore_dtypes(calls.drop(columns=ARRIVED_COLUMN), 'calls'),
+            _restore_dtypes(released['sentiment'].drop(columns=ARRIVED_COLUMN, errors='ignore'), 'sentiment'),
+            _restore_dtypes(released['reason'].drop(columns=ARRIVED_COLUMN, errors='ignore'), 'reason'),
+            arrived,
+        )
+
+    def backlog(self, now=None):
+        # What is still waiting: calls without their sentiment or reason rows, rows without their call, and
+        # files dropped since the last scan
+        now = time.time() if now is None else now
+        calls = self.pending['calls']
+        call_ids = calls['call_id'] if calls is not None else pd.Series([], dtype='int64')
+        waiting = {name: int((~self._call_ids_in(name, call_ids)).sum()) for name in ('sentiment', 'reason')}
+        orphans = sum(int((~rows['call_id'].isin(call_ids)).sum())
+                      for name, rows in self.pending.items() if name != 'calls' and rows is not None)
+        arrived = [rows[ARRIVED_COLUMN].min() for rows in self.pending.values() if rows is not None and len(rows)]
+        return {
+            'pending_calls': len(call_ids),
+            'waiting_for_sentiment': waiting['sentiment'],
+            'waiting_for_reason': waiting['reason'],
+            'rows_without_call': orphans,
+            'oldest_pending_seconds': round(now - min(arrived), 3) if arrived else None,
+            'unread_files': len(self.new_files()),
+        }
+
+    def save(self):
+        os.makedirs(self.state_dir, exist_ok=True)
+        for name, rows in self.pending.items():
+            path = os.path.join(self.state_dir, f"{name}.parquet")
+            if rows is None:
+                continue
+            rows.to_parquet(f"{path}.tmp", index=False)
+            os.replace(f"{path}.tmp", path)
+
+    def _call_ids_in(self, name, call_ids):
+        rows = self.pending[name]
+        if rows is None:
+            return np.zeros(len(call_ids), dtype=bool)
+        return call_ids.isin(rows['call_id']).to_numpy()
+
+    def _drop_orphans(self, now):
+        call_ids = self.pending['calls']['call_id'] if self.pending['calls'] is not None else pd.Series([])
+        for name in ('sentiment', 'reason'):
+            rows = self.pending[name]
+            if rows is None:
+                continue
+            stale = ~rows['call_id'].isin(call_ids) & (rows[ARRIVED_COLUMN] <= now - self.max_wait)
+            if stale.any():
+                logging.warning(f"Dropping {stale.sum()} '{name}' rows whose call did not arrive within "
+                                f"{self.max_wait}s.")
+                self.pending[name] = rows[~stale].reset_index(drop=True)
+
+    def _append(self, pending, rows):
+        if pending is not None and not pending.empty:
+            rows = pd.concat([pending, rows], ignore_index=True)
+        return rows.drop_duplicates('call_id', keep='last').reset_index(drop=True)
+
+    def _move(self, name, subdir):
+        os.makedirs(os.path.join(self.drop_dir, subdir), exist_ok=True)
+        shutil.move(os.path.join(self.drop_dir, name), os.path.join(self.drop_dir, subdir, name))
+
+
+def batch_metrics(arrived, finished):
+    # End-to-end latency of a micro-batch: from the moment the last row of a call arrived in the drop directory
+    # until the call was merged into the output
+    latency = finished - np.asarray(arrived, dtype=float)
+    return {
+        'calls': len(latency),
+        'latency_p50_seconds': round(float(np.percentile(latency, 50)), 3),
+        'latency_p95_seconds': round(float(np.percentile(latency, 95)), 3),
+        'latency_max_seconds': round(float(latency.max()), 3),
+    }
+
+
+def append_metrics(record, metrics_file=WATCH_METRICS_FILE):
+    os.makedirs(os.path.dirname(metrics_file) or '.', exist_ok=True)
+    with open(metrics_file, 'a') as f:
+        f.write(json.dumps(record, default=str) + '\n')
@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+
+DUPLICATE_COLUMN = 'duplicate_of'
+# Transcripts are compared as sets of shingles, every run of SHINGLE_WORDS consecutive lowercase words (split on
+# whitespace, punctuation stays with its word)
+SHINGLE_WORDS = 5
+# One-permutation MinHash: a single 64-bit hash per shingle, whose top bits pick one of MINHASH_BINS bins and
+# whose other bits compete for the minimum of that bin. The share of equal bins estimates the Jaccard similarity
+# of two transcripts (about 0.03 standard error around 0.9).
+MINHASH_BINS = 128
+BIN_BITS = 7
+EMPTY_BIN = np.iinfo(np.uint64).max
+# LSH: two transcripts become candidates when all bins of one band are equal; with 16 bands of 8 bins a pair
+# with a similarity of 0.8 is a candidate with 95% probability, one of 0.5 with 6%
+LSH_BANDS = 16
+ROWS_PER_BAND = MINHASH_BINS // LSH_BANDS
+# Odd multipliers of the polynomial shingle hash and of the band keys
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+BAND_MULTIPLIERS = (np.arange(1, ROWS_PER_BAND + 1, dtype=np.uint64) * np.uint64(2) + np.uint64(1)) * HASH_MULTIPLIER
+
+
+def _mix(hashes):
+    # splitmix64 finalizer, so the top bits of a shingle hash are as random as the bottom ones
+    hashes = (hashes ^ (hashes >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    hashes = (hashes ^ (hashes >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return hashes ^ (hashes >> np.uint64(31))
+
+
+def shingle_hashes(transcripts):
+    # (row, hash) of every shingle of every transcript; a transcript shorter than SHINGLE_WORDS words is one
+    # shingle, an empty one has none
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    values = pd.Series(transcripts, dtype=object).fillna('').to_numpy()
+    words = pc.utf8_split_whitespace(pc.utf8_lower(pa.array(values, type=pa.large_string())))
+    rows = np.repeat(np.arange(len(values)), pc.list_value_length(words).to_numpy())
+    words = words.flatten()
+    kept = pc.not_equal(words, '').to_numpy(zero_copy_only=False)
+    rows, words = rows[kept], words.filter(pa.array(kept))
+    # Every distinct word is hashed once
+    encoded = pc.dictionary_encode(words)
+    word_hashes = pd.util.hash_array(np.asarray(encoded.dictionary.to_numpy(zero_copy_only=False), dtype=object))
+    word_hashes = word_hashes[encoded.indices.to_numpy()]
+
+    n_words = np.bincount(rows, minlength=len(values))
+    shingle_count = np.maximum(n_words - SHINGLE_WORDS + 1, np.minimum(n_words, 1))
+    first_word = np.cumsum(n_words) - n_words
+    shingle_rows = np.repeat(np.arange(len(values)), shingle_count)
+    starts = np.arange(len(shingle_rows)) - np.repeat(np.cumsum(shingle_count) - shingle_count, shingle_count)
+    starts += first_word[shingle_rows]
+    ends = first_word[shingle_rows] + n_words[shingle_rows]
+    hashes = np.zeros(len(shingle_rows), dtype=np.uint64)
+    for offset in range(SHINGLE_WORDS):
+        # Positions past the end of a short transcript add nothing
+        positions = np.minimum(starts + offset, len(word_hashes) - 1)
+        hashes = hashes * HASH_MULTIPLIER + np.where(starts + offset < ends, word_hashes[positions], np.uint64(0))
+    return shingle_rows, _mix(hashes)
+
+
+def minhash_signatures(transcripts):
+    # One row of MINHASH_BINS minima per transcript, EMPTY_BIN where no shingle fell into the bin
+    rows, hashes = shingle_hashes(transcripts)
+    signatures = np.full((len(transcripts), MINHASH_BINS), EMPTY_BIN, dtype=np.uint64)
+    bins = (hashes >> np.uint64(64 - BIN_BITS)).astype(np.int64)
+    np.minimum.at(signatures.ravel(), rows * MINHASH_BINS + bins, hashes & np.uint64(2 ** (64 - BIN_BITS) - 1))
+    return signatures
+
+
+def estimated_similarity(signatures, rows, others):
+    # Estimated Jaccard similarity of the transcripts rows[i] and others[i], from the bins that are not empty
+    # in both
+    a, b = signatures[rows], signatures[others]
+    filled = (a != EMPTY_BIN) | (b != EMPTY_BIN)
+    equal = ((a == b) & filled).sum(axis=1)
+    return np.divide(equal, filled.sum(axis=1), out=np.zeros(len(rows)), where=filled.any(axis=1))
+
+
+def _near_representatives(transcripts, threshold):
+    # Position of the representative of every transcript: the first transcript whose estimated similarity to it
+    # is at least threshold, itself when there is none
+    signatures = minhash_signatures(transcripts)
+    positions = np.arange(len(signatures))
+    has_shingles = (signatures != EMPTY_BIN).any(axis=1)
+    representatives = positions.copy()
+    for band in range(LSH_BANDS):
+        keys = (signatures[:, band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND] * BAND_MULTIPLIERS).sum(axis=1)
+        # The first transcript in each bucket is the candidate of all the others in it
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        candidates = first[inverse]
+        checked = (candidates < representatives) & has_shingles
+        similar = estimated_similarity(signatures, positions[checked], candidates[checked]) >= threshold
+        representatives[np.flatnonzero(checked)[similar]] = candidates[checked][similar]
+
+    # A candidate can have an earlier representative itself; a transcript follows it there only when it is
+    # similar enough to that one too, otherwise it represents itself
+    while True:
+        hops = representatives[representatives]
+        moved = np.flatnonzero(hops != representatives)
+        if not len(moved):
+            return representatives
+        similar = estimated_similarity(signatures, moved, hops[moved]) >= threshold
+        representatives[moved] = np.where(similar, hops[moved], moved)
+
+
+def find_duplicates(transcripts, threshold=None):
+    # Position of the representative of every transcript, the first of its cluster, and the number of exact and
+    # near duplicates. Identical transcripts always share a representative; with a threshold below 1, so do
+    # transcripts whose estimated shingle similarity to the representative is at least threshold.
+    codes, uniques = pd.factorize(pd.Series(transcripts, dtype=object).fillna(''))
+    first = np.full(len(uniques), len(codes), dtype=np.int64)
+    np.minimum.at(first, codes, np.arange(len(codes)))
+    clusters = np.arange(len(uniques))
+    if threshold is not None and threshold < 1 and len(uniques) > 1:
+        clusters = _near_representatives(np.asarray(uniques, dtype=object), threshold)
+    representatives = first[clusters[codes]]
+    exact = len(codes) - len(uniques)
+    return representatives, exact, len(uniques) - int((clusters == np.arange(len(uniques))).sum())
+
+
+def expand(frame, representatives, index):
+    # Rows computed for the representatives only (in order of position), repeated for every call they stand for
+    positions = np.searchsorted(np.unique(representatives), representatives)
+    return frame.iloc[positions].set_axis(index)
+
+
+def transcript_hashes(transcripts):
+    # 64-bit hash of every transcript, the key identical transcripts are matched on across frames and runs
+    return pd.util.hash_array(pd.Series(transcripts, dtype=object).fillna('').to_numpy())
+
+
+def _first_calls(call_ids, hashes, earlier):
+    # call_id of the first call with each transcript hash, counting the calls of earlier (call_id and
+    # transcript_hash of the calls processed before, in order) before these ones. A call that is in earlier too
+    # keeps its place there but counts with its current transcript.
+    earlier = earlier[earlier['transcript_hash'].notna()]
+    ids = np.concatenate([earlier['call_id'].to_numpy(dtype='int64'), np.asarray(call_ids, dtype='int64')])
+    all_hashes = np.concatenate([earlier['transcript_hash'].to_numpy(dtype=np.uint64), hashes])
+    places = pd.Series(np.arange(len(ids))).groupby(ids).transform('first').to_numpy()
+    current = ~pd.Series(ids).duplicated(keep='last').to_numpy()
+    order = np.flatnonzero(current)[np.argsort(places[current], kind='stable')]
+    unique_hashes, first = np.unique(all_hashes[order], return_index=True)
+    return ids[order][first][np.searchsorted(unique_hashes, hashes)]
+
+
+def duplicate_of(call_ids, representatives, hashes=None, earlier=None):
+    # call_id of the representative of every duplicate call, null for the representatives themselves. With
+    # earlier (see _first_calls), a call whose transcript an earlier call already had points to that call
+    # instead, and so does its cluster when its representative's transcript came earlier.
+    call_ids = np.asarray(call_ids)
+    if earlier is None or earlier.empty:
+        values = call_ids[representatives]
+    else:
+        first = _first_calls(call_ids, hashes, earlier)
+        values = np.where(first != call_ids, first, first[representatives])
+    values = pd.array(values, dtype='Int64')
+    values[values == pd.array(call_ids, dtype='Int64')] = pd.NA
+    return values
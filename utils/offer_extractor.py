@@ -1,6 +1,99 @@
 import re
 
-def extract_offers(agent_solution, reason_label):
+import numpy as np
+
+OFFER_COLUMNS = [
+    'refund_offer', 'voucher_offer', 'voucher_value', 'sky_miles_offer',
+    'sky_miles_value', 'change_fee_offer', 'change_fee_value'
+]
+
+# Reason labels for which refund, voucher and SkyMiles offers are extracted
+OFFER_REASON_LABELS = {
+    'Delayed Flight', 'Missed Connecting Flight', 'Complaint', 'Miscellaneous Issue', 'Cancelled',
+    'Baggage Mishandling', 'Change Flight', 'Get Details', 'Cancelled Flight'
+}
+
+# Regex patterns of a full refund offer; any other call keeps the default "Refund not offered", so refusals
+# ("non-refundable", "unable to provide a full refund", ...) need no patterns of their own
+FULL_REFUND_PATTERNS = [
+    r"happy to provide you with a full refund",
+    r"happy to process that full refund",
+    r"go ahead and process that full refund",
+    r"happy to process a full refund",
+    r"let me offer you a full refund",
+    r"can offer you a full refund",
+    r"processed a full refund",
+    r"full refund is certainly justified",
+    r"go ahead and refund",
+    r"I can offer in compensation is a full refund"
+]
+
+VOUCHER_KEYWORDS = ['voucher', 'credit', 'offer']
+
+# Look for multiple values with a $ sign, allowing for commas in the number
+VOUCHER_VALUE_PATTERN = r'\$(\d{1,3}(?:,\d{3})*)'
+
+# A number (with or without commas) preceding "bonus" or "sky miles"
+SKY_MILES_KEYWORDS = ['bonus', 'sky miles']
+SKY_MILES_PATTERN = r'(\d{1,3}(?:,\d{3})*)\s*(' + '|'.join(SKY_MILES_KEYWORDS) + ')'
+
+# List of regex patterns indicating a waived change fee
+WAIVED_CHANGE_FEE_PATTERNS = [
+    r'waive(d)? the change fee',
+    r'remove(d)? the extra fee',
+    r'cancel(l)? the change fee',
+    r'no change fee will apply',
+    r'we will cover the change fee',
+    r'can waive'
+]
+
+# List of regex patterns indicating a change fee charge, in priority order; each captures the amount
+CHARGED_CHANGE_FEE_PATTERNS = [
+    r'additional (\d{1,3}(?:,\d{3})*)\$',  # Match "$ amount additional fee"
+    r'\$(\d{1,3}(?:,\d{3})*) change fee',   # Match "$ amount change fee"
+    r'change fee of \$(\d{1,3}(?:,\d{3})*)',  # Match "change fee of $xx"
+    r'\$(\d{1,3}(?:,\d{3})*) fee',  # Match "$xx fee"
+    r'\$(\d{1,3}(?:,\d{3})*) is pretty steep',  # Match "$xx is pretty steep"
+    r'\$(\d{1,3}(?:,\d{3})*) more',  # Match "$xx more"
+    r'\$(\d{1,3}(?:,\d{3})*) difference',  # Match "$xx difference"
+    r'\$(\d{1,3}(?:,\d{3})*) higher'  # Match "$xx higher"
+]
+
+
+REGEX_METACHARACTERS = '.^$*+?{}[]\\|()'
+
+
+def _compile(patterns):
+    # Plain phrases are checked with a substring search, which is much cheaper than a regex scan;
+    # everything else is compiled once here instead of going through re's pattern cache per call
+    return [pattern if not any(char in pattern for char in REGEX_METACHARACTERS) else re.compile(pattern)
+            for pattern in patterns]
+
+
+def _any_match(compiled_patterns, text):
+    for pattern in compiled_patterns:
+        if pattern in text if isinstance(pattern, str) else pattern.search(text):
+            return True
+    return False
+
+
+FULL_REFUND_MATCHERS = _compile(FULL_REFUND_PATTERNS)
+VOUCHER_VALUE_RE = re.compile(VOUCHER_VALUE_PATTERN)
+SKY_MILES_RE = re.compile(SKY_MILES_PATTERN)
+WAIVED_CHANGE_FEE_MATCHERS = _compile(WAIVED_CHANGE_FEE_PATTERNS)
+CHARGED_CHANGE_FEE_RES = [re.compile(pattern) for pattern in CHARGED_CHANGE_FEE_PATTERNS]
+
+
+def _charged_change_fee(agent_solution):
+    # The first listed pattern that matches wins, its first capture group is the amount
+    for pattern in CHARGED_CHANGE_FEE_RES:
+        change_fee_match = pattern.search(agent_solution)
+        if change_fee_match:
+            return change_fee_match.group(1)
+    return None
+
+
+def _match_offers(agent_solution, reason_label):
     agent_solution = agent_solution.lower()
 
     # Default values for each column
@@ -12,56 +105,22 @@ def extract_offers(agent_solution, reason_label):
     change_fee_offer = "Change fee not charged"
     change_fee_value = "N/A"
 
-    # Check if the reason label is one of the valid categories
-    if reason_label in ['Delayed Flight', 'Missed Connecting Flight', 'Complaint', 'Miscellaneous Issue', 'Cancelled', 'Baggage Mishandling', 'Change Flight', 'Get Details', 'Cancelled Flight']:
-        # Define regex patterns for full refund and no refund
-        full_refund_patterns = [
-            r"happy to provide you with a full refund",
-            r"happy to process that full refund",
-            r"go ahead and process that full refund",
-            r"happy to process a full refund",
-            r"let me offer you a full refund",
-            r"can offer you a full refund",
-            r"processed a full refund",
-            r"full refund is certainly justified",
-            r"go ahead and refund",
-            r"I can offer in compensation is a full refund"
-        ]
-
-        no_refund_patterns = [
-            r"unfortunately",
-            r"non-refundable",
-            r"unable to provide a full refund",
-            r"not able to offer a refund",
-            r"can't offer"
-        ]
-
-        # Check if any of the full refund patterns match
-        for pattern in full_refund_patterns:
-            if re.search(pattern, agent_solution):
-                refund_offer = "Refund offered"
-                break
-
-        # Check if no refund was given
-        if refund_offer == "Refund not offered":
-            for pattern in no_refund_patterns:
-                if re.search(pattern, agent_solution):
-                    refund_offer = "Refund not offered"
-                    break
+    if reason_label in OFFER_REASON_LABELS:
+        if _any_match(FULL_REFUND_MATCHERS, agent_solution):
+            refund_offer = "Refund offered"
 
         # Check for travel voucher or credit and extract the value if present
-        if 'voucher' in agent_solution or 'credit' in agent_solution or 'offer' in agent_solution:
+        if any(keyword in agent_solution for keyword in VOUCHER_KEYWORDS):
             voucher_offer = "Voucher offered"
-            # Look for multiple values with a $ sign before "voucher" or "credit", allowing for commas in the number
-            voucher_matches = re.findall(r'\$(\d{1,3}(?:,\d{3})*)', agent_solution)
+            voucher_matches = VOUCHER_VALUE_RE.findall(agent_solution)
             if voucher_matches:
                 # Use the value found later in the text and remove commas
                 voucher_value = f"{voucher_matches[-1].replace(',', '')}$"
-            else:
-                voucher_value = "N/A"
 
-        # Check for SkyMiles bonus by finding a number (with or without commas) preceding "bonus" or "sky miles"
-        bonus_match = re.search(r'(\d{1,3}(?:,\d{3})*)\s*(bonus|sky miles)', agent_solution)
+        # The number scan is only worth running when one of the keywords is present at all
+        bonus_match = None
+        if any(keyword in agent_solution for keyword in SKY_MILES_KEYWORDS):
+            bonus_match = SKY_MILES_RE.search(agent_solution)
         if bonus_match:
             sky_miles_value = bonus_match.group(1).replace(',', '')  # Clean up any commas in the SkyMiles value
             if sky_miles_value == "000":
@@ -69,54 +128,29 @@ def extract_offers(agent_solution, reason_label):
             else:
                 sky_miles_offer = "SkyMiles offered"
                 sky_miles_value = f"{sky_miles_value} SkyMiles"
-    
-    # Check for change fee information if the reason label is 'Change Flight'
+
     # Check for change fee information if the reason label is 'Change Flight'
     if reason_label == 'Change Flight':
-        # List of regex patterns indicating a waived change fee
-        waived_change_fee_patterns = [
-            r'waive(d)? the change fee',
-            r'remove(d)? the extra fee',
-            r'cancel(l)? the change fee',
-            r'no change fee will apply',
-            r'we will cover the change fee',
-            r'can waive'
-        ]
-
-        # Check if any of the waived change fee patterns match
-        for pattern in waived_change_fee_patterns:
-            if re.search(pattern, agent_solution):
-                change_fee_offer = "Change fee waived"
-                break
-
-        if change_fee_offer == "Change fee not charged":
-            # List of regex patterns indicating a change fee charge
-            charged_change_fee_patterns = [
-                r'additional (\d{1,3}(?:,\d{3})*)\$',  # Match "$ amount additional fee"
-                r'\$(\d{1,3}(?:,\d{3})*) change fee',   # Match "$ amount change fee"
-                r'change fee of \$(\d{1,3}(?:,\d{3})*)',  # Match "change fee of $xx"
-                r'\$(\d{1,3}(?:,\d{3})*) fee',  # Match "$xx fee"
-                r'\$(\d{1,3}(?:,\d{3})*) is pretty steep',  # Match "$xx is pretty steep"
-                r'\$(\d{1,3}(?:,\d{3})*) more',  # Match "$xx more"
-                r'\$(\d{1,3}(?:,\d{3})*) difference',  # Match "$xx difference"
-                r'\$(\d{1,3}(?:,\d{3})*) higher'  # Match "$xx higher"
-            ]
-
-            # Check for charged change fee and capture value
-            for pattern in charged_change_fee_patterns:
-                change_fee_match = re.search(pattern, agent_solution)
-                if change_fee_match:
-                    change_fee_offer = "Change fee charged"
-                    change_fee_value = f"{change_fee_match.group(1).replace(',', '')}$"
-                    break
+        if _any_match(WAIVED_CHANGE_FEE_MATCHERS, agent_solution):
+            change_fee_offer = "Change fee waived"
+        else:
+            charged_value = _charged_change_fee(agent_solution)
+            if charged_value is not None:
+                change_fee_offer = "Change fee charged"
+                change_fee_value = f"{charged_value.replace(',', '')}$"
+
+    return (refund_offer, voucher_offer, voucher_value, sky_miles_offer,
+            sky_miles_value, change_fee_offer, change_fee_value)
+
 
+def extract_offers(agent_solution, reason_label):
     # Return structured information as a dictionary
-    return {
-        'refund_offer': refund_offer,
-        'voucher_offer': voucher_offer,
-        'voucher_value': voucher_value,
-        'sky_miles_offer': sky_miles_offer,
-        'sky_miles_value': sky_miles_value,
-        'change_fee_offer': change_fee_offer,
-        'change_fee_value': change_fee_value
-    }
\ No newline at end of file
+    return dict(zip(OFFER_COLUMNS, _match_offers(agent_solution, reason_label)))
+
+
+def extract_offer_columns(agent_solutions, reason_labels):
+    # Column-level version of extract_offers: returns {column: array} for a whole frame at once
+    rows = [_match_offers(solution, label) for solution, label in zip(agent_solutions, reason_labels)]
+    if not rows:
+        return {column: np.array([], dtype=object) for column in OFFER_COLUMNS}
+    return {column: np.array(values, dtype=object) for column, values in zip(OFFER_COLUMNS, zip(*rows))}
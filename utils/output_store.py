@@ -0,0 +1,552 @@
+import csv
+import json
+import logging
+import os
+import shutil
+
+import pandas as pd
+
+from .transcript_store import STORED_TEXT_COLUMNS, read_transcripts
+
+CSV_OUTPUT_FILE = 'output/processed_dataset_with_ext.csv'
+PARQUET_OUTPUT_FILE = 'output/processed_dataset_with_ext.parquet'
+# A directory with one sub-directory of Parquet files per call_date and a manifest of their row counts and ranges
+PARTITIONED_OUTPUT_DIR = 'output/processed_dataset_with_ext_by_date'
+OUTPUT_FILES = {'csv': CSV_OUTPUT_FILE, 'parquet': PARQUET_OUTPUT_FILE, 'partitioned': PARTITIONED_OUTPUT_DIR}
+PARTITIONED_SUFFIX = '_by_date'
+PARTITION_COLUMN = 'call_date'
+# Hive's name for the partition of rows without a value
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+MANIFEST_FILE = '_manifest.json'
+# Columns whose min/max per file and partition are kept in the manifest
+STATS_COLUMNS = ['call_start_datetime', 'aht', 'ast']
+
+# Low-cardinality text columns, stored dictionary-encoded in Parquet and read back as pandas categoricals
+LABEL_COLUMNS = [
+    'agent_tone', 'customer_tone', 'primary_call_reason', 'elite_level_code', 'travelling_from', 'travelling_to', 'reason_label',
+    'refund_offer', 'voucher_offer', 'voucher_value', 'sky_miles_offer', 'sky_miles_value',
+    'change_fee_offer', 'change_fee_value'
+]
+PARQUET_COMPRESSION = 'zstd'
+OUTPUT_CHUNK_SIZE = 100000
+# Schema metadata key of the output_fingerprint a derived Parquet file (rollup, sketches, index) was built from
+FINGERPRINT_KEY = b'input_fingerprint'
+
+
+def output_file_for(output_format):
+    return OUTPUT_FILES[output_format]
+
+
+def _to_arrow(df, schema=None):
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for name in LABEL_COLUMNS:
+        if name in table.column_names:
+            index = table.column_names.index(name)
+            encoded = table.column(name).cast(pa.string()).dictionary_encode()
+            table = table.set_column(index, name, encoded)
+    # Later chunks are cast to the schema of the first one so every row group has the same types
+    return table if schema is None else table.cast(schema)
+
+
+def is_partitioned(output_file):
+    return output_file.endswith(PARTITIONED_SUFFIX)
+
+
+def remove_output(output_file):
+    if os.path.isdir(output_file):
+        shutil.rmtree(output_file)
+    elif os.path.exists(output_file):
+        os.remove(output_file)
+
+
+def _partition_key(value):
+    return NULL_PARTITION if value is None else str(value)
+
+
+def _partition_file(key, number):
+    return f"{PARTITION_COLUMN}={key}/part-{number:05d}.parquet"
+
+
+def _part_number(path):
+    return int(os.path.basename(path)[len('part-'):-len('.parquet')])
+
+
+def _split_partitions(table):
+    # (partition key, rows) for every call_date in the table
+    import pyarrow.compute as pc
+
+    dates = table.column(PARTITION_COLUMN)
+    for value in pc.unique(dates).to_pylist():
+        mask = pc.is_null(dates) if value is None else pc.equal(dates, value)
+        yield _partition_key(value), table.filter(mask)
+
+
+def _json_value(scalar):
+    value = scalar.as_py()
+    if isinstance(value, float) and value != value:
+        return None
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def _table_stats(table):
+    import pyarrow.compute as pc
+
+    stats = {'rows': table.num_rows, 'min': {}, 'max': {}}
+    for column in STATS_COLUMNS:
+        if column in table.column_names:
+            min_max = pc.min_max(table.column(column))
+            stats['min'][column] = _json_value(min_max['min'])
+            stats['max'][column] = _json_value(min_max['max'])
+    return stats
+
+
+def _merge_stats(entries):
+    # Row count and min/max over several files or pieces; timestamps are ISO strings, so they compare as text
+    merged = {'rows': 0, 'min': {}, 'max': {}}
+    for entry in entries:
+        merged['rows'] += entry['rows']
+        for bound, pick in (('min', min), ('max', max)):
+            for column, value in entry[bound].items():
+                current = merged[bound].get(column)
+                merged[bound][column] = value if current is None else current if value is None else pick(current, value)
+    return merged
+
+
+def load_manifest(output_dir):
+    with open(os.path.join(output_dir, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+def _write_manifest(output_dir, partitions, columns):
+    # Partition totals are derived from their files; the manifest is replaced last, so its modification
+    # time is the identity of the whole directory
+    for partition in partitions.values():
+        partition.update(_merge_stats(partition['files']))
+    manifest = {
+        'partition_column': PARTITION_COLUMN,
+        'columns': columns,
+        'rows': sum(partition['rows'] for partition in partitions.values()),
+        'partitions': dict(sorted(partitions.items())),
+    }
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(f"{path}.tmp", path)
+
+
+def partition_files(output_dir, date_from=None, date_to=None):
+    # Paths of the files of every partition between date_from and date_to (YYYY-MM-DD, both included).
+    # Calls without a date only belong to the unbounded window.
+    manifest = load_manifest(output_dir)
+    low = str(pd.Timestamp(date_from).date()) if date_from else None
+    high = str(pd.Timestamp(date_to).date()) if date_to else None
+    paths = []
+    for key, partition in manifest['partitions'].items():
+        if key == NULL_PARTITION and (low or high):
+            continue
+        if key != NULL_PARTITION and ((low and key < low) or (high and key > high)):
+            continue
+        paths.extend(os.path.join(output_dir, entry['path']) for entry in partition['files'])
+    return paths
+
+
+def _write_partitions(frames, output_dir):
+    # Each call_date gets one file that stays open while the frames stream in. The directory is built next to
+    # the output and swapped in at the end, so readers never see a half-written one.
+    import pyarrow.parquet as pq
+
+    tmp_dir = f"{output_dir}.tmp"
+    remove_output(tmp_dir)
+    writers, stats, schema, rows = {}, {}, None, 0
+    try:
+        for df in frames:
+            table = _to_arrow(df, schema)
+            schema = table.schema
+            os.makedirs(tmp_dir, exist_ok=True)
+            for key, part in _split_partitions(table):
+                if key not in writers:
+                    path = os.path.join(tmp_dir, _partition_file(key, 0))
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    writers[key] = pq.ParquetWriter(path, schema, compression=PARQUET_COMPRESSION)
+                    stats[key] = []
+                writers[key].write_table(part)
+                stats[key].append(_table_stats(part))
+            rows += len(df)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    if schema is None:
+        return rows
+
+    partitions = {key: {'files': [{'path': _partition_file(key, 0), **_merge_stats(pieces)}]}
+                  for key, pieces in stats.items()}
+    _write_manifest(tmp_dir, partitions, schema.names)
+    remove_output(output_dir)
+    os.replace(tmp_dir, output_dir)
+    return rows
+
+
+def write_frames(frames, output_file):
+    # Writes an iterable of processed frames to one CSV or Parquet file, or a directory partitioned by call_date,
+    # appending each frame as it arrives. Returns the number of rows written; nothing is created when there
+    # are no frames.
+    if is_partitioned(output_file):
+        return _write_partitions(frames, output_file)
+    rows = 0
+    if output_file.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        writer = None
+        try:
+            for df in frames:
+                table = _to_arrow(df, None if writer is None else writer.schema)
+                if writer is None:
+                    writer = pq.ParquetWriter(output_file, table.schema, compression=PARQUET_COMPRESSION)
+                writer.write_table(table)
+                rows += len(df)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        for chunk_number, df in enumerate(frames):
+            df.to_csv(output_file, index=False, mode='w' if chunk_number == 0 else 'a', header=chunk_number == 0)
+            rows += len(df)
+    return rows
+
+
+def _identity_file(output_file):
+    # The file that changes whenever the dataset does: the output itself, or the manifest of a partitioned one
+    return os.path.join(output_file, MANIFEST_FILE) if is_partitioned(output_file) else output_file
+
+
+def current_output_file():
+    # The most recently written pipeline output, whichever format it was written in
+    existing = [path for path in OUTPUT_FILES.values() if os.path.exists(_identity_file(path))]
+    if not existing:
+        raise FileNotFoundError(f"No processed dataset found, expected one of {list(OUTPUT_FILES.values())}. "
+                                f"Run main.py first.")
+    return max(existing, key=lambda path: os.path.getmtime(_identity_file(path)))
+
+
+def output_fingerprint(output_file):
+    # Cheap identity of a processed dataset: any rewrite changes its size or modification time
+    if output_file is None or not os.path.exists(_identity_file(output_file)):
+        return None
+    stat = os.stat(_identity_file(output_file))
+    return f"{os.path.basename(output_file)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def save_fingerprinted(tables, fingerprint):
+    # Writes {path: Arrow table} with the fingerprint of the output they were derived from in their metadata
+    import pyarrow.parquet as pq
+
+    for path, table in tables.items():
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), FINGERPRINT_KEY: fingerprint.encode()})
+        pq.write_table(table, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+
+
+def load_fingerprinted(paths, memory_map=False):
+    # The Arrow tables at paths and the fingerprint they were saved with, (None, None) when one of them is missing
+    # or they come from different builds
+    if not all(os.path.exists(path) for path in paths):
+        return None, None
+    import pyarrow.parquet as pq
+
+    tables = [pq.read_table(path, memory_map=memory_map) for path in paths]
+    fingerprints = {(table.schema.metadata or {}).get(FINGERPRINT_KEY) for table in tables}
+    if len(fingerprints) != 1 or None in fingerprints:
+        return None, None
+    return tables, fingerprints.pop().decode()
+
+
+def update_derived(name, output_file, derived, base_fingerprint, load, save, merge, build):
+    # The contract of every store derived from the output (agent rollup, metric sketches, call store): derived
+    # covers the whole output_file, or with base_fingerprint only the calls appended to the output that had that
+    # fingerprint. In the latter case merge(stored, derived) adds it to what load() returns if that still matches,
+    # otherwise, or when merge returns None, build(output_file) rebuilds it. save(derived, fingerprint) stores it.
+    if base_fingerprint is not None:
+        stored, stored_fingerprint = load()
+        if stored is not None and stored_fingerprint == base_fingerprint:
+            derived = merge(stored, derived)
+        else:
+            logging.info(f"The stored {name} does not match the previous output.")
+            derived = None
+    if derived is None:
+        derived = build(output_file)
+    save(derived, output_fingerprint(output_file))
+    return derived
+
+
+def current_derived(output_file, load, save, build, date_from=None, date_to=None):
+    # (store, fingerprint) of the current processed dataset, rebuilt only when the dataset changed since it was
+    # saved. A stale store asked for a date window of a partitioned dataset is built from the partitions of that
+    # window only, build(output_file, date_from, date_to), and not saved, as it does not cover the whole dataset.
+    output_file = output_file or current_output_file()
+    stored, fingerprint = load()
+    current_fingerprint = output_fingerprint(output_file)
+    if stored is None or fingerprint != current_fingerprint:
+        if (date_from or date_to) and is_partitioned(output_file):
+            return build(output_file, date_from, date_to), current_fingerprint
+        stored = build(output_file)
+        save(stored, current_fingerprint)
+    return stored, current_fingerprint
+
+
+def output_columns(output_file):
+    if is_partitioned(output_file):
+        return load_manifest(output_file)['columns']
+    if output_file.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        return pq.read_schema(output_file).names
+    return list(pd.read_csv(output_file, nrows=0).columns)
+
+
+def _table_to_frame(table):
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    # Dictionaries come back in order of first appearance; sorted categories keep groupby output ordered
+    for column in df.select_dtypes('category').columns:
+        df[column] = df[column].cat.reorder_categories(sorted(df[column].cat.categories))
+    return df
+
+
+def _read_partitions(columns, output_dir, date_from, date_to):
+    # Partitions hold whole days, so pruning them by the manifest is all the date filtering there is
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    paths = partition_files(output_dir, date_from, date_to)
+    tables = [pq.read_table(path, columns=columns, memory_map=True) for path in paths]
+    if tables:
+        return _table_to_frame(pa.concat_tables(tables))
+    all_paths = partition_files(output_dir)
+    if not all_paths:
+        return pd.DataFrame(columns=columns or load_manifest(output_dir)['columns'])
+    schema = pq.read_schema(all_paths[0])
+    return _table_to_frame(schema.empty_table().select(columns or schema.names))
+
+
+def _in_window(dates, date_from, date_to):
+    dates = pd.to_datetime(dates)
+    keep = pd.Series(True, index=dates.index)
+    if date_from:
+        keep &= dates >= pd.Timestamp(date_from)
+    if date_to:
+        keep &= dates <= pd.Timestamp(date_to)
+    return keep
+
+
+def _read_columns(columns, output_file, date_from=None, date_to=None):
+    if is_partitioned(output_file):
+        return _read_partitions(columns, output_file, date_from, date_to)
+    # A single file is read whole and filtered by call_date afterwards
+    windowed = bool(date_from or date_to)
+    read_columns = columns
+    if windowed and columns is not None and PARTITION_COLUMN not in columns:
+        read_columns = columns + [PARTITION_COLUMN]
+    if output_file.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        df = _table_to_frame(pq.read_table(output_file, columns=read_columns, memory_map=True))
+    else:
+        df = pd.read_csv(output_file, usecols=read_columns)
+    if windowed:
+        df = df[_in_window(df[PARTITION_COLUMN], date_from, date_to)].reset_index(drop=True)
+        if columns is not None:
+            df = df[columns]
+    return df
+
+
+def _add_stored_text(df, call_ids, stored):
+    # Fills in the text columns of a dataset written with main.py --transcript-store from the transcript store
+    from .turn_table import extract_info_columns
+
+    transcripts = read_transcripts(call_ids)
+    if 'call_transcript' in stored:
+        df['call_transcript'] = transcripts
+    if 'agent_solutions' in stored:
+        df['agent_solutions'] = extract_info_columns(transcripts)['agent_solutions']
+    return df
+
+
+def read_output(columns=None, output_file=None, date_from=None, date_to=None):
+    # Loads only the requested columns of the processed dataset, optionally only the calls from date_from to
+    # date_to (YYYY-MM-DD, both included). Parquet is memory-mapped and labels come back as categoricals; CSV
+    # falls back to read_csv with usecols. A partitioned output only opens the partitions in the window.
+    # Transcript text kept out of the dataset (main.py --transcript-store) is read from the transcript store
+    # only when one of its columns is requested.
+    output_file = output_file or current_output_file()
+    stored = []
+    if columns is not None and any(column in STORED_TEXT_COLUMNS for column in columns):
+        available = output_columns(output_file)
+        stored = [column for column in columns if column in STORED_TEXT_COLUMNS and column not in available]
+    if not stored:
+        return _read_columns(columns, output_file, date_from, date_to)
+
+    read_columns = [column for column in columns if column not in stored]
+    df = _read_columns(list(dict.fromkeys(read_columns + ['call_id'])), output_file, date_from, date_to)
+    df = _add_stored_text(df, df['call_id'].to_numpy(), stored)
+    return df[columns]
+
+
+def _copy_csv_rows(source_file, target, skip_header):
+    with open(source_file, newline='') as source:
+        if skip_header:
+            next(_csv_records(source), None)
+        shutil.copyfileobj(source, target)
+
+
+def _csv_records(source):
+    # (fields, raw text) of every record of a CSV file opened with newline='', so a record whose quoted
+    # transcript spans several lines is copied exactly as it was written
+    lines = []
+
+    def read_lines():
+        for line in source:
+            lines.append(line)
+            yield line
+
+    for fields in csv.reader(read_lines()):
+        yield fields, ''.join(lines)
+        lines.clear()
+
+
+def _check_csv_header(output_file, delta_file):
+    headers = []
+    for path in (output_file, delta_file):
+        with open(path, newline='') as f:
+            headers.append(next(csv.reader(f), None))
+    if headers[0] != headers[1]:
+        raise ValueError(f"{delta_file} has other columns than {output_file}: {headers[1]} instead of {headers[0]}")
+
+
+def _next_part_numbers(output_dir, partitions):
+    # First unused part number of every partition directory, counting files on disk that the manifest does not
+    # list (left by an interrupted merge), so a new file never overwrites one a reader may still open
+    numbers = {}
+    for key, partition in partitions.items():
+        directory = os.path.join(output_dir, f"{PARTITION_COLUMN}={key}")
+        names = [entry['path'] for entry in partition['files']]
+        if os.path.isdir(directory):
+            names += [name for name in os.listdir(directory) if name.startswith('part-') and name.endswith('.parquet')]
+        numbers[key] = max((_part_number(name) for name in names), default=-1) + 1
+    return numbers
+
+
+def _remove_unlisted(output_dir, partitions):
+    # Deletes the files and partition directories the manifest no longer lists
+    listed = {os.path.normpath(entry['path']) for partition in partitions.values() for entry in partition['files']}
+    for name in os.listdir(output_dir):
+        directory = os.path.join(output_dir, name)
+        if not (name.startswith(f"{PARTITION_COLUMN}=") and os.path.isdir(directory)):
+            continue
+        for file_name in os.listdir(directory):
+            if os.path.normpath(os.path.join(name, file_name)) not in listed:
+                os.remove(os.path.join(directory, file_name))
+        if not os.listdir(directory):
+            os.rmdir(directory)
+
+
+def _merge_partitions(output_dir, delta_dir, replaced_ids):
+    # Only the files that hold a replaced call are rewritten; the delta's files are added to their partitions.
+    # Every file is written under a new part number and the files of the old manifest are only deleted after
+    # the new manifest replaced it, so an interrupted merge leaves the previous dataset readable.
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    manifest = load_manifest(output_dir)
+    old_partitions = manifest['partitions']
+    delta_partitions = load_manifest(delta_dir)['partitions']
+    numbers = _next_part_numbers(output_dir, {**{key: {'files': []} for key in delta_partitions}, **old_partitions})
+    existing = [os.path.join(output_dir, entry['path'])
+                for partition in old_partitions.values() for entry in partition['files']]
+    # Delta tables are cast to the schema of the existing files, so every file has the same types
+    schema = pq.read_schema(existing[0]) if existing else None
+
+    def write(key, table):
+        path = _partition_file(key, numbers[key])
+        numbers[key] += 1
+        os.makedirs(os.path.join(output_dir, os.path.dirname(path)), exist_ok=True)
+        pq.write_table(table, os.path.join(output_dir, path), compression=PARQUET_COMPRESSION)
+        return {'path': path, **_table_stats(table)}
+
+    partitions = {}
+    replaced = pa.array(replaced_ids)
+    for key, partition in old_partitions.items():
+        files = []
+        for entry in partition['files']:
+            path = os.path.join(output_dir, entry['path'])
+            if len(replaced_ids):
+                call_ids = pq.read_table(path, columns=['call_id']).column('call_id')
+                if pc.any(pc.is_in(call_ids, value_set=replaced)).as_py():
+                    table = pq.read_table(path)
+                    table = table.filter(pc.invert(pc.is_in(table.column('call_id'), value_set=replaced)))
+                    if table.num_rows:
+                        files.append(write(key, table))
+                    continue
+            files.append(entry)
+        if files:
+            partitions[key] = {'files': files}
+
+    for key, partition in delta_partitions.items():
+        files = partitions.setdefault(key, {'files': []})['files']
+        for entry in partition['files']:
+            table = pq.read_table(os.path.join(delta_dir, entry['path']))
+            files.append(write(key, table if schema is None else table.cast(schema)))
+    _write_manifest(output_dir, partitions, manifest['columns'])
+    _remove_unlisted(output_dir, partitions)
+    remove_output(delta_dir)
+    logging.info(f"Merged {delta_dir} into {output_dir}.")
+
+
+def merge_into_output(output_file, delta_file, replaced_ids):
+    # Appends the rows of delta_file to output_file, first dropping the rows of calls listed in replaced_ids.
+    # The existing output is streamed record by record (CSV) or row group by row group (Parquet); a partitioned
+    # output only rewrites the files that hold replaced calls.
+    if is_partitioned(output_file):
+        _merge_partitions(output_file, delta_file, replaced_ids)
+        return
+    tmp_file = f"{output_file}.tmp"
+    if output_file.endswith('.parquet'):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        replaced = pa.array(replaced_ids)
+        existing = pq.ParquetFile(output_file)
+        with pq.ParquetWriter(tmp_file, existing.schema_arrow, compression=PARQUET_COMPRESSION) as writer:
+            for batch in existing.iter_batches(batch_size=OUTPUT_CHUNK_SIZE):
+                if len(replaced_ids):
+                    batch = batch.filter(pc.invert(pc.is_in(batch.column('call_id'), value_set=replaced)))
+                writer.write_batch(batch)
+            for batch in pq.ParquetFile(delta_file).iter_batches(batch_size=OUTPUT_CHUNK_SIZE):
+                writer.write_table(pa.Table.from_batches([batch]).cast(existing.schema_arrow))
+    elif len(replaced_ids) == 0:
+        _check_csv_header(output_file, delta_file)
+        with open(output_file, 'a', newline='') as output:
+            _copy_csv_rows(delta_file, output, skip_header=True)
+        os.remove(delta_file)
+        return
+    else:
+        # Kept rows are copied as raw text, never parsed and written again, so their values stay byte for byte
+        _check_csv_header(output_file, delta_file)
+        replaced = {int(call_id) for call_id in replaced_ids}
+        with open(output_file, newline='') as source, open(tmp_file, 'w', newline='') as output:
+            records = _csv_records(source)
+            header, text = next(records)
+            output.write(text)
+            call_id_position = header.index('call_id')
+            for fields, text in records:
+                if int(fields[call_id_position]) not in replaced:
+                    output.write(text)
+            _copy_csv_rows(delta_file, output, skip_header=True)
+
+    os.replace(tmp_file, output_file)
+    os.remove(delta_file)
+    logging.info(f"Merged {delta_file} into {output_file}.")
+
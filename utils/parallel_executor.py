@@ -0,0 +1,49 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Every worker gets a few chunks so a slow chunk does not leave the other cores idle
+CHUNKS_PER_WORKER = 4
+
+
+def _map_rows_chunk(func, *columns):
+    return [func(*values) for values in zip(*columns)]
+
+
+def _split_columns(columns, n_chunks):
+    bounds = np.linspace(0, len(columns[0]), n_chunks + 1, dtype=int)
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        if stop > start:
+            yield [list(column[start:stop]) for column in columns]
+
+
+def map_chunks(func, *columns, workers=1):
+    # Runs func over aligned slices of the given columns and returns the per-chunk results in input order
+    columns = [np.asarray(column, dtype=object) for column in columns]
+    if workers <= 1 or len(columns[0]) == 0:
+        return [func(*columns)]
+
+    n_chunks = min(len(columns[0]), workers * CHUNKS_PER_WORKER)
+    chunks = list(_split_columns(columns, n_chunks))
+    logging.info(f"Running '{func.__name__}' over {len(chunks)} chunks with {workers} worker processes...")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, *zip(*chunks)))
+
+
+class _RowMapper:
+    # Picklable stand-in for functools.partial(_map_rows_chunk, func) that keeps a readable __name__
+    def __init__(self, func):
+        self.func = func
+        self.__name__ = func.__name__
+
+    def __call__(self, *columns):
+        return _map_rows_chunk(self.func, *columns)
+
+
+def map_rows(func, *columns, workers=1):
+    # Applies func row by row (one argument per column) and returns a flat list in input order
+    results = []
+    for chunk_result in map_chunks(_RowMapper(func), *columns, workers=workers):
+        results.extend(chunk_result)
+    return results
@@ -1,4 +1,13 @@
+import numpy as np
 import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    STRING_DTYPE = 'string[pyarrow]'
+except ImportError:
+    STRING_DTYPE = object
+
+
 def categorize_reason(call_reason):
     if pd.isna(call_reason) or call_reason.strip() == "":
         return 'Miscellaneous Issue'
@@ -56,4 +65,73 @@ def categorize_reason(call_reason):
             if 'complain' in call_reason or 'complaint' in call_reason:
                 return 'Complaint'
             else:
-                return 'Miscellaneous Issue'
\ No newline at end of file
+                return 'Miscellaneous Issue'
+
+
+# The decision tree above as an ordered rule table: (label, accepted prefixes or None, keyword groups).
+# A rule fires when the reason starts with one of the prefixes and contains a keyword from every group;
+# the first rule that fires wins, like the if/elif chain.
+ABOUT_PREFIXES = ('about', 'regarding')
+TOPIC_RULES = [
+    ('Change Flight', [['change']]),
+    ('Missed Connecting Flight', [['delay', 'delayed'], ['connecting'], ['missed', 'miss']]),
+    ('Delayed Flight', [['delay', 'delayed']]),
+    ('Cancelled Flight', [['cancelled']]),
+    ('Baggage Mishandling', [['bag', 'baggage']]),
+    ('Complaint', [['complain', 'complaint']]),
+]
+REASON_RULES = [
+    ('Complaint', ('to complain',), []),
+    ('Get Details', ('to inquire',), []),
+    ('Get Details', ABOUT_PREFIXES, [['wanted to'], ['check']]),
+    ('Change Flight', ABOUT_PREFIXES, [['change']]),
+    ('Cancelled Flight', ABOUT_PREFIXES, [['cancelled']]),
+    ('Baggage Mishandling', ABOUT_PREFIXES, [['bag', 'baggage']]),
+    ('Complaint', ABOUT_PREFIXES, [['complain', 'not happy', 'complaint']]),
+    ('Get Details', ABOUT_PREFIXES, []),
+    # "because"/"cause" reasons and everything else share the same topic checks
+] + [(label, None, groups) for label, groups in TOPIC_RULES]
+DEFAULT_REASON_LABEL = 'Miscellaneous Issue'
+
+
+def _minimal_keywords(keywords):
+    # 'delayed' can only be present when 'delay' is, so it adds nothing to an any-of check
+    return [keyword for keyword in keywords
+            if not any(other != keyword and other in keyword for other in keywords)]
+
+
+def _rule_masks(normalized):
+    contains_cache = {}
+    for label, prefixes, keyword_groups in REASON_RULES:
+        condition = np.ones(len(normalized), dtype=bool)
+        if prefixes:
+            condition &= normalized.str.startswith(prefixes).to_numpy(dtype=bool)
+        for keywords in keyword_groups:
+            group_mask = np.zeros(len(normalized), dtype=bool)
+            for keyword in _minimal_keywords(keywords):
+                if keyword not in contains_cache:
+                    contains_cache[keyword] = normalized.str.contains(keyword, regex=False).to_numpy(dtype=bool)
+                group_mask |= contains_cache[keyword]
+            condition &= group_mask
+        yield label, condition
+
+
+def categorize_reasons(call_reasons):
+    # Vectorized categorize_reason over a whole column. Every distinct reason is labeled once and the
+    # labels are broadcast back through the factorized codes; NaN gets code -1.
+    call_reasons = pd.Series(call_reasons)
+    codes, uniques = pd.factorize(call_reasons)
+    if len(uniques) == 0:
+        return pd.Series(DEFAULT_REASON_LABEL, index=call_reasons.index, dtype=object)
+
+    # Arrow-backed strings keep the string masks in compiled code instead of a Python loop per row
+    normalized = pd.Series(uniques).astype(str).astype(STRING_DTYPE).str.lower().str.strip()
+
+    conditions = [(normalized == '').to_numpy(dtype=bool)]
+    labels = [DEFAULT_REASON_LABEL]
+    for label, condition in _rule_masks(normalized):
+        conditions.append(condition)
+        labels.append(label)
+
+    unique_labels = np.select(conditions, labels, default=DEFAULT_REASON_LABEL).astype(object)
+    return pd.Series(np.where(codes == -1, DEFAULT_REASON_LABEL, unique_labels[codes]), index=call_reasons.index)
@@ -0,0 +1,137 @@
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _cpu_seconds():
+    # CPU of this process plus its finished children, so stages run in the worker pool are counted too
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def peak_rss_mb():
+    # High-water mark of the resident set size since the process started
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class RunTelemetry:
+    # Wall time, CPU time, rows and memory of every pipeline stage. A stage that runs once per chunk is
+    # reported once, with the totals over all chunks.
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.started_at = datetime.now()
+        self.start_wall = time.perf_counter()
+        self.start_cpu = _cpu_seconds()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        # Yields a dict where the caller can set 'rows_out' (it defaults to rows_in) and other counts of the stage,
+        # which are summed over its calls like the rows
+        record = {'rows_out': rows_in}
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start_wall, start_cpu = time.perf_counter(), _cpu_seconds()
+        failed = False
+        try:
+            yield record
+        except Exception:
+            # A failing stage is still recorded, without output rows, so the report shows where the run broke
+            failed = True
+            raise
+        finally:
+            rows_out = None if failed else record.pop('rows_out')
+            record.pop('rows_out', None)
+            self._add(name, time.perf_counter() - start_wall, _cpu_seconds() - start_cpu, rows_in, rows_out, record,
+                      failed)
+
+    def measure_producer(self, name, frames):
+        # Passes frames through and times how long each one takes to produce, e.g. reading the next chunk
+        frames = iter(frames)
+        while True:
+            with self.stage(name) as record:
+                df = next(frames, None)
+                record['rows_out'] = None if df is None else len(df)
+            if df is None:
+                return
+            yield df
+
+    def measure_consumer(self, name, frames):
+        # Passes frames through and times what the consumer does with each one, e.g. writing it out
+        for df in frames:
+            with self.stage(name, len(df)):
+                yield df
+
+    def _add(self, name, wall, cpu, rows_in, rows_out, counts=None, failed=False):
+        stats = self.stages.setdefault(name, {
+            'stage': name, 'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'rows_in': None, 'rows_out': None
+        })
+        stats['calls'] += 1
+        if failed:
+            stats['failed'] = True
+        stats['wall_seconds'] += wall
+        stats['cpu_seconds'] += cpu
+        for key, count in (counts or {}).items():
+            stats[key] = stats.get(key, 0) + count
+        for key, rows in [('rows_in', rows_in), ('rows_out', rows_out)]:
+            if rows is not None:
+                stats[key] = (stats[key] or 0) + rows
+        # Loading stages have no input rows, their rate is based on the rows they produced
+        rate_rows = stats['rows_in'] if stats['rows_in'] is not None else stats['rows_out']
+        stats['rows_per_sec'] = rate_rows / stats['wall_seconds'] if rate_rows and stats['wall_seconds'] else None
+        stats['rss_mb'] = current_rss_mb()
+        stats['peak_rss_mb'] = peak_rss_mb()
+        if self.trace_memory:
+            traced_peak = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+            stats['traced_peak_mb'] = max(stats.get('traced_peak_mb', 0.0), traced_peak)
+
+        rate_rows = rows_in if rows_in is not None else rows_out
+        rows = f", {rate_rows} rows ({rate_rows / wall:,.0f} rows/s)" if rate_rows and wall else ""
+        if failed:
+            logging.error(f"Stage '{name}' failed after {wall:.2f}s wall, {cpu:.2f}s CPU.")
+        else:
+            logging.info(f"Stage '{name}' took {wall:.2f}s wall, {cpu:.2f}s CPU{rows}.")
+
+    def report(self, **extra):
+        return {
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'finished_at': datetime.now().isoformat(timespec='seconds'),
+            'total_wall_seconds': time.perf_counter() - self.start_wall,
+            'total_cpu_seconds': _cpu_seconds() - self.start_cpu,
+            'peak_rss_mb': peak_rss_mb(),
+            **extra,
+            'stages': list(self.stages.values()),
+        }
+
+    def write_report(self, report_file, **extra):
+        report = self.report(**extra)
+        os.makedirs(os.path.dirname(report_file) or '.', exist_ok=True)
+        tmp_file = f"{report_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+        os.replace(tmp_file, report_file)
+        logging.info(f"Run report written to {report_file} ({report['total_wall_seconds']:.2f}s total).")
+        return report
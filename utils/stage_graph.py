@@ -0,0 +1,117 @@
+import hashlib
+import inspect
+import logging
+import os
+import sys
+
+import pandas as pd
+
+CHECKPOINT_DIR = 'output/checkpoints'
+# Part of every checkpoint key, bumped when the way checkpoints are stored changes
+CHECKPOINT_VERSION = 1
+
+
+def _digest(*parts):
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part if isinstance(part, (bytes, memoryview)) else str(part).encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def column_digest(column):
+    # Hash of the values and type of a column, independent of its index and of how Arrow chunked it
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(column.to_frame(), preserve_index=False).combine_chunks()
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return _digest(memoryview(sink.getvalue()))
+
+
+def code_digest(function, modules=(), params=()):
+    # Hash of the stage function, the whole source of the modules it runs and its settings (e.g. which
+    # resolver), so editing a rule in one of those modules invalidates the checkpoints of that stage only
+    sources = [inspect.getsource(function)] + [inspect.getsource(sys.modules[module]) for module in modules]
+    return _digest(CHECKPOINT_VERSION, *sources, *params)
+
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return _digest(f.read())
+
+
+def files_identity(paths):
+    # Same idea as output_fingerprint: input files are identified by path, size and modification time
+    return _digest(*(f"{os.path.abspath(path)}:{os.stat(path).st_size}:{os.stat(path).st_mtime_ns}"
+                     for path in paths))
+
+
+class CheckpointStore:
+    # Frames produced by the pipeline stages, one Parquet file per stage and key under checkpoint_dir. The
+    # files a run read or wrote are the ones prune() keeps.
+    def __init__(self, checkpoint_dir=CHECKPOINT_DIR):
+        self.checkpoint_dir = checkpoint_dir
+        self.used = set()
+
+    def path(self, name, key):
+        return os.path.join(self.checkpoint_dir, name.replace(' ', '_').replace('/', '_'), f"{key}.parquet")
+
+    def load(self, name, key):
+        path = self.path(name, key)
+        if not os.path.exists(path):
+            return None
+        self.used.add(path)
+        # Parquet only records that a column holds strings; the pipeline's text columns are Arrow-backed
+        with pd.option_context('mode.string_storage', 'pyarrow'):
+            return pd.read_parquet(path)
+
+    def save(self, name, key, frame):
+        path = self.path(name, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        frame.to_parquet(f"{path}.tmp", index=False)
+        os.replace(f"{path}.tmp", path)
+        self.used.add(path)
+
+    def prune(self):
+        # Removes the checkpoints of earlier runs that this run did not use
+        removed = 0
+        for root, _, files in os.walk(self.checkpoint_dir):
+            for file_name in files:
+                path = os.path.join(root, file_name)
+                if path not in self.used:
+                    os.remove(path)
+                    removed += 1
+        if removed:
+            logging.info(f"Removed {removed} checkpoints of earlier runs from {self.checkpoint_dir}.")
+
+
+def run_stage(stage, df, context, telemetry, checkpoints=None):
+    # Runs one declared stage: stage['run'](df, context) returns the stage['outputs'] columns, which are put
+    # into df. With a CheckpointStore the columns are loaded instead when a checkpoint exists for the same input
+    # columns and the same code; context['digests'] keeps the hash of every column until a stage rewrites it.
+    name = stage['name']
+    with telemetry.stage(name, len(df)) as record:
+        columns, key = None, None
+        if checkpoints is not None:
+            digests = context.setdefault('digests', {})
+            for column in stage['inputs']:
+                if column not in digests:
+                    digests[column] = column_digest(df[column])
+            params = stage['params'](context['args']) if 'params' in stage else ()
+            code = code_digest(stage['run'], stage.get('modules', ()), params)
+            key = _digest(code, *(f"{column}={digests[column]}" for column in stage['inputs']))
+            columns = checkpoints.load(name, key)
+            record['checkpoint_hits'] = int(columns is not None)
+            if columns is not None:
+                logging.info(f"Stage '{name}' loaded from its checkpoint.")
+        if columns is None:
+            columns = stage['run'](df, context)
+            if checkpoints is not None:
+                checkpoints.save(name, key, columns[stage['outputs']])
+    columns = columns.set_axis(df.index)
+    for column in stage['outputs']:
+        df[column] = columns[column]
+        context.get('digests', {}).pop(column, None)
+    return df
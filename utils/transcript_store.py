@@ -0,0 +1,122 @@
+import logging
+import mmap
+import os
+
+import numpy as np
+import pandas as pd
+
+TRANSCRIPT_STORE_DIR = 'output/transcripts'
+BLOB_FILE = 'transcripts.bin'
+INDEX_FILE = 'index.parquet'
+# Columns that stay out of the processed dataset when the transcripts are stored here. agent_solutions is
+# derived from the transcript, so extract_info_columns can rebuild it when it is needed.
+STORED_TEXT_COLUMNS = ['call_transcript', 'agent_solutions']
+
+
+def store_paths(store_dir=TRANSCRIPT_STORE_DIR):
+    return os.path.join(store_dir, BLOB_FILE), os.path.join(store_dir, INDEX_FILE)
+
+
+def store_exists(store_dir=TRANSCRIPT_STORE_DIR):
+    return all(os.path.exists(path) for path in store_paths(store_dir))
+
+
+def _load_index(index_file):
+    import pyarrow.parquet as pq
+
+    return pq.read_table(index_file).to_pandas()
+
+
+class TranscriptWriter:
+    # Appends UTF-8 transcripts back to back to the blob file and records (call_id, offset, length) for each.
+    # The blob is only ever appended to; a call that is stored again gets a new entry and the index keeps the
+    # latest one. A fresh store (append=False) is written next to the old one and replaces it on close.
+    def __init__(self, store_dir=TRANSCRIPT_STORE_DIR, append=False):
+        self.store_dir = store_dir
+        self.blob_file, self.index_file = store_paths(store_dir)
+        self.append = append and store_exists(store_dir)
+        os.makedirs(store_dir, exist_ok=True)
+        self.previous = _load_index(self.index_file) if self.append else None
+        self.target_file = self.blob_file if self.append else f"{self.blob_file}.tmp"
+        self.blob = open(self.target_file, 'ab' if self.append else 'wb')
+        self.offset = self.blob.tell()
+        self.entries = []
+
+    def write(self, call_ids, transcripts):
+        encoded = [text.encode('utf-8') if isinstance(text, str) else None for text in transcripts]
+        lengths = np.array([-1 if data is None else len(data) for data in encoded], dtype=np.int64)
+        ends = self.offset + np.cumsum(np.maximum(lengths, 0))
+        self.blob.write(b''.join(data for data in encoded if data is not None))
+        self.entries.append(pd.DataFrame({
+            'call_id': np.asarray(call_ids, dtype=np.int64),
+            'offset': ends - np.maximum(lengths, 0),
+            'length': lengths,
+        }))
+        self.offset = int(ends[-1]) if len(ends) else self.offset
+
+    def close(self):
+        # The index is written last, so a run that stops half way leaves the previous store readable
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.blob.close()
+        index = pd.concat([frame for frame in [self.previous, *self.entries] if frame is not None], ignore_index=True)
+        if index.empty:
+            index = pd.DataFrame({column: np.zeros(0, dtype=np.int64) for column in ['call_id', 'offset', 'length']})
+        index = index.drop_duplicates('call_id', keep='last').sort_values('call_id', ignore_index=True)
+        pq.write_table(pa.Table.from_pandas(index, preserve_index=False), f"{self.index_file}.tmp")
+        if not self.append:
+            os.replace(self.target_file, self.blob_file)
+        os.replace(f"{self.index_file}.tmp", self.index_file)
+
+        stored = int(index['length'].clip(lower=0).sum())
+        logging.info(f"Transcript store {self.store_dir} holds {len(index)} calls "
+                     f"({stored / 1024 ** 2:.1f} MB referenced of {self.offset / 1024 ** 2:.1f} MB written).")
+
+
+class TranscriptStore:
+    # Read side of the store: the blob is memory-mapped and only the requested transcripts are decoded
+    def __init__(self, store_dir=TRANSCRIPT_STORE_DIR):
+        if not store_exists(store_dir):
+            raise FileNotFoundError(f"No transcript store found in {store_dir}. Run main.py --transcript-store first.")
+        blob_file, index_file = store_paths(store_dir)
+        index = _load_index(index_file)
+        self.positions = pd.Index(index['call_id'])
+        self.offsets = index['offset'].to_numpy()
+        self.lengths = index['length'].to_numpy()
+        self._file = open(blob_file, 'rb')
+        # mmap cannot map an empty file
+        self._blob = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(blob_file) else b''
+
+    def __len__(self):
+        return len(self.positions)
+
+    def read(self, call_ids):
+        # Transcripts of call_ids in the given order, None for calls that are not in the store
+        positions = self.positions.get_indexer(np.asarray(call_ids))
+        transcripts = np.full(len(positions), None, dtype=object)
+        blob = self._blob
+        for i, position in enumerate(positions):
+            if position != -1 and self.lengths[position] >= 0:
+                start = self.offsets[position]
+                transcripts[i] = blob[start:start + self.lengths[position]].decode('utf-8')
+        return transcripts
+
+    def get(self, call_id):
+        return self.read([call_id])[0]
+
+    def close(self):
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_transcripts(call_ids, store_dir=TRANSCRIPT_STORE_DIR):
+    with TranscriptStore(store_dir) as store:
+        return store.read(call_ids)
@@ -0,0 +1,177 @@
+import numpy as np
+import pandas as pd
+
+# Speaker flags of a turn. They are substring checks like in extract_info, so one line can carry both.
+AGENT = 1
+CUSTOMER = 2
+
+NO_CALL_REASON = "No specific call reason"
+NO_CUSTOMER_RESPONSE = "No customer response found"
+
+
+def build_turn_table(transcripts):
+    # Splits every transcript into its lines once. One row per line: the position of the call (row), the
+    # line number within the call (turn_index), its character offsets in the transcript (start, end), the
+    # speaker flags and the line text, all in Arrow/numpy columns.
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    values = pd.Series(transcripts, dtype=object).fillna('').to_numpy()
+    lines = pc.split_pattern(pa.array(values, type=pa.large_string()), pattern='\n')
+    counts = pc.list_value_length(lines).to_numpy()
+    text = lines.flatten()
+
+    first_turn = np.cumsum(counts) - counts
+    lengths = pc.utf8_length(text).to_numpy()
+    # Every line is followed by the '\n' it was split on, the offsets restart at 0 for every call
+    line_start = np.cumsum(lengths + 1) - lengths - 1
+    start = line_start - np.repeat(line_start[first_turn], counts)
+
+    speaker = np.where(pc.match_substring(text, 'Agent').to_numpy(zero_copy_only=False), AGENT, 0)
+    speaker |= np.where(pc.match_substring(text, 'Customer').to_numpy(zero_copy_only=False), CUSTOMER, 0)
+    return pa.table({
+        'row': np.repeat(np.arange(len(values), dtype=np.int64), counts),
+        'turn_index': np.arange(len(text)) - np.repeat(first_turn, counts),
+        'start': start,
+        'end': start + lengths,
+        'speaker': speaker.astype(np.uint8),
+        'text': text,
+    })
+
+
+def _after_last(text, separator):
+    # line.split(separator)[-1].strip() for lines that contain separator
+    import pyarrow.compute as pc
+
+    parts = pc.split_pattern(text, pattern=separator, max_splits=1, reverse=True)
+    return pc.utf8_trim_whitespace(pc.list_element(parts, 1))
+
+
+def _first_per_row(turn_rows):
+    # Mask of the first turn of every call among turns sorted by call
+    return np.r_[True, turn_rows[1:] != turn_rows[:-1]] if len(turn_rows) else np.zeros(0, dtype=bool)
+
+
+def _join_per_row(turn_rows, text, n_rows, separator):
+    # Joins the text of turns sorted by call into one string per call; calls without turns get ''
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    offsets = np.searchsorted(turn_rows, np.arange(n_rows + 1))
+    lists = pa.LargeListArray.from_arrays(pa.array(offsets, type=pa.int64()), text)
+    return pc.binary_join(lists, pa.scalar(separator, type=pa.large_string()))
+
+
+def _to_object(array):
+    return np.asarray(array.to_numpy(zero_copy_only=False), dtype=object)
+
+
+def _per_row(values, value_rows, n_rows):
+    # Spreads values that belong to the calls value_rows (at most one each) over all calls, null elsewhere
+    import pyarrow as pa
+
+    positions = np.full(n_rows, -1, dtype=np.int64)
+    positions[value_rows] = np.arange(len(value_rows))
+    return values.take(pa.array(positions, mask=positions < 0))
+
+
+def _to_text(array):
+    # Arrow strings as a pandas string column, without going through Python objects
+    return pd.arrays.ArrowStringArray(array)
+
+
+def transcript_info_columns(turns, n_rows):
+    # extract_info for every call at once, as {column: string array} in call order
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    text = turns.column('text').combine_chunks()
+    turn_rows = turns.column('row').to_numpy()
+    speaker = turns.column('speaker').to_numpy()
+    is_agent = (speaker & AGENT).astype(bool)
+    is_customer = (speaker & CUSTOMER).astype(bool)
+    separator = pa.scalar(" | ", type=pa.large_string())
+
+    # Call reason: only the first two captured fragments are kept. The first is the text after "I'm calling"
+    # on the first customer line that has it. The second is that whole line, unless the line also mentions
+    # the agent without an "about"/"regarding" reason; then it is the reason of the next "I'm calling" line.
+    calling = np.flatnonzero(is_customer & pc.match_substring(text, "I'm calling").to_numpy(zero_copy_only=False))
+    is_first = _first_per_row(turn_rows[calling])
+    is_second = np.r_[False, is_first[:-1] & ~is_first[1:]] if len(calling) else is_first
+    first, second = calling[is_first], calling[is_second]
+
+    reason = _after_last(text.take(pa.array(first)), "I'm calling")
+    about = pc.or_(pc.match_substring(reason, 'about'), pc.match_substring(reason, 'regarding')).to_numpy(zero_copy_only=False)
+    whole_line = about | ~is_agent[first]
+    line = pc.utf8_trim_whitespace(text.take(pa.array(first[whole_line])))
+    next_line = np.isin(turn_rows[second], turn_rows[first[~whole_line]])
+    next_reason = _after_last(text.take(pa.array(second[next_line])), "I'm calling")
+    second_part = pc.coalesce(_per_row(line, turn_rows[first[whole_line]], n_rows),
+                              _per_row(next_reason, turn_rows[second[next_line]], n_rows))
+    call_reason = pc.binary_join_element_wise(_per_row(reason, turn_rows[first], n_rows), second_part, separator)
+    call_reason = pc.coalesce(call_reason, _per_row(reason, turn_rows[first], n_rows),
+                              pa.scalar(NO_CALL_REASON, type=pa.large_string()))
+
+    # Agent solutions: every line mentioning the agent, numbered per call
+    agent_turns = np.flatnonzero(is_agent)
+    agent_rows = turn_rows[agent_turns]
+    first_agent_turns = np.flatnonzero(_first_per_row(agent_rows))
+    number = np.arange(len(agent_turns)) + 1 - np.repeat(first_agent_turns, np.diff(np.r_[first_agent_turns, len(agent_turns)]))
+    # One "Solution k: Let me " prefix per distinct k, picked for every agent line
+    labels = pa.array([f"Solution {k}: Let me " for k in range(number.max(initial=0) + 1)], type=pa.large_string())
+    solutions = pc.binary_join_element_wise(labels.take(pa.array(number)), text.take(pa.array(agent_turns)),
+                                            pa.scalar("", type=pa.large_string()))
+    agent_solutions = _join_per_row(agent_rows, solutions, n_rows, " | ")
+
+    # Customer accepted: the second to last customer line, or the only one
+    customer_turns = np.flatnonzero(is_customer)
+    customer_counts = np.bincount(turn_rows[customer_turns], minlength=n_rows)
+    last = np.cumsum(customer_counts) - 1
+    has_customer = customer_counts > 0
+    picked = np.where(customer_counts >= 2, last - 1, last)[has_customer]
+    accepted = pc.utf8_trim_whitespace(text.take(pa.array(customer_turns[picked])))
+    customer_accepted = pc.coalesce(_per_row(accepted, np.flatnonzero(has_customer), n_rows),
+                                    pa.scalar(NO_CUSTOMER_RESPONSE, type=pa.large_string()))
+
+    return {
+        "actual_call_reason": _to_text(call_reason),
+        "agent_solutions": _to_text(agent_solutions),
+        "customer_accepted": _to_text(customer_accepted),
+    }
+
+
+def get_details_concern_column(turns, n_rows):
+    # extract_get_details_concern for every call at once: the customer answers within three lines after each
+    # agent question, in the same order (and with the same repeats) as the line-by-line loop; None if there
+    # are none
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    text = turns.column('text').combine_chunks()
+    turn_rows = turns.column('row').to_numpy()
+    questions = np.flatnonzero(pc.match_substring_regex(text, r'Agent:.*\?').to_numpy(zero_copy_only=False))
+    answers = pc.match_substring(text, 'Customer:').to_numpy(zero_copy_only=False)
+
+    pairs = []
+    for distance in (1, 2, 3):
+        candidates = questions + distance
+        candidates = candidates[candidates < len(text)]
+        keep = (turn_rows[candidates] == turn_rows[candidates - distance]) & answers[candidates]
+        pairs.append(np.stack([candidates[keep] - distance, np.full(keep.sum(), distance), candidates[keep]]))
+    question, distance, answer = np.concatenate(pairs, axis=1)
+    order = np.lexsort((distance, question))
+    answer = answer[order]
+
+    answer_rows = turn_rows[answer]
+    dialogues = _to_object(_join_per_row(answer_rows, _after_last(text.take(pa.array(answer)), "Customer:"), n_rows, ' '))
+    dialogues[np.bincount(answer_rows, minlength=n_rows) == 0] = None
+    return dialogues
+
+
+def extract_info_columns(transcripts):
+    # Drop-in for map_rows(extract_info, ...) that parses the transcripts once; chunk-friendly for map_chunks
+    return transcript_info_columns(build_turn_table(transcripts), len(transcripts))
+
+
+def extract_get_details_concerns(transcripts):
+    return get_details_concern_column(build_turn_table(transcripts), len(transcripts))